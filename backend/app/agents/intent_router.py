@@ -0,0 +1,273 @@
+import json
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+# (intent, [(compiled pattern, weight)]). A primary verb alone reaches ROUTER_MIN_SCORE;
+# supporting nouns only add to it. Every pattern is word-bounded, so "check", "show me",
+# "ok" inside "book" or "it" inside "with" no longer launch tools on their own.
+_INTENT_FEATURES = [
+    ("search", [
+        (re.compile(r"\b(?:find|search(?:\s+for)?|locate|look(?:ing)?\s+for|track\s+down)\b|\bwhere(?:'s|\s+is|\s+are)\b", re.I), 4.0),
+        (re.compile(r"\bcheck\s+(?:if|whether)\b[^.?!]*\b(?:exists?|there)\b", re.I), 3.0),
+        (re.compile(r"\b(?:files?|folders?|documents?|pdfs?|spreadsheets?|excel)\b", re.I), 1.0),
+    ]),
+    ("list", [
+        (re.compile(r"\blist\b|\bwhat(?:'s|\s+is)\s+in\b|\bcontents?\s+of\b", re.I), 4.0),
+        (re.compile(r"\bshow\s+(?:me\s+)?(?:the\s+|my\s+)?(?:folder|directory|contents|files\s+in)\b", re.I), 4.0),
+        (re.compile(r"\b(?:folder|directory|drive)\b", re.I), 1.0),
+    ]),
+    ("organize", [
+        (re.compile(r"\b(?:organi[sz]e|tidy(?:\s+up)?|clean\s+up|declutter|arrange)\b|\bsort\b(?!\s+of\b)", re.I), 4.0),
+        (re.compile(r"\bgroup(?:ing)?\b[^.?!]{0,30}\bby\s+(?:type|date|extension)\b", re.I), 2.0),
+    ]),
+    ("confirm", [
+        (re.compile(r"^\s*(?:yes|yeah|yep|ok(?:ay)?|sure|proceed|go\s+ahead|do\s+it|confirm(?:ed)?)\b", re.I), 4.0),
+        (re.compile(r"\b(?:go\s+ahead|proceed|do\s+it|confirm(?:ed)?)\b", re.I), 2.0),
+    ]),
+    ("read", [
+        (re.compile(r"\b(?:read|open|analy[sz]e|extract|summari[sz]e)\b", re.I), 4.0),
+        (re.compile(r"\b(?:quote|quotation|invoice|report|pdf|document|file)\b", re.I), 1.0),
+    ]),
+    ("memory", [
+        (re.compile(r"\b(?:history|previous(?:ly)?|last\s+time|remember|in\s+the\s+past)\b|\bpast\s+(?:quotes?|orders?|prices?|purchases?)\b", re.I), 4.0),
+    ]),
+    ("move", [
+        (re.compile(r"\b(?:move|copy|transfer)\b", re.I), 4.0),
+    ]),
+]
+
+# Slots, all taken in the same pass over the message
+_EXPLICIT_PATH = re.compile(r"[a-zA-Z]:\\[^\s\"'`]+|(?:/host_\w+|/workspace)(?:/[^\s\"'`]*)?")
+_KNOWN_FOLDER = re.compile(r"\b(desktop|downloads|documents)\b", re.I)
+_WORKSPACE_FOLDER = re.compile(r"\b(rfq|inbox|orders|workspace)\b", re.I)
+_DRIVE = re.compile(r"\b([a-z]):(?=[\\/\s]|$)|\b([a-z])\s+drive\b", re.I)
+_REFERENTIAL = re.compile(r"\b(?:it|this|that|there|the\s+(?:folder|directory|file))\b", re.I)
+_WORD = re.compile(r"[a-z0-9']+")
+
+_STOP_WORDS = frozenset("""
+    find search look for check the my a an in on desktop downloads documents folder file files please can you
+    show me read open analyze extract summarize where is are locate get with from about quotes quotations
+    jan feb mar apr may jun jul aug sep oct nov dec 2023 2024 2025 2026 it this that
+""".split())
+
+# Seed utterances for the fallback model; it also learns from rule-routed and user-labelled messages
+_EXAMPLES = {
+    "search": ["get me the acme quotation pdf", "i need the invoice from last week", "any excel sheet about steel prices",
+               "hunt for the signed contract", "which drive has the vendor list"],
+    "list": ["what do i have in the projects directory", "give me a listing of that drive", "which files are under rfq",
+             "browse my work directory"],
+    "organize": ["put these files into folders by type", "my downloads are a mess", "group everything by extension",
+                 "make this directory neat"],
+    "read": ["what does the acme quote say", "go through the invoice and tell me the total", "give me the gist of that report",
+             "pull the prices out of this document"],
+    "memory": ["what did acme charge us before", "have we bought bearings earlier", "what was our last price for cement"],
+    "move": ["shift the quote to the orders folder", "put a duplicate of this file on the desktop"],
+    "chat": ["hello", "thanks a lot", "draft a polite follow up email to the vendor", "how do i negotiate a better price",
+             "write a reminder about delivery dates", "explain incoterms", "good morning", "who are you"],
+}
+
+# What a message can be labelled as: every tool intent except the context-only "confirm", or plain chat
+LABELS = tuple(intent for intent, _ in _INTENT_FEATURES if intent != "confirm") + ("chat",)
+
+
+def _tokens(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class _NaiveBayes:
+    """Multinomial naive Bayes over word unigrams and bigrams: microseconds per message, no dependencies."""
+
+    def __init__(self):
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+        self.totals: Counter = Counter()
+        self.docs: Counter = Counter()
+        self.vocab = set()
+
+    def add(self, intent: str, text: str):
+        tokens = _tokens(text)
+        self.counts[intent].update(tokens)
+        self.totals[intent] += len(tokens)
+        self.docs[intent] += 1
+        self.vocab.update(tokens)
+
+    def predict(self, text: str) -> Dict[str, float]:
+        tokens = [t for t in _tokens(text) if t in self.vocab]
+        if not tokens or not self.docs:
+            return {}
+        n_docs, v = sum(self.docs.values()), len(self.vocab)
+        logp = {
+            intent: math.log(self.docs[intent] / n_docs)
+            + sum(math.log((self.counts[intent][t] + 1) / (self.totals[intent] + v)) for t in tokens)
+            for intent in self.docs
+        }
+        top = max(logp.values())
+        exp = {k: math.exp(val - top) for k, val in logp.items()}
+        norm = sum(exp.values())
+        return {k: e / norm for k, e in exp.items()}
+
+
+class IntentRouter:
+    """
+    Decides which /chat tools a message needs. Weighted, word-bounded patterns score every
+    intent in one pass and the slots (search terms, path, search root, referential "it")
+    are taken in the same pass. Intents scoring at least ROUTER_MIN_SCORE, and at least half
+    of the best score, win. When no rule is conclusive, a small naive Bayes model over
+    example, rule-routed and user-labelled messages decides if it is confident enough.
+    Every decision is written to routing_log for tuning; label() records the right intent.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS routing_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    query TEXT,
+                    intents TEXT,
+                    scores TEXT,
+                    slots TEXT,
+                    source TEXT,
+                    duration_us INTEGER,
+                    created_at REAL
+                )
+            """)
+            self.conn.commit()
+        memory_manager._add_columns("routing_log", {"label": "TEXT"})
+        self.model = _NaiveBayes()
+        for intent, examples in _EXAMPLES.items():
+            for example in examples:
+                self.model.add(intent, example)
+        # Training data is independent of the model's own guesses, so its misroutes never
+        # reinforce themselves: user labels, and single-intent rule routes. Unclaimed messages
+        # ('none') are left out, since most of them went through the model first.
+        rows = self.conn.execute(
+            "SELECT query, intents, label FROM routing_log WHERE label IS NOT NULL OR source = 'rules' ORDER BY id DESC LIMIT 2000"
+        ).fetchall()
+        for query, intents, label in rows:
+            intents = json.loads(intents or "[]")
+            if label:
+                self.model.add(label, query)
+            elif len(intents) == 1 and intents[0] != "confirm":
+                self.model.add(intents[0], query)
+
+    # ─── Slots ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def slots(text: str) -> Dict[str, Any]:
+        """Search terms, path reference, search root and whether the message refers back ("it", "that folder")."""
+        path = None
+        explicit = _EXPLICIT_PATH.search(text)
+        folder = _KNOWN_FOLDER.search(text)
+        workspace = _WORKSPACE_FOLDER.search(text)
+        drive = _DRIVE.search(text)
+        if explicit:
+            path = explicit.group().rstrip(".,;:)")
+        elif folder:
+            path = folder.group(1).lower()
+        elif workspace:
+            path = workspace.group(1).lower()
+        elif drive:
+            path = f"{(drive.group(1) or drive.group(2)).upper()}:\\"
+        root = folder.group(1).lower() if folder else (f"{(drive.group(1) or drive.group(2)).upper()}:\\" if drive else None)
+        words = [w for w in text.lower().split() if w not in _STOP_WORDS and len(w) > 2 and not _EXPLICIT_PATH.match(w)]
+        return {
+            "terms": " ".join(words[:3]),
+            "path": path,
+            "root": root,
+            "referential": bool(_REFERENTIAL.search(text)),
+        }
+
+    # ─── Routing ────────────────────────────────────────────────────────
+
+    def route(self, query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        context = context or {}
+        scores = {}
+        for intent, features in _INTENT_FEATURES:
+            score = 0.0
+            for pattern, weight in features:
+                if pattern.search(query):
+                    score += weight
+            scores[intent] = score
+        # A bare "yes" only means something right after an organize preview
+        if not context.get("pending_organize_plan"):
+            scores["confirm"] = 0.0
+        slots = self.slots(query)
+
+        top = max(scores.values())
+        intents = [i for i, s in sorted(scores.items(), key=lambda kv: -kv[1])
+                   if s >= settings.ROUTER_MIN_SCORE and s >= top / 2]
+        source = "rules" if intents else "none"
+        probability = None
+        if not intents and len(query.split()) >= 3:
+            predicted = self.model.predict(query)
+            if predicted:
+                best = max(predicted, key=predicted.get)
+                probability = round(predicted[best], 3)
+                if best != "chat" and probability >= settings.ROUTER_FALLBACK_MIN_PROB:
+                    intents, source = [best], "model"
+
+        route = {"intents": intents, "scores": {k: v for k, v in scores.items() if v}, "slots": slots,
+                 "source": source, "model_probability": probability,
+                 "duration_us": int((time.perf_counter() - start) * 1e6)}
+        route["log_id"] = self._log(query, route)
+        return route
+
+    def _log(self, query: str, route: Dict[str, Any]) -> Optional[int]:
+        logger.info(f"Routed {query[:80]!r} -> {route['intents'] or ['chat']} via {route['source']} "
+                    f"(scores {route['scores']}, {route['duration_us']}us)")
+        if not settings.ROUTER_LOG:
+            return None
+        try:
+            with self._lock:
+                cursor = self.conn.execute(
+                    "INSERT INTO routing_log (query, intents, scores, slots, source, duration_us, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (query[:500], json.dumps(route["intents"]), json.dumps(route["scores"]), json.dumps(route["slots"]),
+                     route["source"], route["duration_us"], time.time()),
+                )
+                self.conn.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Routing log error: {e}")
+            return None
+
+    def label(self, log_id: int, intent: str) -> bool:
+        """Record the intent a logged message should have had (confirming or correcting it) and learn from it."""
+        if intent not in LABELS:
+            raise ValueError(f"Unknown intent {intent!r}; expected one of {', '.join(LABELS)}")
+        with self._lock:
+            row = self.conn.execute("SELECT query FROM routing_log WHERE id = ?", (log_id,)).fetchone()
+            if not row:
+                return False
+            self.conn.execute("UPDATE routing_log SET label = ? WHERE id = ?", (intent, log_id))
+            self.conn.commit()
+            self.model.add(intent, row[0])
+        return True
+
+    def recent(self, limit: int = 100, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        if source:
+            rows = self.conn.execute("SELECT * FROM routing_log WHERE source = ? ORDER BY id DESC LIMIT ?", (source, limit))
+        else:
+            rows = self.conn.execute("SELECT * FROM routing_log ORDER BY id DESC LIMIT ?", (limit,))
+        keys = ("id", "query", "intents", "scores", "slots", "source", "duration_us", "created_at", "label")
+        out = []
+        for row in rows.fetchall():
+            entry = dict(zip(keys, row))
+            for key in ("intents", "scores", "slots"):
+                entry[key] = json.loads(entry[key] or "null")
+            out.append(entry)
+        return out
+
+intent_router = LazySingleton("intent_router", IntentRouter)
@@ -1,7 +1,13 @@
 from app.tools.file_processor import file_processor
-from app.core.llm import llm_engine
+from app.core.llm import llm_engine, LLMError
 from app.core.memory import memory_manager
+from app.core.price_index import price_index
+from app.core.fingerprints import fingerprint_index
+from app.core.dedupe import dedupe_index
+from app.core.events import event_bus
 from app.tools.comparison_engine import comparison_engine
+from app.tools.quote_extractor import quote_extractor
+from app.core.config import settings
 import os
 import json
 import logging
@@ -13,6 +19,8 @@ class ProcurementAgent:
 
     QUOTE_SCHEMA = json.dumps({
         "vendor_name": "string",
+        "vendor_email": "string (vendor's e-mail address) or null",
+        "quote_reference": "string (vendor's quotation/offer number) or null",
         "material": "string or null",
         "qty": "number or null",
         "unit_price": "number or null",
@@ -22,7 +30,14 @@ class ProcurementAgent:
         "payment_terms": "string or null",
         "date": "string (YYYY-MM-DD) or null",
         "deviations": "string or null",
-        "validity": "string or null"
+        "validity": "string or null",
+        "items": [{
+            "material": "string",
+            "qty": "number or null",
+            "unit": "string or null",
+            "unit_price": "number or null",
+            "total": "number or null"
+        }]
     }, indent=2)
 
     async def process_new_document(self, file_path: str) -> dict:
@@ -37,86 +52,241 @@ class ProcurementAgent:
         
         if not raw_content or len(raw_content.strip()) < 10:
             return {"type": "Error", "summary": "File appears to be empty or unreadable."}
+        event_bus.publish("ingest", file=os.path.basename(file_path), stage="read", chars=len(raw_content))
+
+        # Near-duplicates of a known document (same quote resent as scan, print, ...) are linked, not reprocessed
+        doc_id = None
+        try:
+            seen = dedupe_index.check_and_register(raw_content, file_path)
+            doc_id = seen["doc_id"]
+            if seen["duplicate"]:
+                original = seen["duplicate"]
+                logger.info(f"{os.path.basename(file_path)} duplicates {original['file_path']} (similarity {original['similarity']})")
+                event_bus.publish("ingest", file=os.path.basename(file_path), stage="duplicate",
+                                  duplicate_of=os.path.basename(original['file_path'] or ''))
+                return {
+                    "type": "Duplicate",
+                    "summary": f"This document is a copy of **{os.path.basename(original['file_path'] or '')}**, which was already processed. Skipped re-analysis.",
+                    "duplicate_of": original,
+                    "data": memory_manager.get_quote(original["quote_id"]) if original.get("quote_id") else {},
+                }
+        except Exception as e:
+            logger.error(f"Duplicate check error: {e}")
         
-        # 2. Detect document type
-        doc_type = file_processor.detect_document_type(raw_content)
-        logger.info(f"Detected type: {doc_type} for {os.path.basename(file_path)}")
+        # 2. Detect document type (local classifier; LLM only when it is unsure)
+        doc_type, confidence = file_processor.classify_document(raw_content)
+        ruled = None
+        if os.path.splitext(file_path)[1].lower() in TABLE_FORMATS:
+            # A recognised priced line-item table both identifies a quotation and extracts it
+            ruled = quote_extractor.extract(file_path, raw_content)
+            if ruled and ruled["_confidence"] >= settings.RULE_EXTRACT_MIN_CONFIDENCE and doc_type in ("Quotation", "Unknown"):
+                doc_type, confidence = "Quotation", max(confidence, ruled["_confidence"])
+        if confidence < settings.CLASSIFIER_MIN_CONFIDENCE:
+            doc_type = self._llm_classify(raw_content, doc_type)
+        logger.info(f"Detected type: {doc_type} (confidence {confidence}) for {os.path.basename(file_path)}")
+        event_bus.publish("ingest", file=os.path.basename(file_path), stage="classified", doc_type=doc_type, confidence=confidence)
         
         # 3. Process based on type
-        if doc_type == "Quotation":
-            return await self._process_quotation(file_path, raw_content)
-        elif doc_type == "Purchase Order":
-            return await self._process_po(file_path, raw_content)
-        elif doc_type == "Invoice":
-            return await self._process_invoice(file_path, raw_content)
-        else:
-            return await self._process_general(file_path, raw_content, doc_type)
+        try:
+            if doc_type == "Quotation":
+                return await self._process_quotation(file_path, raw_content, doc_id, ruled)
+            elif doc_type == "Purchase Order":
+                return await self._process_po(file_path, raw_content)
+            elif doc_type == "Invoice":
+                return await self._process_invoice(file_path, raw_content)
+            else:
+                return await self._process_general(file_path, raw_content, doc_type)
+        except Exception:
+            # Processing did not complete (e.g. provider unavailable): drop the registration so the
+            # job's retry is not seen as a duplicate, and let the job queue decide on the retry
+            if doc_id:
+                dedupe_index.forget(doc_id)
+            raise
+
+    DOC_TYPES = ["Quotation", "RFQ", "Purchase Order", "Invoice", "Unknown"]
 
-    async def _process_quotation(self, file_path: str, raw_content: str) -> dict:
+    def _llm_classify(self, raw_content: str, fallback: str) -> str:
+        """Ask the LLM to pick the document type from the document head; keep `fallback` on any doubt."""
+        answer = llm_engine.chat([{"role": "user", "content": (
+            f"Classify this business document as exactly one of: {', '.join(self.DOC_TYPES)}. "
+            f"A request for quotation sent to vendors is 'RFQ'; a vendor's priced offer is 'Quotation'. "
+            f"Reply with the type only.\n\n{raw_content[:file_processor.CLASSIFY_PREFIX_CHARS]}"
+        )}])
+        answer = (answer or "").strip().strip(".'\"")
+        for doc_type in self.DOC_TYPES:
+            if answer.lower() == doc_type.lower():
+                return doc_type
+        return fallback
+
+    async def _process_quotation(self, file_path: str, raw_content: str, doc_id: int = None, ruled: dict = None) -> dict:
         """Full pipeline for quotation processing."""
-        # Extract structured data
-        structured = llm_engine.extract_structured_data(raw_content, self.QUOTE_SCHEMA)
-        
-        if "error" in structured:
-            return {"type": "Quotation", "summary": f"Extraction issue: {structured.get('error')}", "data": {}}
+        # Extract structured data: locally from a recognised table layout, else with the LLM
+        use_llm = not (ruled and ruled["_confidence"] >= settings.RULE_EXTRACT_MIN_CONFIDENCE)
+        if use_llm:
+            structured = llm_engine.extract_structured_data(raw_content, self.QUOTE_SCHEMA)
+            if "error" in structured:
+                return {"type": "Quotation", "summary": f"Extraction issue: {structured.get('error')}", "data": {}}
+            if os.path.splitext(file_path)[1].lower() in TABLE_FORMATS:
+                try:
+                    quote_extractor.learn(file_path, structured)
+                except Exception as e:
+                    logger.error(f"Template learning error: {e}")
+            structured['extracted_by'] = "llm"
+        else:
+            structured = {k: v for k, v in ruled.items() if not k.startswith("_")}
+            structured['extracted_by'] = "rules"
+            quote_extractor.mark_used(ruled["vendor_name"], ruled["_signature"])
+            logger.info(f"Extracted {os.path.basename(file_path)} from its table layout (confidence {ruled['_confidence']})")
         
         structured['file_path'] = file_path
+        event_bus.publish("ingest", file=os.path.basename(file_path), stage="extracted", vendor=structured.get('vendor_name'),
+                          items=len(structured.get('items') or []), extracted_by=structured['extracted_by'])
+
+        # Multi-item quotes: keep the headline fields populated from the first line item
+        items = structured.get('items') or []
+        if items and isinstance(items[0], dict):
+            for key in ('material', 'qty', 'unit_price'):
+                if structured.get(key) is None:
+                    structured[key] = items[0].get(key)
         
-        # Check memory for vendor history
         vendor = structured.get('vendor_name', 'Unknown')
         material = structured.get('material', 'Unknown')
-        
-        history = []
+
+        # Exact price position against this material's history (before this quote is added)
+        priced_items = [i for i in items if isinstance(i, dict)] or [structured]
+        price_flags = []
         try:
-            history = memory_manager.search_history(f"quotes from {vendor} for {material}")
-        except:
-            pass
+            price_flags = price_index.assess_items(priced_items, structured.get('currency'))
+            structured['price_flags'] = price_flags
+        except Exception as e:
+            logger.error(f"Price index error: {e}")
         
+        # Find the revision this quote supersedes (index lookup, before storing)
+        previous, revision_summary = None, None
+        fp = fingerprint_index.fingerprint(structured, raw_content)
+        try:
+            match = fingerprint_index.find_previous(fp)
+            previous = memory_manager.get_quote(match["quote_id"]) if match else None
+        except Exception as e:
+            logger.error(f"Fingerprint lookup error: {e}")
+        if previous:
+            structured['revision_of'] = previous['id']
+            revision_summary = comparison_engine.detect_revisions(previous, structured, use_llm=use_llm)
+
         # Store in memory
         try:
-            memory_manager.store_quote(structured)
+            quote_id = memory_manager.store_quote(structured)
+            price_index.record_items(priced_items, structured.get('currency'), structured.get('date'))
+            fingerprint_index.add(quote_id, fp)
+            if doc_id:
+                dedupe_index.link_quote(doc_id, quote_id)
         except Exception as e:
             logger.error(f"Memory store error: {e}")
         
+        if not use_llm:
+            # Rule-extracted quotes stay free of API calls end to end
+            return {
+                "type": "Quotation",
+                "data": structured,
+                "summary": _local_quote_summary(structured, price_flags, previous, revision_summary),
+                "revision": {"previous_quote_id": previous['id'], "changes": revision_summary} if previous else None,
+                "needs_approval": False
+            }
+
         # Generate intelligent summary
         summary_prompt = f"""Summarize this procurement quotation in 3-4 bullet points:
 
 **Vendor:** {vendor}
 **Material:** {material}
+**Line Items:** {len(items) or 1}
 **Total:** {structured.get('currency', '')} {structured.get('total', 'N/A')}
 **Delivery:** {structured.get('delivery_weeks', 'N/A')} weeks
 **Payment Terms:** {structured.get('payment_terms', 'N/A')}
 **Validity:** {structured.get('validity', 'N/A')}
 
-Historical context: {json.dumps(history[:2]) if history else 'No prior quotes on record.'}
+Price check vs. history (percentile 0-100 among past quotes for the material, z-score vs. the last 12 months, in {price_flags[0].get('base_currency', '') if price_flags else ''}):
+{_format_price_flags(price_flags)}
 
+{f"This is a revision of quote #{previous['id']}. Changes: {revision_summary}" if previous else ""}
 End with a recommendation (accept / negotiate / compare with alternatives).
 """
-        summary = llm_engine.chat([{"role": "user", "content": summary_prompt}])
+        try:
+            summary = llm_engine.complete([{"role": "user", "content": summary_prompt}])
+        except LLMError as e:
+            # The quote is already stored; fall back to the extracted facts
+            logger.warning(f"Quote summary unavailable: {e}")
+            summary = _local_quote_summary(structured, price_flags, previous, revision_summary) + "\n\n_AI summary unavailable right now._"
         
         return {
             "type": "Quotation",
             "data": structured,
             "summary": summary,
+            "revision": {"previous_quote_id": previous['id'], "changes": revision_summary} if previous else None,
             "needs_approval": False
         }
 
     async def _process_po(self, file_path: str, raw_content: str) -> dict:
-        summary = llm_engine.chat([
-            {"role": "user", "content": f"Summarize this Purchase Order in clean bullet points. Highlight: PO number, vendor, items ordered, total value, delivery date.\n\n{raw_content[:3000]}"}
-        ])
+        summary = _summarize_or_excerpt(
+            raw_content,
+            "Summarize this Purchase Order in clean bullet points. Highlight: PO number, vendor, items ordered, total value, delivery date.",
+            "Purchase Order",
+        )
         return {"type": "Purchase Order", "summary": summary, "data": {}}
 
     async def _process_invoice(self, file_path: str, raw_content: str) -> dict:
-        summary = llm_engine.chat([
-            {"role": "user", "content": f"Summarize this Invoice. Highlight: invoice number, vendor, amount, due date, payment status.\n\n{raw_content[:3000]}"}
-        ])
+        summary = _summarize_or_excerpt(
+            raw_content,
+            "Summarize this Invoice. Highlight: invoice number, vendor, amount, due date, payment status.",
+            "Invoice",
+        )
         return {"type": "Invoice", "summary": summary, "data": {}}
 
     async def _process_general(self, file_path: str, raw_content: str, doc_type: str) -> dict:
-        summary = llm_engine.chat([
-            {"role": "user", "content": f"This is a '{doc_type}' document. Provide a concise summary of its contents:\n\n{raw_content[:3000]}"}
-        ])
+        summary = _summarize_or_excerpt(
+            raw_content,
+            f"This is a '{doc_type}' document. Provide a concise summary of its contents:",
+            doc_type,
+        )
         return {"type": doc_type, "summary": summary, "data": {}}
 
+TABLE_FORMATS = (".docx", ".xlsx")
+
+EXCERPT_LINES = 15
+EXCERPT_CHARS = 1200
+
+def _summarize_or_excerpt(raw_content: str, instruction: str, doc_type: str) -> str:
+    """LLM summary, or the document's opening lines when the provider is unavailable."""
+    try:
+        return llm_engine.summarize(raw_content, instruction)
+    except LLMError as e:
+        logger.warning(f"{doc_type} summary unavailable: {e}")
+        lines = [line.strip() for line in raw_content.splitlines() if line.strip()][:EXCERPT_LINES]
+        excerpt = "\n".join(lines)[:EXCERPT_CHARS]
+        return f"**{doc_type}** — opening lines:\n\n```\n{excerpt}\n```\n\n_AI summary unavailable right now._"
+
+def _local_quote_summary(structured: dict, price_flags: list, previous: dict, revision_summary: str) -> str:
+    lines = [
+        f"- **Vendor:** {structured.get('vendor_name') or 'Unknown'}",
+        f"- **Material:** {structured.get('material') or 'Unknown'} ({len(structured.get('items') or []) or 1} line items)",
+        f"- **Total:** {structured.get('currency') or ''} {structured.get('total') if structured.get('total') is not None else 'N/A'}",
+    ]
+    if structured.get('delivery_weeks') is not None:
+        lines.append(f"- **Delivery:** {structured['delivery_weeks']} weeks")
+    if structured.get('payment_terms'):
+        lines.append(f"- **Payment Terms:** {structured['payment_terms']}")
+    text = "\n".join(lines) + f"\n\n**Price check vs. history:**\n{_format_price_flags(price_flags)}"
+    if previous:
+        text += f"\n\n**Revision of quote #{previous['id']}:**\n{revision_summary}"
+    return text
+
+def _format_price_flags(flags: list) -> str:
+    lines = []
+    for f in flags[:15]:
+        if f.get('flag') in ('unknown', 'insufficient_history'):
+            lines.append(f"- {f.get('material')}: {f['flag'].replace('_', ' ')} ({f.get('history_count', 0)} prior prices)")
+        else:
+            lines.append(f"- {f['material']}: {f['flag'].upper()} — percentile {f['percentile']}, z-score {f['zscore']}, "
+                         f"median {f['median_base']}, this quote {f['unit_price_base']}")
+    return "\n".join(lines) or "- No prior quotes on record."
+
 procurement_agent = ProcurementAgent()
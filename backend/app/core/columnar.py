@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
+from app.core.memory import memory_manager
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+pa_ipc = lazy_import("pyarrow.ipc")
+pc = lazy_import("pyarrow.compute")
+
+logger = logging.getLogger(__name__)
+
+# Exported / snapshotted tables and their column types. raw_json stays in SQLite:
+# it is large, and the snapshot is for analytics over the typed columns.
+TABLE_COLUMNS = {
+    "quotes": [
+        ("id", "int64"), ("vendor_name", "string"), ("material", "string"), ("unit_price", "float64"),
+        ("qty", "float64"), ("total", "float64"), ("currency", "string"), ("delivery_weeks", "float64"),
+        ("payment_terms", "string"), ("date", "string"), ("file_path", "string"),
+    ],
+    "quote_items": [
+        ("id", "int64"), ("quote_id", "int64"), ("line_no", "int64"), ("vendor_name", "string"),
+        ("material", "string"), ("qty", "float64"), ("unit", "string"), ("unit_price", "float64"),
+        ("total", "float64"), ("currency", "string"), ("date", "string"),
+    ],
+}
+
+
+def _schema(table: str):
+    return pa.schema([(name, getattr(pa, kind)()) for name, kind in TABLE_COLUMNS[table]])
+
+
+def _coerce(value, kind: str):
+    # SQLite is loosely typed: LLM-extracted numbers sometimes arrive as text
+    if value is None:
+        return None
+    if kind == "string":
+        return str(value)
+    try:
+        return int(value) if kind == "int64" else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ColumnarStore:
+    """
+    Arrow views of the quote history.
+    - Streaming export: rows are read with fetchmany and written one Parquet row group
+      (or Arrow IPC batch) at a time, so memory stays bounded by EXPORT_BATCH_ROWS.
+    - Snapshot: uncompressed Arrow IPC files under MEMORY_DIR/snapshots, written as a new
+      version (`<table>-<ns>.arrow`) when the table has changed; readers memory-map the
+      newest one. Files are never replaced in place: Windows refuses to replace or delete
+      a file another process has mapped, so old versions are removed once unmapped.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = threading.Lock()
+        self.snapshot_dir = os.path.join(settings.MEMORY_DIR, "snapshots")
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._versions: Dict[str, tuple] = {}
+        for table in TABLE_COLUMNS:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, f"{table}.arrow"))  # unversioned snapshot of older builds
+            except OSError:
+                pass
+
+    # ─── Streaming ──────────────────────────────────────────────────────
+
+    def batches(self, table: str, batch_rows: Optional[int] = None) -> Iterator[Any]:
+        """RecordBatches of `table` in id order, batch_rows rows at a time."""
+        columns = TABLE_COLUMNS[table]
+        schema = _schema(table)
+        # A separate cursor keeps the shared connection usable while we stream
+        cursor = self.conn.execute(f"SELECT {', '.join(n for n, _ in columns)} FROM {table} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_rows or settings.EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+            arrays = [
+                pa.array([_coerce(r[i], kind) for r in rows], type=schema.field(i).type)
+                for i, (_, kind) in enumerate(columns)
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def export(self, table: str, path: str, fmt: str = "parquet") -> Dict[str, Any]:
+        """Write `table` to `path` as Parquet (one row group per batch) or an Arrow IPC file."""
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table '{table}'; choose from {', '.join(TABLE_COLUMNS)}")
+        start, rows, groups = time.perf_counter(), 0, 0
+        schema = _schema(table)
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(path, schema, compression="zstd")
+        elif fmt == "arrow":
+            writer = pa_ipc.new_file(path, schema)
+        else:
+            raise ValueError("format must be 'parquet' or 'arrow'")
+        try:
+            for batch in self.batches(table):
+                if fmt == "parquet":
+                    writer.write_batch(batch, row_group_size=batch.num_rows)
+                else:
+                    writer.write_batch(batch)
+                rows += batch.num_rows
+                groups += 1
+        finally:
+            writer.close()
+        return {"table": table, "format": fmt, "rows": rows, "batches": groups,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    # ─── Snapshot ───────────────────────────────────────────────────────
+
+    def _snapshot_versions(self, table: str) -> List[str]:
+        """Paths of the table's snapshot versions, oldest first."""
+        prefix = f"{table}-"
+        names = [n for n in os.listdir(self.snapshot_dir)
+                 if n.startswith(prefix) and n.endswith(".arrow") and n[len(prefix):-len(".arrow")].isdigit()]
+        return [os.path.join(self.snapshot_dir, n) for n in sorted(names, key=lambda n: int(n[len(prefix):-len(".arrow")]))]
+
+    def snapshot_path(self, table: str) -> Optional[str]:
+        """The newest snapshot of `table`, or None."""
+        versions = self._snapshot_versions(table)
+        return versions[-1] if versions else None
+
+    def _remove_old_versions(self, table: str):
+        for path in self._snapshot_versions(table)[:-1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still mapped by a reader (Windows); retried on the next refresh
+
+    def _version(self, table: str) -> tuple:
+        # Rows are only appended or deleted (dedupe), so count + max id detects change
+        return tuple(self.conn.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {table}").fetchone())
+
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Rewrite the snapshot of every table that changed since the last refresh."""
+        refreshed = {}
+        with self._lock:
+            for table in TABLE_COLUMNS:
+                version = self._version(table)
+                if not force and self._versions.get(table) == version and self.snapshot_path(table):
+                    self._remove_old_versions(table)
+                    continue
+                fd, tmp = tempfile.mkstemp(dir=self.snapshot_dir, suffix=".tmp")
+                os.close(fd)
+                try:
+                    refreshed[table] = self.export(table, tmp, fmt="arrow")
+                    # A new name, so no file a reader has mapped is ever replaced
+                    os.rename(tmp, os.path.join(self.snapshot_dir, f"{table}-{time.time_ns()}.arrow"))
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                self._versions[table] = version
+                self._remove_old_versions(table)
+        if refreshed:
+            summary = ", ".join(f"{t} ({r['rows']} rows)" for t, r in refreshed.items())
+            logger.info(f"Refreshed columnar snapshot: {summary}")
+        return {"status": "success", "refreshed": refreshed}
+
+    def load(self, table: str):
+        """Memory-mapped pyarrow Table of the latest snapshot (built on first use)."""
+        path = self.snapshot_path(table)
+        if path is None:
+            self.refresh()
+            path = self.snapshot_path(table)
+        # Not closed explicitly: the returned table's buffers keep the mapping alive
+        return pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    def frame(self, table: str, filters: Optional[Dict[str, List[Any]]] = None):
+        """Snapshot as a pandas DataFrame, optionally filtered by {column: [values]} (case-insensitive for text)."""
+        data = self.load(table)
+        if filters:
+            mask = None
+            for column, values in filters.items():
+                col = data[column]
+                if pa.types.is_string(col.type):
+                    cond = pc.is_in(pc.utf8_lower(col), value_set=pa.array([str(v).lower() for v in values]))
+                else:
+                    cond = pc.is_in(col, value_set=pa.array(values))
+                mask = cond if mask is None else pc.and_(mask, cond)
+            data = data.filter(mask)
+        return data.to_pandas()
+
+    async def run(self):
+        """Keep snapshots fresh in the background (ingestion leader only)."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Snapshot refresh failed: {e}")
+            await asyncio.sleep(settings.SNAPSHOT_REFRESH_SECONDS)
+
+columnar_store = LazySingleton("columnar", ColumnarStore)
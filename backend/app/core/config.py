@@ -1,13 +1,122 @@
 import os
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    DEEPSEEK_API_KEY: str
+    # Optional at import time so the server can start; LLM calls report it if missing
+    DEEPSEEK_API_KEY: str = ""
     # Default to 'workspace' folder in the project root if WORKSPACE_ROOT not in ENV
     WORKSPACE_ROOT: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "workspace")
     GMAIL_USER: str = ""
     GMAIL_APP_PASSWORD: str = ""
+
+    # Outbound mail (defaults to Gmail over SSL; point at a local SMTP server for testing)
+    SMTP_HOST: str = "smtp.gmail.com"
+    SMTP_PORT: int = 465
+    SMTP_SSL: bool = True
+    SMTP_STARTTLS: bool = False
+    SMTP_AUTH: bool = True
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_IDLE_CHECK_SECONDS: float = 30.0
+    EMAIL_FROM: str = ""
+    EMAIL_MAX_RETRIES: int = 3
+    EMAIL_RETRY_BASE_SECONDS: float = 1.0
+    EMAIL_OUTBOX_RETAIN_DAYS: int = 7
+
+    # Long documents are split into chunks of roughly this many characters
+    # and extracted/summarized in parallel (map-reduce).
+    LLM_CHUNK_CHARS: int = 6000
+    # Lines of one chunk repeated at the start of the next, so a row at a split is read whole
+    LLM_CHUNK_OVERLAP_LINES: int = 2
+    LLM_MAX_PARALLEL_CHUNKS: int = 4
+    # App-wide LLM scheduler: provider rate limit, concurrency cap and retry policy.
+    # The rate/burst bucket is shared by all worker processes; LLM_MAX_IN_FLIGHT is per process.
+    LLM_RATE_PER_MINUTE: float = 60
+    LLM_BURST: int = 10
+    LLM_MAX_IN_FLIGHT: int = 4
+    LLM_MAX_RETRIES: int = 4
+    LLM_BACKOFF_BASE_SECONDS: float = 1.0
+    LLM_BACKOFF_MAX_SECONDS: float = 30.0
+
+    # OCR worker processes (0 = one per core) and image preprocessing before recognition
+    OCR_WORKERS: int = 0
+    OCR_LANG: str = "eng"
+    OCR_TARGET_DPI: int = 300
+    OCR_MAX_SIDE: int = 2500
+    OCR_DESKEW: bool = True
+
+    # Below this local-classifier confidence the LLM picks the document type
+    CLASSIFIER_MIN_CONFIDENCE: float = 0.5
+
+    # Price index: prices are normalized to BASE_CURRENCY. FX_RATES gives the value of one
+    # unit of each currency in BASE_CURRENCY (override with a JSON object in .env).
+    BASE_CURRENCY: str = "INR"
+    FX_RATES: Dict[str, float] = {"USD": 83.0, "EUR": 90.0, "GBP": 105.0, "AED": 22.6, "SGD": 61.5, "JPY": 0.56, "CNY": 11.5}
+    PRICE_WINDOW: int = 500
+    PRICE_ZSCORE_MONTHS: int = 12
+    PRICE_MIN_HISTORY: int = 5
+    PRICE_INDEX_CACHE_MATERIALS: int = 2000
+
+    # Near-duplicate documents: minimum similarity (share of the smaller text found in the
+    # other), and how many prices/quantities may be replaced by others (0 = none, so a revised
+    # quote is never mistaken for a copy). Dates, times, page counters and figures only one
+    # copy carries are ignored.
+    DEDUPE_THRESHOLD: float = 0.85
+    DEDUPE_MAX_CHANGED_NUMBERS: int = 0
+
+    # Quotes without a reference number only count as revisions of same-vendor quotes this recent
+    REVISION_WINDOW_DAYS: int = 90
     
+    # Opt-in: successfully processed documents leave the watched folders for daily bundles in
+    # ARCHIVE_DIR (files that failed or were duplicates always stay put)
+    ARCHIVE_PROCESSED: bool = False
+    ARCHIVE_COMPRESS: bool = True
+
+    # Columnar export / snapshot of the quote history (pyarrow)
+    EXPORT_BATCH_ROWS: int = 50000
+    SNAPSHOT_REFRESH_SECONDS: float = 300
+
+    # Threads for the startup stat/hash pass over the watched folders
+    RECONCILE_WORKERS: int = 8
+
+    # DOCX/XLSX quotes whose table layout is recognised at this confidence skip the LLM
+    RULE_EXTRACT_MIN_CONFIDENCE: float = 0.8
+
+    # /chat intent router: minimum rule score for a tool to run, fallback-model confidence, decision log
+    ROUTER_MIN_SCORE: float = 3.0
+    ROUTER_FALLBACK_MIN_PROB: float = 0.6
+    ROUTER_LOG: bool = True
+
+    # /chat sessions: recent turns sent verbatim; older ones folded into a rolling summary in batches
+    SESSION_RECENT_TURNS: int = 12
+    SESSION_SUMMARY_BATCH: int = 8
+    SESSION_RETAIN_DAYS: int = 30
+
+    # Learned facts injected into /chat: only the most relevant, within a token budget
+    KNOWLEDGE_PROMPT_TOKENS: int = 300
+    KNOWLEDGE_TOP_K: int = 8
+    KNOWLEDGE_MIN_SCORE: float = 0.25
+    KNOWLEDGE_MERGE_THRESHOLD: float = 0.9
+
+    # Optional Chroma server; required when running several workers (a worker without it
+    # refuses to start while another process has the embedded store open)
+    CHROMA_HOST: str = ""
+    CHROMA_PORT: int = 8001
+
+    # UI event feed (/events): cross-worker poll interval, SSE keepalive, per-client buffer, rows kept
+    EVENTS_POLL_SECONDS: float = 0.5
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    EVENTS_QUEUE_SIZE: int = 1000
+    EVENTS_RETAIN: int = 10000
+
+    # Document-processing job queue (drained by the ingestion leader)
+    JOB_WORKERS: int = 2
+    JOB_POLL_SECONDS: float = 2.0
+    JOB_MAX_ATTEMPTS: int = 3
+    # A failed attempt waits base * 2^(attempt-1) seconds (capped) before it is retried
+    JOB_RETRY_BACKOFF_SECONDS: float = 30.0
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 900.0
+
     @property
     def DB_PATH(self): return os.path.join(self.WORKSPACE_ROOT, "memory", "procurement.db")
     @property
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+from typing import Dict, Any, Optional, List
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
+from app.core.memory import memory_manager
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+BANDS, ROWS = 16, 8          # 16 x 8 = 128; candidate threshold ~0.7 Jaccard
+SHINGLE = 5                  # character 5-grams tolerate OCR noise better than word shingles
+_MERSENNE = (1 << 61) - 1
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+# Letters OCR reads in place of digits, fixed only inside tokens that already hold digits
+_OCR_DIGITS = str.maketrans("OoIl|SB", "0011158")
+_OCR_TOKEN = re.compile(r"[\dOoIl|SB][\dOoIl|SB,.]*")
+# Dates, clock times and page counters: print/e-mail headers and footers add these, a revision doesn't
+_NOT_FIGURES = re.compile(
+    r"\b\d{1,2}:\d{2}(?::\d{2})?\b"
+    r"|\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?,?\s+\d{4}\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2},?\s+\d{4}\b"
+    r"|\bpage\s+\d+(?:\s+of\s+\d+)?\b",
+    re.IGNORECASE,
+)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _ocr_digits(match) -> str:
+    token = match.group(0)
+    return token.translate(_OCR_DIGITS) if sum(c.isdigit() for c in token) >= 2 else token
+
+
+def numbers_of(text: str) -> List[str]:
+    """Numeric tokens with 2+ digits (prices, quantities, references) — what a revision changes."""
+    text = _NOT_FIGURES.sub(" ", _OCR_TOKEN.sub(_ocr_digits, text))
+    out = []
+    for n in _NUMBER.findall(text):
+        n = n.replace(",", "").rstrip(".")
+        if sum(c.isdigit() for c in n) >= 2:
+            out.append(n.rstrip("0").rstrip(".") if "." in n else n)
+    return sorted(out)
+
+
+def _shingles(text: str) -> set:
+    norm = _normalize(text)
+    return {norm[i:i + SHINGLE] for i in range(max(len(norm) - SHINGLE + 1, 1))}
+
+
+def _containment(jaccard: float, size_a: Optional[int], size_b: Optional[int]) -> float:
+    """
+    Share of the smaller document found in the other, from the MinHash Jaccard estimate and the
+    shingle counts: a reprint with an added mail header or footer is contained in the original
+    even when their Jaccard similarity is lower. Rows registered without a count fall back to Jaccard.
+    """
+    if not size_a or not size_b:
+        return jaccard
+    common = jaccard * (size_a + size_b) / (1 + jaccard)
+    return min(common / min(size_a, size_b), 1.0)
+
+
+def _same_figures(a, b) -> bool:
+    """
+    A revision replaces figures; a reprint only adds some (a mail header's message id, a phone
+    number in a footer). So only figures missing from *both* sides count as changed.
+    """
+    # Multisets: a price changed to a value that also occurs elsewhere still counts
+    a, b = Counter(a), Counter(b)
+    return min(sum((a - b).values()), sum((b - a).values())) <= settings.DEDUPE_MAX_CHANGED_NUMBERS
+
+
+class DedupeIndex:
+    """
+    MinHash/LSH index of extracted document text, shared by every watched folder and uploads.
+    Runs before the LLM stage: a document whose text is a near-duplicate of a known one
+    (and carries the same numbers, so it is not a revision) is linked to the original instead
+    of being processed again.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        rng = np.random.RandomState(1729)
+        self._a = rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS doc_signatures (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_path TEXT,
+                    quote_id INTEGER,
+                    duplicate_of INTEGER,
+                    numbers TEXT,
+                    signature BLOB,
+                    created TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS doc_lsh (
+                    band INTEGER,
+                    bucket INTEGER,
+                    doc_id INTEGER
+                )
+            """)
+            if "shingles" not in {row[1] for row in self.conn.execute("PRAGMA table_info(doc_signatures)")}:
+                self.conn.execute("ALTER TABLE doc_signatures ADD COLUMN shingles INTEGER")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_doc_lsh_bucket ON doc_lsh (band, bucket)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_doc_signatures_quote ON doc_signatures (quote_id)")
+            self.conn.commit()
+
+    # ─── Signatures ─────────────────────────────────────────────────────
+
+    def signature(self, text: str):
+        shingles = _shingles(text)
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "big") for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        # (a * h + b) mod p for every permutation; a, h < 2^32 so nothing overflows uint64
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(_MERSENNE)).min(axis=1)
+
+    @staticmethod
+    def _bands(sig) -> List[int]:
+        out = []
+        for band in range(BANDS):
+            digest = hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest()
+            out.append(int.from_bytes(digest, "big", signed=True))
+        return out
+
+    # ─── Lookup / register ──────────────────────────────────────────────
+
+    def find_duplicate(self, text: str, sig=None) -> Optional[Dict[str, Any]]:
+        """Known document this text duplicates, or None. Costs BANDS indexed lookups."""
+        sig = self.signature(text) if sig is None else sig
+        numbers, size = numbers_of(text), len(_shingles(text))
+        candidates = set()
+        for band, bucket in enumerate(self._bands(sig)):
+            for (doc_id,) in self.conn.execute("SELECT doc_id FROM doc_lsh WHERE band = ? AND bucket = ?", (band, bucket)):
+                candidates.add(doc_id)
+
+        best = None
+        for doc_id in candidates:
+            row = self.conn.execute(
+                "SELECT id, file_path, quote_id, numbers, signature, shingles FROM doc_signatures WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if not row:
+                continue
+            jaccard = float((np.frombuffer(row[4], dtype=np.uint64) == sig).mean())
+            similarity = _containment(jaccard, size, row[5])
+            if similarity < settings.DEDUPE_THRESHOLD:
+                continue
+            if not _same_figures(numbers, json.loads(row[3] or "[]")):
+                continue  # same layout, different figures: a revision, not a duplicate
+            if best is None or similarity > best["similarity"]:
+                best = {"doc_id": row[0], "file_path": row[1], "quote_id": row[2], "similarity": round(similarity, 3)}
+        return best
+
+    def add(self, text: str, file_path: Optional[str] = None, duplicate_of: Optional[int] = None, sig=None) -> int:
+        """Register a document; duplicates are recorded (linked) but not added to the LSH buckets."""
+        sig = self.signature(text) if sig is None else sig
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "INSERT INTO doc_signatures (file_path, duplicate_of, numbers, signature, shingles) VALUES (?, ?, ?, ?, ?)",
+                (file_path, duplicate_of, json.dumps(numbers_of(text)), sig.astype(np.uint64).tobytes(), len(_shingles(text))),
+            )
+            doc_id = cursor.lastrowid
+            if duplicate_of is None:
+                cursor.executemany(
+                    "INSERT INTO doc_lsh (band, bucket, doc_id) VALUES (?, ?, ?)",
+                    [(band, bucket, doc_id) for band, bucket in enumerate(self._bands(sig))],
+                )
+            self.conn.commit()
+        return doc_id
+
+    def check_and_register(self, text: str, file_path: str) -> Dict[str, Any]:
+        """One call for the ingestion path: returns {"doc_id", "duplicate": match-or-None}."""
+        # An unlinked registration of this same path is an earlier attempt that never finished
+        # (crash or restart mid-job); it must not make the retry look like its own duplicate
+        for (stale_id,) in self.conn.execute(
+            "SELECT id FROM doc_signatures WHERE file_path = ? AND quote_id IS NULL", (file_path,)
+        ).fetchall():
+            self.forget(stale_id)
+        sig = self.signature(text)
+        match = self.find_duplicate(text, sig)
+        doc_id = self.add(text, file_path, duplicate_of=match["doc_id"] if match else None, sig=sig)
+        return {"doc_id": doc_id, "duplicate": match}
+
+    def forget(self, doc_id: int):
+        """Drop a registration whose processing did not complete, so a retry is not seen as its duplicate."""
+        with self._lock:
+            self.conn.execute("DELETE FROM doc_lsh WHERE doc_id = ?", (doc_id,))
+            self.conn.execute("DELETE FROM doc_signatures WHERE id = ?", (doc_id,))
+            self.conn.commit()
+
+    def link_quote(self, doc_id: int, quote_id: int):
+        with self._lock:
+            self.conn.execute("UPDATE doc_signatures SET quote_id = ? WHERE id = ?", (quote_id, doc_id))
+            self.conn.commit()
+
+    def list_duplicates(self, limit: int = 100) -> List[Dict[str, Any]]:
+        cursor = self.conn.execute("""
+            SELECT d.id, d.file_path, d.created, o.id, o.file_path, o.quote_id
+            FROM doc_signatures d JOIN doc_signatures o ON o.id = d.duplicate_of
+            ORDER BY d.id DESC LIMIT ?
+        """, (limit,))
+        return [
+            {"doc_id": r[0], "file_path": r[1], "created": r[2], "original_doc_id": r[3], "original_file_path": r[4], "quote_id": r[5]}
+            for r in cursor.fetchall()
+        ]
+
+    # ─── Bulk pass over existing data ───────────────────────────────────
+
+    @staticmethod
+    def _quote_text(raw_json: str) -> str:
+        data = json.loads(raw_json or "{}")
+        for key in ("file_path", "price_flags", "revision_of", "id"):
+            data.pop(key, None)
+        return json.dumps(data, sort_keys=True, default=str)
+
+    def dedupe_existing_quotes(self, dry_run: bool = True) -> Dict[str, Any]:
+        """
+        Find near-duplicate rows in `quotes` (oldest kept) using a throwaway in-memory LSH over
+        their extracted data; unless dry_run, delete the copies from SQLite and the
+        procurement_docs collection and refresh the derived aggregates.
+        """
+        buckets: Dict[tuple, List[int]] = {}
+        kept: Dict[int, tuple] = {}
+        duplicates = []
+        for quote_id, raw_json, file_path in self.conn.execute("SELECT id, raw_json, file_path FROM quotes ORDER BY id").fetchall():
+            try:
+                text = self._quote_text(raw_json)
+            except json.JSONDecodeError:
+                continue
+            sig, numbers = self.signature(text), numbers_of(text)
+            bands = self._bands(sig)
+            match = None
+            for band, bucket in enumerate(bands):
+                for other in buckets.get((band, bucket), []):
+                    other_sig, other_numbers = kept[other]
+                    if (other_sig == sig).mean() >= settings.DEDUPE_THRESHOLD and _same_figures(numbers, other_numbers):
+                        match = other
+                        break
+                if match:
+                    break
+            if match:
+                duplicates.append({"quote_id": quote_id, "duplicate_of": match, "file_path": file_path})
+                continue
+            kept[quote_id] = (sig, numbers)
+            for band, bucket in enumerate(bands):
+                buckets.setdefault((band, bucket), []).append(quote_id)
+
+        if duplicates and not dry_run:
+            ids = [d["quote_id"] for d in duplicates]
+            tables = {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            with self._lock:
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    for table, column in (("quote_items", "quote_id"), ("quote_fingerprints", "quote_id"), ("quotes", "id")):
+                        if table not in tables:
+                            continue
+                        self.conn.execute(f"DELETE FROM {table} WHERE {column} IN ({marks})", chunk)
+                    # Documents that pointed at a removed copy now point at its original
+                    self.conn.executemany(
+                        "UPDATE doc_signatures SET quote_id = ? WHERE quote_id = ?",
+                        [(d["duplicate_of"], d["quote_id"]) for d in duplicates[i:i + 500]],
+                    )
+                self.conn.commit()
+            memory_manager.collection.delete(ids=[f"quote_{i}" for i in ids])
+            memory_manager.rebuild_vendor_aggregates()
+            from app.core.price_index import price_index
+            price_index.rebuild()
+            from app.core.events import event_bus
+            event_bus.publish("quotes_removed", ids=ids)
+            logger.info(f"Removed {len(ids)} duplicate quotes")
+
+        return {"status": "success", "dry_run": dry_run, "duplicates": duplicates, "total_duplicates": len(duplicates)}
+
+dedupe_index = LazySingleton("dedupe", DedupeIndex)
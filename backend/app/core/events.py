@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+_OVERFLOW = object()
+KEEPALIVE = None  # yielded by subscribe() when nothing happened for EVENTS_KEEPALIVE_SECONDS
+
+
+class EventBus:
+    """
+    Change feed for the UI: ingestion progress, new quotes and new learned facts.
+    Events are rows in the shared SQLite file, so one published by the ingestion leader
+    reaches clients connected to any worker: each process tails the table and fans new
+    rows out to its local subscribers. The row id is the SSE event id, so a reconnecting
+    client resumes from Last-Event-ID without missing anything.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT NOT NULL,
+                    data TEXT,
+                    created_at REAL
+                )
+            """)
+            self.conn.commit()
+        self._subscribers = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tailer: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._published = 0
+
+    # ─── Publish ────────────────────────────────────────────────────────
+
+    def publish(self, type: str, **data) -> Optional[int]:
+        """Append an event; safe from any thread. Never raises: a lost event must not fail ingestion."""
+        try:
+            with self._lock:
+                cursor = self.conn.execute(
+                    "INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)",
+                    (type, json.dumps(data, default=str), time.time()),
+                )
+                event_id = cursor.lastrowid
+                self._published += 1
+                if self._published % 500 == 0:
+                    self.conn.execute("DELETE FROM events WHERE id <= ?", (event_id - settings.EVENTS_RETAIN,))
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Event publish failed ({type}): {e}")
+            return None
+        if self._loop and self._wakeup:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed; the row is there for the next reader
+        return event_id
+
+    # ─── Read ───────────────────────────────────────────────────────────
+
+    def latest_id(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def since(self, last_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT id, type, data, created_at FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+        return [{"id": r[0], "type": r[1], "data": json.loads(r[2]) if r[2] else {}, "created_at": r[3]} for r in rows]
+
+    def _ensure_tailer(self):
+        loop = asyncio.get_running_loop()
+        if self._tailer is None or self._tailer.done():
+            self._loop, self._wakeup = loop, asyncio.Event()
+            self._last_id = self.latest_id()
+            self._tailer = loop.create_task(self._tail())
+
+    async def _tail(self):
+        # Runs while anyone is subscribed; local publishes wake it at once, other workers' within EVENTS_POLL_SECONDS
+        while self._subscribers:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.EVENTS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                events = await asyncio.to_thread(self.since, self._last_id)
+            except Exception as e:
+                logger.error(f"Event tail failed: {e}")
+                continue
+            for event in events:
+                self._last_id = event["id"]
+                for queue in list(self._subscribers):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        # Too slow to keep up: drop it; the client reconnects with Last-Event-ID
+                        while not queue.empty():
+                            queue.get_nowait()
+                        queue.put_nowait(_OVERFLOW)
+                        self._subscribers.discard(queue)
+
+    async def subscribe(self, last_id: Optional[int] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Events after `last_id` (or from now on), then live ones; KEEPALIVE when idle."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        self._ensure_tailer()
+        cursor = self._last_id
+        try:
+            if last_id is not None:
+                cursor = last_id
+                while batch := await asyncio.to_thread(self.since, cursor):
+                    for event in batch:
+                        cursor = event["id"]
+                        yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                if event is _OVERFLOW:
+                    return
+                if event["id"] > cursor:
+                    cursor = event["id"]
+                    yield event
+        finally:
+            self._subscribers.discard(queue)
+
+event_bus = LazySingleton("events", EventBus)
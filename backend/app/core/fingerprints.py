@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import re
+import time
+from typing import Dict, Any, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+_LEGAL_SUFFIX = re.compile(r"\b(?:pvt|private|ltd|limited|llp|inc|co|corp|company|gmbh|llc)\b\.?")
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """Case/punctuation-insensitive key for vendor names, materials and references."""
+    if not value:
+        return ""
+    value = _LEGAL_SUFFIX.sub(" ", str(value).lower())
+    return " ".join(re.findall(r"[a-z0-9]+", value))
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit SimHash of word shingles; near-identical texts differ in few bits."""
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < shingle:
+        tokens = tokens + [""] * (shingle - len(tokens))
+    weights = [0] * 64
+    for i in range(len(tokens) - shingle + 1):
+        h = int.from_bytes(hashlib.blake2b(" ".join(tokens[i:i + shingle]).encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def _stems(key: Optional[str]) -> set:
+    # Crude plural folding is enough to match "pipe" with "pipes"
+    return {t[:-1] if len(t) > 3 and t.endswith("s") else t for t in (key or "").split()}
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class FingerprintIndex:
+    """
+    Per-quote fingerprints for revision detection: a vendor+reference key and a SimHash of
+    the normalized document text. A quote with a reference number revises only the latest
+    quote with the same vendor and reference. Without one, it revises a recent
+    (REVISION_WINDOW_DAYS) unreferenced quote from the same vendor for the same, non-empty
+    material whose text is close by SimHash.
+    """
+
+    MAX_SIMHASH_DISTANCE = 12
+    MAX_SIMHASH_DISTANCE_SAME_MATERIAL = 22
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS quote_fingerprints (
+                    quote_id INTEGER PRIMARY KEY REFERENCES quotes(id) ON DELETE CASCADE,
+                    vendor_key TEXT,
+                    material_key TEXT,
+                    reference_key TEXT,
+                    revision_key TEXT,
+                    simhash INTEGER,
+                    created_at REAL
+                )
+            """)
+            if "created_at" not in {row[1] for row in self.conn.execute("PRAGMA table_info(quote_fingerprints)")}:
+                # Rows from before the column have no age and are only matched by reference
+                self.conn.execute("ALTER TABLE quote_fingerprints ADD COLUMN created_at REAL")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_revision ON quote_fingerprints (revision_key)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_vendor ON quote_fingerprints (vendor_key)")
+            self.conn.commit()
+
+    @staticmethod
+    def fingerprint(data: Dict[str, Any], text: str) -> Dict[str, Any]:
+        vendor_key = normalize_name(data.get("vendor_name"))
+        material_key = normalize_name(data.get("material"))
+        reference_key = normalize_name(data.get("quote_reference"))
+        # Only a vendor reference number is an exact revision key; vendor+material alone is not
+        revision_key = f"{vendor_key}|ref:{reference_key}" if reference_key else None
+        return {
+            "vendor_key": vendor_key,
+            "material_key": material_key,
+            "reference_key": reference_key,
+            "revision_key": revision_key,
+            "simhash": simhash(text),
+        }
+
+    def find_previous(self, fp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Most recent earlier quote that this one revises, or None."""
+        if not fp["vendor_key"]:
+            return None
+        if fp["revision_key"]:
+            row = self.conn.execute("""
+                SELECT quote_id, simhash FROM quote_fingerprints
+                WHERE revision_key = ? ORDER BY quote_id DESC LIMIT 1
+            """, (fp["revision_key"],)).fetchone()
+            # A different reference is a different quote, however similar the text
+            return {"quote_id": row[0], "match": "key", "distance": hamming(row[1], fp["simhash"])} if row else None
+
+        # No reference: same vendor, recent, unreferenced, material descriptions overlapping
+        # (e.g. "steel pipe" vs "steel pipes sch40") and a close SimHash; never on an empty material
+        materials = _stems(fp["material_key"])
+        if not materials:
+            return None
+        best = None
+        since = time.time() - settings.REVISION_WINDOW_DAYS * 86400
+        for quote_id, sh, material_key in self.conn.execute("""
+            SELECT quote_id, simhash, material_key FROM quote_fingerprints
+            WHERE vendor_key = ? AND COALESCE(reference_key, '') = '' AND created_at >= ?
+            ORDER BY quote_id DESC LIMIT 200
+        """, (fp["vendor_key"], since)):
+            other = _stems(material_key)
+            if not other:
+                continue
+            overlap = len(materials & other) / len(materials | other)
+            if overlap < 0.5:
+                continue
+            distance = hamming(sh, fp["simhash"])
+            limit = self.MAX_SIMHASH_DISTANCE_SAME_MATERIAL if materials == other else self.MAX_SIMHASH_DISTANCE
+            if distance <= limit and (best is None or distance < best["distance"]):
+                best = {"quote_id": quote_id, "match": "simhash", "distance": distance}
+        return best
+
+    def add(self, quote_id: int, fp: Dict[str, Any]):
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO quote_fingerprints (quote_id, vendor_key, material_key, reference_key, revision_key, simhash, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (quote_id, fp["vendor_key"], fp["material_key"], fp["reference_key"], fp["revision_key"],
+                  _to_signed(fp["simhash"]), time.time()))
+            self.conn.commit()
+
+fingerprint_index = LazySingleton("fingerprints", FingerprintIndex)
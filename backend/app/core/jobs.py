@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Optional, List
+
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.lazy import LazySingleton
+from app.core.llm_scheduler import llm_lane, BACKGROUND
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobQueue:
+    """
+    Persistent document-processing queue in the shared SQLite file.
+    Any worker may enqueue; the ingestion leader drains it with a bounded pool of
+    asyncio workers. Jobs left "running" by a crash or restart are requeued on start.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT DEFAULT 'document',
+                    file_path TEXT,
+                    source TEXT,
+                    state TEXT DEFAULT 'queued',
+                    attempts INTEGER DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    not_before REAL
+                )
+            """)
+            if "not_before" not in {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs (file_path, state)")
+            self.conn.commit()
+
+    # ─── Producer side ──────────────────────────────────────────────────
+
+    def enqueue(self, file_path: str, source: str = "watcher", kind: str = "document") -> int:
+        """Queue a file for processing; returns the id of an already-pending job for the same file."""
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT id FROM jobs WHERE file_path = ? AND state IN ({','.join('?' * len(ACTIVE_STATES))}) ORDER BY id LIMIT 1",
+                (file_path, *ACTIVE_STATES),
+            ).fetchone()
+            if row:
+                return row[0]
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (kind, file_path, source, state, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (kind, file_path, source, time.time()),
+            )
+            self.conn.commit()
+            job_id = cursor.lastrowid
+        event_bus.publish("job", id=job_id, file=os.path.basename(file_path), source=source, state="queued")
+        self._notify()
+        return job_id
+
+    def _notify(self):
+        # Safe from watchdog threads; other worker processes are picked up by polling
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ─── Status ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        job_id, kind, file_path, source, state, attempts, result, error, created, started, finished, not_before = row
+        duration = round((finished - started) * 1000, 1) if started and finished else None
+        waited = round(((started or time.time()) - created) * 1000, 1) if created else None
+        return {
+            "id": job_id,
+            "kind": kind,
+            "file_path": file_path,
+            "file": os.path.basename(file_path or ""),
+            "source": source,
+            "state": state,
+            "attempts": attempts,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created,
+            "started_at": started,
+            "finished_at": finished,
+            "retry_at": not_before if state == "queued" else None,
+            "queue_ms": waited,
+            "duration_ms": duration,
+        }
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        if state:
+            rows = self.conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?", (state, limit))
+        else:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._row_to_job(r) for r in rows.fetchall()]
+
+    def done_files(self, limit: int = 1000) -> List[str]:
+        rows = self.conn.execute(
+            """SELECT file_path FROM jobs
+               WHERE state = 'done' AND COALESCE(json_extract(result, '$.type'), '') NOT IN ('Error', 'Duplicate')
+               GROUP BY file_path ORDER BY MAX(id) DESC LIMIT ?""", (limit,)
+        )
+        return [r[0] for r in rows.fetchall()]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    # ─── Consumer side (leader only) ────────────────────────────────────
+
+    def _requeue_interrupted(self) -> int:
+        with self._lock:
+            cursor = self.conn.execute("UPDATE jobs SET state = 'queued', started_at = NULL WHERE state = 'running'")
+            self.conn.commit()
+        return cursor.rowcount
+
+    def _claim_next(self) -> Optional[tuple]:
+        with self._lock:
+            # Jobs waiting out a retry backoff are skipped until their time comes
+            row = self.conn.execute(
+                "SELECT id, file_path, attempts FROM jobs WHERE state = 'queued' AND COALESCE(not_before, 0) <= ? ORDER BY id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, started_at = ?, error = NULL, not_before = NULL WHERE id = ?",
+                (time.time(), row[0]),
+            )
+            self.conn.commit()
+        event_bus.publish("job", id=row[0], file=os.path.basename(row[1] or ""), state="running", attempt=row[2] + 1)
+        return row[0], row[1], row[2] + 1
+
+    def _finish(self, job_id: int, state: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (state, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id),
+            )
+            self.conn.commit()
+        # Small delta only; the full analysis is at /jobs/{id}
+        event_bus.publish("job", id=job_id, state=state, error=error,
+                          doc_type=result.get("type") if isinstance(result, dict) else None)
+
+    async def _worker(self, index: int):
+        while True:
+            claimed = self._claim_next()
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, file_path, attempt = claimed
+            logger.info(f"Job {job_id} (attempt {attempt}) started on worker {index}: {file_path}")
+            try:
+                if not os.path.exists(file_path):
+                    raise FileNotFoundError(f"File no longer exists: {file_path}")
+                # Off the event loop, so /chat stays responsive; LLM calls queue in the background lane
+                with llm_lane(BACKGROUND):
+                    result = await asyncio.to_thread(_process_document, file_path)
+            except Exception as e:
+                retry = attempt < settings.JOB_MAX_ATTEMPTS and not isinstance(e, FileNotFoundError)
+                logger.error(f"Job {job_id} failed (attempt {attempt}): {e}")
+                if retry:
+                    # Back off, so a provider outage does not use up every attempt within seconds
+                    delay = min(settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), settings.JOB_RETRY_BACKOFF_MAX_SECONDS)
+                    with self._lock:
+                        self.conn.execute("UPDATE jobs SET state = 'queued', error = ?, not_before = ? WHERE id = ?",
+                                          (str(e), time.time() + delay, job_id))
+                        self.conn.commit()
+                    event_bus.publish("job", id=job_id, state="queued", error=str(e), retry=True, retry_in=round(delay, 1))
+                else:
+                    self._finish(job_id, "failed", error=str(e))
+                continue
+            self._finish(job_id, "done", result=result)
+            # Outside the retry path: the document is ingested, a failed archive must not ingest it again
+            await asyncio.to_thread(_after_processing, file_path, job_id, result)
+
+    async def run(self):
+        """Drain the queue with JOB_WORKERS concurrent workers until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        resumed = self._requeue_interrupted()
+        if resumed:
+            logger.info(f"Resuming {resumed} interrupted job(s)")
+        await asyncio.gather(*(self._worker(i) for i in range(settings.JOB_WORKERS)))
+
+def _process_document(file_path: str) -> Dict[str, Any]:
+    from app.agents.procurement_agent import procurement_agent
+    return asyncio.run(procurement_agent.process_new_document(file_path))
+
+# Outcomes whose source file stays in the watched folder for the user to look at
+_KEEP_IN_PLACE = ("Error", "Duplicate")
+
+def _after_processing(file_path: str, job_id: int, result: Any = None):
+    from app.core.manifest import processed_manifest
+    from app.tools.archiver import archiver
+    try:
+        processed_manifest.record(file_path, job_id)
+        doc_type = result.get("type") if isinstance(result, dict) else None
+        if settings.ARCHIVE_PROCESSED and doc_type not in _KEEP_IN_PLACE:
+            archiver.archive(file_path)
+    except Exception as e:
+        logger.error(f"Post-processing of {file_path} failed: {e}")
+
+job_queue = LazySingleton("jobs", JobQueue)
@@ -0,0 +1,145 @@
+import logging
+from typing import List, Dict, Any, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
+from app.core.memory import memory_manager
+
+np = lazy_import("numpy")
+embedding_functions = lazy_import("chromadb.utils.embedding_functions")
+
+logger = logging.getLogger(__name__)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class KnowledgeIndex:
+    """
+    Learned facts (personal_knowledge) with their embeddings held in an in-memory matrix.
+    Each fact is embedded once, on write, with the same local model Chroma uses for quotes;
+    the vector is kept in SQLite so restarts do not re-embed. /chat retrieves only the
+    facts relevant to the query, within a token budget, and paraphrases of a known fact
+    are merged into it instead of being stored again.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        self._embedder = None
+        memory_manager._add_columns("personal_knowledge", {"embedding": "BLOB"})
+        self._ids: List[int] = []
+        self._facts: List[str] = []
+        self._matrix = None  # (n, dim) float32, rows L2-normalized
+        self._max_id = 0
+        with self._lock:
+            self._load()
+
+    # ─── Embeddings ─────────────────────────────────────────────────────
+
+    def _embed(self, texts: List[str]):
+        if self._embedder is None:
+            self._embedder = embedding_functions.DefaultEmbeddingFunction()
+        vectors = np.asarray(self._embedder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _load(self):
+        """Pull rows newer than the last one seen (including those written by other workers)."""
+        rows = self.conn.execute(
+            "SELECT id, fact, embedding FROM personal_knowledge WHERE id > ? ORDER BY id", (self._max_id,)
+        ).fetchall()
+        if not rows:
+            return
+        missing = [i for i, r in enumerate(rows) if r[2] is None]
+        vectors = [None if r[2] is None else np.frombuffer(r[2], dtype=np.float32) for r in rows]
+        if missing:
+            # Facts stored before embeddings existed: embed once and persist
+            embedded = self._embed([rows[i][1] for i in missing])
+            for i, vec in zip(missing, embedded):
+                vectors[i] = vec
+            self.conn.executemany(
+                "UPDATE personal_knowledge SET embedding = ? WHERE id = ?",
+                [(vec.tobytes(), rows[i][0]) for i, vec in zip(missing, embedded)],
+            )
+            self.conn.commit()
+            logger.info(f"Embedded {len(missing)} existing learned facts")
+        block = np.vstack(vectors)
+        self._matrix = block if self._matrix is None else np.vstack([self._matrix, block])
+        self._ids.extend(r[0] for r in rows)
+        self._facts.extend(r[1] for r in rows)
+        self._max_id = rows[-1][0]
+
+    # ─── Write ──────────────────────────────────────────────────────────
+
+    def add(self, category: str, fact: str) -> Dict[str, Any]:
+        """Store a fact, or bump the usage of a near-identical one already known."""
+        vec = self._embed([fact])[0]
+        with self._lock:
+            self._load()
+            if self._matrix is not None and len(self._ids):
+                scores = self._matrix @ vec
+                best = int(scores.argmax())
+                if scores[best] >= settings.KNOWLEDGE_MERGE_THRESHOLD:
+                    self.conn.execute(
+                        "UPDATE personal_knowledge SET usage_count = usage_count + 1, last_used = CURRENT_TIMESTAMP WHERE id = ?",
+                        (self._ids[best],),
+                    )
+                    self.conn.commit()
+                    return {"id": self._ids[best], "merged": True, "similarity": round(float(scores[best]), 3)}
+
+            cursor = self.conn.execute(
+                "INSERT INTO personal_knowledge (category, fact, embedding) VALUES (?, ?, ?)",
+                (category, fact, vec.tobytes()),
+            )
+            self.conn.commit()
+            # Rows other workers inserted in between are picked up first, then this one
+            self._load()
+            # Another worker may have stored the same fact at the same moment: the lower id wins
+            new_id = cursor.lastrowid
+            scores = self._matrix @ vec
+            twins = [self._ids[i] for i in range(len(self._ids))
+                     if self._ids[i] < new_id and scores[i] >= settings.KNOWLEDGE_MERGE_THRESHOLD]
+            if twins:
+                keep = min(twins)
+                self.conn.execute("DELETE FROM personal_knowledge WHERE id = ?", (new_id,))
+                self.conn.execute(
+                    "UPDATE personal_knowledge SET usage_count = usage_count + 1, last_used = CURRENT_TIMESTAMP WHERE id = ?",
+                    (keep,),
+                )
+                self.conn.commit()
+                drop = self._ids.index(new_id)
+                del self._ids[drop], self._facts[drop]
+                self._matrix = np.delete(self._matrix, drop, axis=0)
+                return {"id": keep, "merged": True, "similarity": round(float(scores[self._ids.index(keep)]), 3)}
+        from app.core.events import event_bus
+        event_bus.publish("fact", id=cursor.lastrowid, category=category, fact=fact)
+        return {"id": cursor.lastrowid, "merged": False}
+
+    # ─── Read ───────────────────────────────────────────────────────────
+
+    def relevant(self, query: str, max_tokens: Optional[int] = None, top_k: Optional[int] = None) -> List[str]:
+        """The facts most similar to `query`, best first, until the token budget is spent."""
+        max_tokens = settings.KNOWLEDGE_PROMPT_TOKENS if max_tokens is None else max_tokens
+        top_k = settings.KNOWLEDGE_TOP_K if top_k is None else top_k
+        with self._lock:
+            self._load()
+            if self._matrix is None or not len(self._ids):
+                return []
+            scores = self._matrix @ self._embed([query])[0]
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            ranked = sorted(top, key=lambda i: -scores[i])
+            facts, budget = [], max_tokens
+            for i in ranked:
+                if scores[i] < settings.KNOWLEDGE_MIN_SCORE:
+                    break
+                cost = _approx_tokens(self._facts[i])
+                if cost > budget:
+                    continue
+                facts.append(self._facts[i])
+                budget -= cost
+            return facts
+
+knowledge_index = LazySingleton("knowledge", KnowledgeIndex)
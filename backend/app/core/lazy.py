@@ -0,0 +1,77 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, "LazySingleton"] = {}
+
+
+class LazySingleton:
+    """
+    Module-level singleton that is only built on first attribute access.
+    Callers keep using it like the real object (`memory_manager.store_quote(...)`),
+    while importing the module stays cheap. Every instance is registered so the
+    app can warm them in the background and report readiness.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._lazy_name = name
+        self._lazy_factory = factory
+        self._lazy_instance = None
+        self._lazy_error = None
+        self._lazy_seconds = None
+        self._lazy_lock = threading.Lock()
+        _registry[name] = self
+
+    def _lazy_get(self):
+        if self._lazy_instance is None:
+            with self._lazy_lock:
+                if self._lazy_instance is None:
+                    start = time.perf_counter()
+                    try:
+                        self._lazy_instance = self._lazy_factory()
+                        self._lazy_error = None
+                    except Exception as e:
+                        self._lazy_error = str(e)
+                        raise
+                    finally:
+                        self._lazy_seconds = round(time.perf_counter() - start, 3)
+                    logger.info(f"Initialized {self._lazy_name} in {self._lazy_seconds}s")
+        return self._lazy_instance
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_get(), attr)
+
+    # Prefixed names so they never shadow attributes of the wrapped object
+    def lazy_status(self) -> Dict[str, Any]:
+        return {
+            "ready": self._lazy_instance is not None,
+            "init_seconds": self._lazy_seconds,
+            "error": self._lazy_error,
+        }
+
+
+def lazy_import(module_name: str) -> LazySingleton:
+    """
+    Stand-in for a heavy third-party module (`pd = lazy_import("pandas")`).
+    The real import happens on first use or during background warm-up.
+    """
+    if module_name in _registry:
+        return _registry[module_name]
+    return LazySingleton(module_name, lambda: importlib.import_module(module_name))
+
+
+def warm_all():
+    """Build every registered singleton. Failures are recorded, not raised."""
+    for name, proxy in list(_registry.items()):
+        try:
+            proxy._lazy_get()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+
+
+def readiness() -> Dict[str, Dict[str, Any]]:
+    return {name: proxy.lazy_status() for name, proxy in _registry.items()}
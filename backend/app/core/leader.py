@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """
+    Non-blocking, process-wide exclusive lock on a file. With several uvicorn workers,
+    exactly one process holds it and runs the folder watcher / ingestion. The OS releases
+    the lock when the holder exits, so a standby worker takes over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+leader_lock = LeaderLock(os.path.join(settings.MEMORY_DIR, "ingestion-leader.lock"))
+# Held by the one process allowed to open the embedded Chroma store (no CHROMA_HOST)
+embedded_store_lock = LeaderLock(os.path.join(settings.MEMORY_DIR, "chroma-embedded.lock"))
+
+
+def require_embedded_store():
+    """
+    Embedded Chroma is single-process: a second process on the same directory serves stale
+    vector search and writes behind the first one's back. Raises unless this process owns it.
+    """
+    if not embedded_store_lock.try_acquire():
+        raise RuntimeError(
+            f"The embedded Chroma store in {settings.CHROMA_PATH} is open in another process. "
+            "Run a single worker (WORKERS=1) or point CHROMA_HOST at a Chroma server."
+        )
+
+
+def is_leader() -> bool:
+    return leader_lock.held
+
+
+async def run_as_leader(start: Callable[[], Awaitable[None]], retry_seconds: float = 10.0):
+    """Wait until this process wins the leader lock, then run `start` (e.g. the folder watcher)."""
+    while not leader_lock.try_acquire():
+        await asyncio.sleep(retry_seconds)
+    logger.info(f"Worker {os.getpid()} is the ingestion leader")
+    try:
+        await start()
+    finally:
+        leader_lock.release()
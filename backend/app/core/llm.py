@@ -1,36 +1,59 @@
-from openai import OpenAI
 from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
+from app.core.llm_scheduler import llm_scheduler, LLMError
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
 import logging
-from typing import Dict, Any, List, Optional
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+openai = lazy_import("openai")
 
 logger = logging.getLogger(__name__)
 
 class LLMEngine:
     def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.DEEPSEEK_API_KEY,
-            base_url="https://api.deepseek.com"
-        )
+        self._client = None
+        if settings.DEEPSEEK_API_KEY:
+            self._client = openai.OpenAI(
+                api_key=settings.DEEPSEEK_API_KEY,
+                base_url="https://api.deepseek.com",
+                max_retries=0,  # retries/backoff are handled by llm_scheduler
+            )
+        else:
+            logger.warning("DEEPSEEK_API_KEY is not set; LLM features are unavailable until it is configured.")
+
+    @property
+    def client(self):
+        if self._client is None:
+            raise RuntimeError("DEEPSEEK_API_KEY is not configured")
+        return self._client
+
+    def complete(self, messages: List[Dict[str, str]], json_mode: bool = False, model: str = "deepseek-chat", priority: int = None) -> str:
+        """
+        One completion through the app-wide scheduler (rate limit, concurrency cap,
+        priority lanes, retries). Raises LLMError instead of returning an error string.
+        """
+        if self._client is None:
+            raise LLMError("DEEPSEEK_API_KEY is not configured")
+        kwargs = {"model": model, "messages": messages}
+        if model == "deepseek-chat":
+            kwargs.update(temperature=0.3, max_tokens=4096)
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        response = llm_scheduler.run(lambda: self.client.chat.completions.create(**kwargs), priority)
+        return response.choices[0].message.content
 
-    def chat(self, messages: List[Dict[str, str]], json_mode: bool = False) -> str:
+    def chat(self, messages: List[Dict[str, str]], json_mode: bool = False, priority: int = None) -> str:
         """
         General-purpose chat using deepseek-chat.
         Supports system messages, structured JSON output, and fast responses.
+        For conversational callers: a failure is returned as readable text.
         """
         try:
-            kwargs = {
-                "model": "deepseek-chat",
-                "messages": messages,
-                "temperature": 0.3,
-                "max_tokens": 4096,
-            }
-            if json_mode:
-                kwargs["response_format"] = {"type": "json_object"}
-            
-            response = self.client.chat.completions.create(**kwargs)
-            return response.choices[0].message.content
-        except Exception as e:
+            return self.complete(messages, json_mode=json_mode, priority=priority)
+        except LLMError as e:
             logger.error(f"LLM chat error: {e}")
             return f"Error communicating with DeepSeek: {str(e)}"
 
@@ -40,17 +63,85 @@ class LLMEngine:
         NOTE: deepseek-reasoner only supports user/assistant roles, no system messages.
         """
         try:
-            response = self.client.chat.completions.create(
-                model="deepseek-reasoner",
-                messages=[{"role": "user", "content": user_prompt}],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
+            return self.complete([{"role": "user", "content": user_prompt}], model="deepseek-reasoner")
+        except LLMError as e:
             logger.error(f"LLM reason error: {e}")
             # Fallback to chat model
             return self.chat([{"role": "user", "content": user_prompt}])
 
-    def extract_structured_data(self, text: str, schema_description: str) -> Dict[str, Any]:
+    def extract_structured_data(self, text: str, schema_description: str, chunked: bool = None) -> Dict[str, Any]:
+        """
+        Extract a JSON object matching `schema_description` from `text`.
+        Documents longer than LLM_CHUNK_CHARS are processed in chunked (map-reduce) mode
+        unless `chunked` is explicitly set. Raises LLMError if the provider is unavailable;
+        returns {"error": ...} if it answered with something that is not JSON.
+        """
+        if chunked is None:
+            chunked = len(text) > settings.LLM_CHUNK_CHARS
+        if chunked:
+            return self.extract_structured_data_chunked(text, schema_description)
+        return self._extract_once(text, schema_description)
+
+    def extract_structured_data_chunked(self, text: str, schema_description: str) -> Dict[str, Any]:
+        """
+        Map-reduce extraction for long documents: split on page/section boundaries,
+        extract every chunk concurrently, then merge the partial results.
+        """
+        chunks = split_into_chunks(text, settings.LLM_CHUNK_CHARS)
+        if len(chunks) == 1:
+            return self._extract_once(chunks[0], schema_description)
+
+        parts = with_overlap(chunks, settings.LLM_CHUNK_OVERLAP_LINES)
+        total = len(parts)
+        with ThreadPoolExecutor(max_workers=settings.LLM_MAX_PARALLEL_CHUNKS) as pool:
+            partials = list(pool.map(
+                _in_caller_context(lambda ip: self._extract_once(ip[1][0], schema_description, part=(ip[0] + 1, total, ip[1][1]))),
+                enumerate(parts),
+            ))
+
+        good = [p for p in partials if "error" not in p]
+        if not good:
+            return partials[0]
+        if len(good) < total:
+            logger.warning(f"Chunked extraction: {total - len(good)} of {total} chunks failed to parse")
+        return merge_extractions(partials, overlaps=[repeated for _, repeated in parts])
+
+    def summarize(self, text: str, instruction: str) -> str:
+        """
+        Summarize a document of any length. Short texts take one call; long texts are
+        summarized chunk by chunk in parallel and the partial summaries combined.
+        Raises LLMError if the provider is unavailable.
+        """
+        chunks = split_into_chunks(text, settings.LLM_CHUNK_CHARS)
+        if len(chunks) == 1:
+            return self.complete([{"role": "user", "content": f"{instruction}\n\n{chunks[0]}"}])
+
+        total = len(chunks)
+
+        def _map(ic):
+            i, chunk = ic
+            return self.complete([{"role": "user", "content": (
+                f"This is part {i + 1} of {total} of a longer document. "
+                f"List every fact relevant to the following task, without commentary.\n"
+                f"Task: {instruction}\n\n{chunk}"
+            )}])
+
+        with ThreadPoolExecutor(max_workers=settings.LLM_MAX_PARALLEL_CHUNKS) as pool:
+            notes = list(pool.map(_in_caller_context(_map), enumerate(chunks)))
+
+        combined = "\n\n".join(f"[Part {i + 1}]\n{n}" for i, n in enumerate(notes))
+        return self.complete([{"role": "user", "content": (
+            f"{instruction}\n\nThe document was too long to read at once; "
+            f"below are notes taken from each part in order.\n\n{combined}"
+        )}])
+
+    def _extract_once(self, text: str, schema_description: str, part: tuple = None) -> Dict[str, Any]:
+        part_note = ""
+        if part:
+            part_note = (f"\nThis text is part {part[0]} of {part[1]} of a longer document. "
+                         "Extract only what appears in this part; list every line item you see.\n")
+            if len(part) > 2 and part[2]:
+                part_note += f"Its first {part[2]} line(s) repeat the end of the previous part.\n"
         prompt = f"""Extract structured information from the following document text.
 
 Schema (return ONLY these fields as valid JSON):
@@ -61,16 +152,119 @@ RULES:
 - Do NOT hallucinate values. Only extract what is explicitly stated.
 - For prices, extract numeric values only (no currency symbols in number fields).
 - For dates, use YYYY-MM-DD format.
-
+{part_note}
 Document Text:
 {text}
 """
         messages = [{"role": "user", "content": prompt}]
-        response_str = self.chat(messages, json_mode=True)
+        response_str = self.complete(messages, json_mode=True)
         try:
             return json.loads(response_str)
         except json.JSONDecodeError:
             logger.error(f"Failed to parse JSON from LLM: {response_str[:200]}")
             return {"error": "Failed to parse structured data", "raw": response_str}
 
-llm_engine = LLMEngine()
+
+def _in_caller_context(fn):
+    """Wrap `fn` for a thread pool so each call runs with the caller's context (LLM lane)."""
+    ctx = contextvars.copy_context()
+    return lambda *args: ctx.copy().run(fn, *args)
+
+
+# ─── Chunking helpers ────────────────────────────────────────────────
+
+# Page breaks (form feed) first, then headings / numbered sections, then blank lines.
+_SECTION_BREAK = re.compile(r"\n(?=(?:#+ |\d+(?:\.\d+)*[.)]\s|[A-Z][A-Z0-9 &/-]{3,}:?\n))")
+
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text on page, then section, then paragraph boundaries into chunks <= max_chars."""
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for page in text.split("\f"):
+        if len(page) <= max_chars:
+            pieces.append(page)
+            continue
+        for section in _SECTION_BREAK.split(page):
+            if len(section) <= max_chars:
+                pieces.append(section)
+                continue
+            for para in section.split("\n\n"):
+                # Last resort: split very long paragraphs (e.g. one giant table block) at line
+                # ends, and mid-line only for a single line longer than the budget
+                while len(para) > max_chars:
+                    cut = para.rfind("\n", 0, max_chars) + 1 or max_chars
+                    pieces.append(para[:cut])
+                    para = para[cut:]
+                pieces.append(para)
+
+    # Pack consecutive pieces back together up to the budget
+    chunks, current = [], ""
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks or [text[:max_chars]]
+
+
+def with_overlap(chunks: List[str], lines: int) -> List[Tuple[str, int]]:
+    """
+    (chunk, repeated line count): every chunk after the first starts with the last `lines`
+    non-blank lines of the one before, so a row at a split is read whole by at least one chunk.
+    """
+    parts = [(chunks[0], 0)]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        tail = [line for line in previous.splitlines() if line.strip()][-lines:] if lines > 0 else []
+        parts.append(("\n".join(tail + [chunk]), len(tail)))
+    return parts
+
+
+def merge_extractions(partials: List[Dict[str, Any]], overlaps: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Reduce step for chunked extraction.
+    - List fields (e.g. line `items`) are concatenated in document order. `overlaps[i]` is the
+      number of lines chunk i repeats from chunk i-1 (see with_overlap): entries read from those
+      lines by both chunks are dropped once — at most one per repeated line, and only a run
+      that ends the previous chunk's list and starts this one. Identical lines elsewhere (the
+      same item for two delivery sites) are genuine and kept. A failed chunk (`error` key) is
+      skipped and nothing is dropped from the chunk after it.
+    - Scalar fields keep the first non-null value; `total` keeps the last one, since grand totals
+      are printed at the end of a document.
+    """
+    merged: Dict[str, Any] = {}
+    previous: Dict[str, List[Any]] = {}
+    for i, partial in enumerate(partials):
+        if "error" in partial:
+            previous = {}
+            continue
+        repeated = overlaps[i] if overlaps else 0
+        for key, value in partial.items():
+            if value is None or value == "":
+                continue
+            if isinstance(value, list):
+                seam = _seam_overlap(previous.get(key, []), value, repeated)
+                merged.setdefault(key, []).extend(value[seam:])
+                previous[key] = value
+            elif key == "total" or key not in merged:
+                merged[key] = value
+    return merged
+
+
+def _seam_overlap(before: List[Any], after: List[Any], limit: int) -> int:
+    """Length (at most `limit`) of the longest run that ends `before` and starts `after`."""
+    sig = lambda v: json.dumps(v, sort_keys=True, default=str)
+    tail, head = [sig(v) for v in before], [sig(v) for v in after]
+    for n in range(min(len(tail), len(head), limit), 0, -1):
+        if tail[-n:] == head[:n]:
+            return n
+    return 0
+
+llm_engine = LazySingleton("llm", LLMEngine)
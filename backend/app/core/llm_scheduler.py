@@ -0,0 +1,207 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+
+openai = lazy_import("openai")
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Priority lanes: lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_lane = contextvars.ContextVar("llm_lane", default=INTERACTIVE)
+
+
+class LLMError(RuntimeError):
+    """The provider could not be reached or kept failing after retries."""
+
+
+@contextmanager
+def llm_lane(priority: int):
+    """Run LLM calls made in this context (and threads started via asyncio.to_thread) in `priority`'s lane."""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> int:
+    return _lane.get()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+class LLMScheduler:
+    """
+    App-wide gate in front of the LLM provider:
+    - token bucket: LLM_RATE_PER_MINUTE requests, bursts up to LLM_BURST. The bucket is a
+      row in the shared SQLite file, so the limit holds across all worker processes
+    - at most LLM_MAX_IN_FLIGHT concurrent requests per process
+    - waiting callers are served by lane (interactive before background), then FIFO
+    - 429/5xx/connection errors are retried with exponential backoff and jitter; a 429
+      pauses the whole bucket so other callers (in every process) back off too
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiting: list = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = Counter()
+
+    # ─── Shared bucket ──────────────────────────────────────────────────
+    # Own connection in autocommit mode, so BEGIN IMMEDIATE makes each take atomic across
+    # processes; only used with self._cond held.
+
+    def _bucket(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
+            conn = sqlite3.connect(settings.DB_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_bucket (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    tokens REAL,
+                    updated REAL,
+                    paused_until REAL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO llm_bucket VALUES (1, ?, ?, 0)", (float(settings.LLM_BURST), time.time()))
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _refilled(tokens: float, updated: float, now: float) -> float:
+        rate = settings.LLM_RATE_PER_MINUTE / 60.0
+        return min(float(settings.LLM_BURST), tokens + max(now - updated, 0.0) * rate)
+
+    def _take_token(self) -> float:
+        """Take one token from the shared bucket: 0 when taken, else the seconds to wait."""
+        conn = self._bucket()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, updated, paused_until = conn.execute(
+                "SELECT tokens, updated, paused_until FROM llm_bucket WHERE id = 1"
+            ).fetchone()
+            now = time.time()
+            tokens = self._refilled(tokens, updated, now)
+            if now < paused_until:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens, wait = tokens - 1, 0.0
+            else:
+                wait = (1 - tokens) / (settings.LLM_RATE_PER_MINUTE / 60.0)
+            conn.execute("UPDATE llm_bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        """Block until this caller may send one request."""
+        ticket = (current_lane() if priority is None else priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket and self._in_flight < settings.LLM_MAX_IN_FLIGHT:
+                        timeout = self._take_token()
+                        if timeout <= 0:
+                            break
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self.stats["started"] += 1
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self._bucket().execute(
+                "UPDATE llm_bucket SET paused_until = MAX(paused_until, ?) WHERE id = 1", (time.time() + seconds,)
+            )
+            self._cond.notify_all()
+
+    def run(self, call: Callable[[], T], priority: Optional[int] = None) -> T:
+        """Execute `call` (one provider request) through the gate; raises LLMError when it gives up."""
+        attempt = 0
+        while True:
+            with self.slot(priority):
+                try:
+                    return call()
+                except Exception as e:
+                    error = e
+            if not _is_retryable(error) or attempt >= settings.LLM_MAX_RETRIES:
+                self.stats["failed"] += 1
+                raise LLMError(str(error)) from error
+
+            delay = _retry_after(error)
+            if delay is None:
+                delay = min(settings.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt, settings.LLM_BACKOFF_MAX_SECONDS)
+                delay *= random.uniform(0.5, 1.0)
+            if getattr(error, "status_code", None) == 429:
+                self.stats["rate_limited"] += 1
+                self.pause(delay)
+            self.stats["retried"] += 1
+            attempt += 1
+            logger.warning(f"LLM request failed ({error}); retry {attempt}/{settings.LLM_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def status(self) -> dict:
+        with self._cond:
+            tokens, updated, paused_until = self._bucket().execute(
+                "SELECT tokens, updated, paused_until FROM llm_bucket WHERE id = 1"
+            ).fetchone()
+            now = time.time()
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "waiting_interactive": sum(1 for p, _ in self._waiting if p == INTERACTIVE),
+                "tokens": round(self._refilled(tokens, updated, now), 2),
+                "paused_seconds": round(max(paused_until - now, 0.0), 1),
+                **self.stats,
+            }
+
+llm_scheduler = LLMScheduler()
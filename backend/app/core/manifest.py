@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+# Files still being written (uploads land as name + suffix, then are renamed); never ingested
+PARTIAL_SUFFIX = ".part"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _create_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processed_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            sha256 TEXT,
+            job_id INTEGER,
+            processed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_sha ON processed_files (sha256)")
+    conn.commit()
+
+
+def seed_from_quotes(conn) -> int:
+    """
+    One-time migration for databases from before the manifest: files that already have a
+    stored quote count as processed, so the first reconcile does not ingest them again.
+    Takes the raw connection because it runs inside MemoryManager's migrations.
+    """
+    _create_table(conn)
+    seeded = 0
+    for (path,) in conn.execute("SELECT DISTINCT file_path FROM quotes WHERE file_path IS NOT NULL").fetchall():
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+            sha = file_sha256(path)
+        except OSError:
+            continue  # moved or deleted since; nothing for reconcile to find
+        conn.execute(
+            "INSERT OR IGNORE INTO processed_files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, sha),
+        )
+        seeded += 1
+    conn.commit()
+    if seeded:
+        logger.info(f"Seeded the processed-files manifest with {seeded} previously ingested file(s)")
+    return seeded
+
+
+class ProcessedManifest:
+    """
+    Which files in the watched folders have been ingested: path, size, mtime and content hash.
+    At startup, reconcile() diffs the folders against it and queues only new or changed files,
+    so documents saved while the backend was down are not missed.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock
+        with self._lock:
+            _create_table(self.conn)
+
+    def record(self, path: str, job_id: Optional[int] = None, sha256: Optional[str] = None):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        sha256 = sha256 or file_sha256(path)
+        with self._lock:
+            self.conn.execute("""
+                INSERT INTO processed_files (path, size, mtime_ns, sha256, job_id) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,
+                    sha256 = excluded.sha256, job_id = excluded.job_id, processed_at = CURRENT_TIMESTAMP
+            """, (path, st.st_size, st.st_mtime_ns, sha256, job_id))
+            self.conn.commit()
+
+    @staticmethod
+    def _scan(folder: str) -> List[tuple]:
+        # scandir returns stat data with the listing, so the stat stage costs no extra syscalls on Windows
+        out = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIX):
+                        st = entry.stat()
+                        out.append((os.path.abspath(entry.path), st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        return out
+
+    def reconcile(self, folders: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Queue files in the watched folders that are not in the manifest, or changed since."""
+        from app.core.jobs import job_queue
+        start = time.perf_counter()
+        folders = folders or [settings.RFQ_DIR, settings.INBOX_DIR]
+        with ThreadPoolExecutor(max_workers=settings.RECONCILE_WORKERS) as pool:
+            files = [f for listing in pool.map(self._scan, folders) for f in listing]
+
+            known = {}
+            paths = [f[0] for f in files]
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT path, size, mtime_ns, sha256 FROM processed_files WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                known.update({r[0]: r[1:] for r in rows})
+
+            # Unchanged size+mtime: skip without reading. Everything else is hashed in parallel.
+            suspects = [f for f in files if known.get(f[0], (None, None))[:2] != (f[1], f[2])]
+            hashes = dict(zip((f[0] for f in suspects), pool.map(lambda f: _safe_hash(f[0]), suspects)))
+
+        queued, touched = [], 0
+        for path, size, mtime_ns in suspects:
+            sha = hashes.get(path)
+            if sha is None:
+                continue
+            same_path = known.get(path)
+            seen_elsewhere = self.conn.execute("SELECT 1 FROM processed_files WHERE sha256 = ? LIMIT 1", (sha,)).fetchone()
+            if (same_path and same_path[2] == sha) or (not same_path and seen_elsewhere):
+                # Touched or copied but identical content: refresh the manifest, do not reprocess
+                self.record(path, sha256=sha)
+                touched += 1
+                continue
+            queued.append({"file_path": path, "job_id": job_queue.enqueue(path, source="reconcile"),
+                           "reason": "changed" if same_path else "new"})
+
+        elapsed = round(time.perf_counter() - start, 2)
+        logger.info(f"Reconciled {len(files)} files in {elapsed}s: {len(queued)} queued, {touched} unchanged content, "
+                    f"{len(files) - len(suspects)} skipped by size/mtime")
+        return {"status": "success", "scanned": len(files), "hashed": len(suspects), "queued": queued,
+                "unchanged_content": touched, "duration_s": elapsed}
+
+
+def _safe_hash(path: str) -> Optional[str]:
+    try:
+        return file_sha256(path)
+    except OSError as e:
+        logger.warning(f"Could not hash {path}: {e}")
+        return None
+
+processed_manifest = LazySingleton("manifest", ProcessedManifest)
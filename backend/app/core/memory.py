@@ -1,19 +1,90 @@
 import sqlite3
-import chromadb
-from chromadb.config import Settings as ChromaSettings
 from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
 import json
 import os
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import List, Dict, Any, Optional
+
+chromadb = lazy_import("chromadb")
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever a data migration is added to MemoryManager._migrate
+SCHEMA_VERSION = 5
+
+_NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """A number as stored: numbers pass through, strings ("1,450.00", "Rs. 4", "4 weeks") give their first figure."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(value.replace(" ", "")) if isinstance(value, str) else None
+    if not match:
+        return None
+    try:
+        return float(match.group().replace(",", ""))
+    except ValueError:
+        return None
+
+
+# Vendor names compare case-insensitively, so "ACME" and "Acme" share one row
+_VENDOR_PERFORMANCE_DDL = """
+    CREATE TABLE IF NOT EXISTS vendor_performance (
+        vendor_name TEXT COLLATE NOCASE PRIMARY KEY,
+        avg_delay_days REAL,
+        quality_score REAL,
+        price_competitiveness REAL,
+        last_interaction TEXT,
+        quote_count INTEGER DEFAULT 0,
+        delivery_weeks_sum REAL DEFAULT 0,
+        delivery_weeks_n INTEGER DEFAULT 0,
+        avg_delivery_weeks REAL
+    )
+"""
+# One row per vendor, material and currency ('' when the quote named none); line_count is the
+# number of priced line items behind avg_price
+_VENDOR_MATERIAL_STATS_DDL = """
+    CREATE TABLE IF NOT EXISTS vendor_material_stats (
+        vendor_name TEXT COLLATE NOCASE,
+        material TEXT COLLATE NOCASE,
+        currency TEXT COLLATE NOCASE NOT NULL DEFAULT '',
+        line_count INTEGER DEFAULT 0,
+        price_sum REAL DEFAULT 0,
+        avg_price REAL,
+        last_price REAL,
+        last_date TEXT,
+        competitiveness REAL,
+        PRIMARY KEY (vendor_name, material, currency)
+    )
+"""
 
 class MemoryManager:
     def __init__(self):
         # Structured Memory (SQLite)
         os.makedirs(settings.MEMORY_DIR, exist_ok=True)
-        self.sqlite_conn = sqlite3.connect(settings.DB_PATH, check_same_thread=False)
+        self.sqlite_conn = sqlite3.connect(settings.DB_PATH, check_same_thread=False, timeout=30)
+        # WAL lets several worker processes read while one writes; writers wait instead of failing
+        self.sqlite_conn.execute("PRAGMA journal_mode=WAL")
+        self.sqlite_conn.execute("PRAGMA busy_timeout=30000")
+        # Every writer on sqlite_conn holds this (see transaction()); re-entrant for nested helpers
+        self.write_lock = threading.RLock()
         self._init_sqlite()
 
-        # Vector Memory (ChromaDB)
-        self.chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+        # Vector Memory (ChromaDB): a server when configured (multi-worker), else embedded
+        if settings.CHROMA_HOST:
+            self.chroma_client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+        else:
+            from app.core.leader import require_embedded_store
+            require_embedded_store()
+            self.chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
         self.collection = self.chroma_client.get_or_create_collection(name="procurement_docs")
 
     def _init_sqlite(self):
@@ -34,15 +105,9 @@ class MemoryManager:
                 raw_json TEXT
             )
         """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vendor_performance (
-                vendor_name TEXT PRIMARY KEY,
-                avg_delay_days REAL,
-                quality_score REAL,
-                price_competitiveness REAL,
-                last_interaction TEXT
-            )
-        """)
+        cursor.execute(_VENDOR_PERFORMANCE_DDL)
+        cursor.execute(_VENDOR_MATERIAL_STATS_DDL)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendor_material_stats_material ON vendor_material_stats (material)")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS personal_knowledge (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -52,19 +117,160 @@ class MemoryManager:
                 last_used TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS quote_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                quote_id INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+                line_no INTEGER,
+                vendor_name TEXT,
+                material TEXT,
+                qty REAL,
+                unit TEXT,
+                unit_price REAL,
+                total REAL,
+                currency TEXT DEFAULT '',
+                date TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_quote ON quote_items (quote_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_material ON quote_items (material COLLATE NOCASE, date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_vendor ON quote_items (vendor_name COLLATE NOCASE, material COLLATE NOCASE)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_material_price ON quote_items (material COLLATE NOCASE, unit_price)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_material_currency_price ON quote_items (material COLLATE NOCASE, currency COLLATE NOCASE, unit_price)")
         self.sqlite_conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """Run pending data migrations, tracked with SQLite's user_version pragma."""
+        version = self.sqlite_conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self.backfill_quote_items()
+        if version < 2:
+            self._add_columns("vendor_performance", {
+                "quote_count": "INTEGER DEFAULT 0",
+                "delivery_weeks_sum": "REAL DEFAULT 0",
+                "delivery_weeks_n": "INTEGER DEFAULT 0",
+                "avg_delivery_weeks": "REAL",
+            })
+            self.rebuild_vendor_aggregates()
+        if version < 3:
+            # Files ingested before the processed-files manifest existed must not be re-queued
+            from app.core.manifest import seed_from_quotes
+            seed_from_quotes(self.sqlite_conn)
+        if version < 4:
+            self._migrate_vendor_aggregates_v4()
+        if version < 5:
+            self._migrate_quote_items_v5()
+        if version < SCHEMA_VERSION:
+            self.sqlite_conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.sqlite_conn.commit()
+
+    def _migrate_vendor_aggregates_v4(self):
+        """Case-insensitive vendor_performance key and per-currency vendor_material_stats."""
+        conn = self.sqlite_conn
+        conn.execute("ALTER TABLE vendor_performance RENAME TO vendor_performance_v3")
+        conn.execute(_VENDOR_PERFORMANCE_DDL)
+        # "ACME" and "Acme" collapse into one row (the most active spelling); counts are rebuilt below
+        conn.execute("""
+            INSERT OR IGNORE INTO vendor_performance (vendor_name, avg_delay_days, quality_score, last_interaction)
+            SELECT vendor_name, avg_delay_days, quality_score, last_interaction FROM vendor_performance_v3
+            ORDER BY quote_count DESC
+        """)
+        conn.execute("DROP TABLE vendor_performance_v3")
+        # Derived data only: recreated with the currency column and rebuilt
+        conn.execute("DROP TABLE vendor_material_stats")
+        conn.execute(_VENDOR_MATERIAL_STATS_DDL)
+        conn.commit()
+        self.rebuild_vendor_aggregates()
+
+    def _migrate_quote_items_v5(self):
+        """Numbers stored as text are parsed, a missing currency becomes '' and the stats are rebuilt."""
+        conn = self.sqlite_conn
+        for table, key, columns in (("quote_items", "id", ("qty", "unit_price", "total")),
+                                    ("quotes", "id", ("qty", "unit_price", "total", "delivery_weeks"))):
+            for column in columns:
+                rows = conn.execute(f"SELECT {key}, {column} FROM {table} WHERE typeof({column}) = 'text'").fetchall()
+                conn.executemany(f"UPDATE {table} SET {column} = ? WHERE {key} = ?",
+                                 [(parse_number(value), row_id) for row_id, value in rows])
+        conn.execute("UPDATE quote_items SET currency = '' WHERE currency IS NULL")
+        conn.execute("DROP TABLE vendor_material_stats")
+        conn.execute(_VENDOR_MATERIAL_STATS_DDL)
+        conn.commit()
+        self.rebuild_vendor_aggregates()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Write through the shared connection as one unit. Worker threads share sqlite_conn, so
+        a commit() from one of them would also commit another's half-finished writes: every
+        writer holds write_lock, and a failure rolls back only its own statements.
+        """
+        with self.write_lock:
+            try:
+                yield self.sqlite_conn.cursor()
+            except BaseException:
+                self.sqlite_conn.rollback()
+                raise
+            self.sqlite_conn.commit()
+
+    def _add_columns(self, table: str, columns: Dict[str, str]):
+        with self.transaction():
+            existing = {row[1] for row in self.sqlite_conn.execute(f"PRAGMA table_info({table})")}
+            for name, decl in columns.items():
+                if name not in existing:
+                    self.sqlite_conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+    def backfill_quote_items(self, batch_size: int = 500) -> int:
+        """Populate quote_items from quotes.raw_json for quotes that have no line items yet."""
+        cursor = self.sqlite_conn.cursor()
+        last_id, filled = 0, 0
+        while True:
+            cursor.execute("""
+                SELECT q.id, q.raw_json FROM quotes q
+                WHERE q.id > ? AND NOT EXISTS (SELECT 1 FROM quote_items i WHERE i.quote_id = q.id)
+                ORDER BY q.id LIMIT ?
+            """, (last_id, batch_size))
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            rows = []
+            for quote_id, raw in batch:
+                try:
+                    data = json.loads(raw) if raw else {}
+                except json.JSONDecodeError:
+                    continue
+                rows.extend(self._item_rows(quote_id, data))
+            with self.transaction() as writer:
+                writer.executemany(self._INSERT_ITEM_SQL, rows)
+            filled += len(batch)
+            last_id = batch[-1][0]
+        if filled:
+            logger.info(f"Backfilled line items for {filled} quotes")
+        return filled
+
+    _INSERT_ITEM_SQL = """
+        INSERT INTO quote_items (quote_id, line_no, vendor_name, material, qty, unit, unit_price, total, currency, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    @staticmethod
+    def _item_rows(quote_id: int, data: dict) -> List[tuple]:
+        """Line-item rows for a quote; single-item quotes become one row from the headline fields."""
+        items = [i for i in (data.get('items') or []) if isinstance(i, dict) and i.get('material')]
+        if not items and data.get('material'):
+            items = [data]
+        # Numbers the LLM returned as strings are parsed; no currency is stored as '' so the
+        # (material, currency, unit_price) index serves the median lookups
+        return [(
+            quote_id, n, data.get('vendor_name'), item.get('material'), parse_number(item.get('qty')), item.get('unit'),
+            parse_number(item.get('unit_price')), parse_number(item.get('total')), data.get('currency') or '', data.get('date')
+        ) for n, item in enumerate(items, start=1)]
 
     def store_learned_fact(self, category: str, fact: str):
         """Stores a learned pattern, user preference, or discovered file location."""
-        cursor = self.sqlite_conn.cursor()
-        # Check if fact already exists to increment usage
-        cursor.execute("SELECT id, usage_count FROM personal_knowledge WHERE fact = ?", (fact,))
-        row = cursor.fetchone()
-        if row:
-            cursor.execute("UPDATE personal_knowledge SET usage_count = usage_count + 1, last_used = CURRENT_TIMESTAMP WHERE id = ?", (row[0],))
-        else:
-            cursor.execute("INSERT INTO personal_knowledge (category, fact) VALUES (?, ?)", (category, fact))
-        self.sqlite_conn.commit()
+        # Goes through the knowledge index so the fact is embedded and paraphrases are merged
+        from app.core.knowledge import knowledge_index
+        return knowledge_index.add(category, fact)
 
     def get_learned_facts(self, category: str = None, limit: int = 10) -> List[str]:
         cursor = self.sqlite_conn.cursor()
@@ -75,28 +281,248 @@ class MemoryManager:
         return [row[0] for row in cursor.fetchall()]
 
     def store_quote(self, data: dict):
-        cursor = self.sqlite_conn.cursor()
-        cursor.execute("""
-            INSERT INTO quotes (vendor_name, material, unit_price, qty, total, currency, delivery_weeks, payment_terms, date, file_path, raw_json)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get('vendor_name'), data.get('material'), data.get('unit_price'),
-            data.get('qty'), data.get('total'), data.get('currency'),
-            data.get('delivery_weeks'), data.get('payment_terms'), data.get('date'),
-            data.get('file_path'), json.dumps(data)
-        ))
-        self.sqlite_conn.commit()
-        
+        # Quote, line items and aggregates land together or not at all
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO quotes (vendor_name, material, unit_price, qty, total, currency, delivery_weeks, payment_terms, date, file_path, raw_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data.get('vendor_name'), data.get('material'), parse_number(data.get('unit_price')),
+                parse_number(data.get('qty')), parse_number(data.get('total')), data.get('currency'),
+                parse_number(data.get('delivery_weeks')), data.get('payment_terms'), data.get('date'),
+                data.get('file_path'), json.dumps(data)
+            ))
+            quote_id = cursor.lastrowid
+            item_rows = self._item_rows(quote_id, data)
+            cursor.executemany(self._INSERT_ITEM_SQL, item_rows)
+            self._update_vendor_aggregates(cursor, data, item_rows)
+
+
         # Also store in vector DB for semantic search
         self.collection.add(
             documents=[json.dumps(data)],
-            metadatas=[{"vendor": data.get('vendor_name'), "material": data.get('material')}],
-            ids=[f"quote_{cursor.lastrowid}"]
+            # Chroma rejects None metadata values
+            metadatas=[{"vendor": data.get('vendor_name') or "", "material": data.get('material') or ""}],
+            ids=[f"quote_{quote_id}"]
         )
+        from app.core.events import event_bus
+        event_bus.publish("quote", **self.quote_row(quote_id))
+        return quote_id
+
+    def quote_row(self, quote_id: int) -> Dict[str, Any]:
+        """A quotes row as /quotes lists it, without the raw_json payload."""
+        cursor = self.sqlite_conn.execute("SELECT * FROM quotes WHERE id = ?", (quote_id,))
+        columns = [col[0] for col in cursor.description]
+        row = cursor.fetchone()
+        return {k: v for k, v in zip(columns, row or ()) if k != "raw_json"}
+
+    # ─── Vendor aggregates ──────────────────────────────────────────────
+    # vendor_performance and vendor_material_stats are maintained incrementally by
+    # store_quote, so /vendors is a plain read. Vendor names compare case-insensitively in
+    # both tables. Prices are only compared within one currency: price_competitiveness is
+    # the (material, currency) median divided by the vendor's average unit price there
+    # (> 1 means cheaper than typical), averaged over the vendor's materials and currencies.
+
+    def _update_vendor_aggregates(self, cursor, data: dict, item_rows: List[tuple]):
+        vendor = data.get('vendor_name')
+        if not vendor:
+            return
+        interaction = data.get('date') or date.today().isoformat()
+        delivery = parse_number(data.get('delivery_weeks'))
+        has_delivery = delivery is not None
+        cursor.execute("""
+            INSERT INTO vendor_performance (vendor_name, quote_count, delivery_weeks_sum, delivery_weeks_n, avg_delivery_weeks, last_interaction)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT(vendor_name) DO UPDATE SET
+                quote_count = COALESCE(quote_count, 0) + 1,
+                delivery_weeks_sum = COALESCE(delivery_weeks_sum, 0) + excluded.delivery_weeks_sum,
+                delivery_weeks_n = COALESCE(delivery_weeks_n, 0) + excluded.delivery_weeks_n,
+                avg_delivery_weeks = CASE
+                    WHEN COALESCE(delivery_weeks_n, 0) + excluded.delivery_weeks_n = 0 THEN NULL
+                    ELSE (COALESCE(delivery_weeks_sum, 0) + excluded.delivery_weeks_sum) * 1.0
+                         / (COALESCE(delivery_weeks_n, 0) + excluded.delivery_weeks_n)
+                END,
+                last_interaction = MAX(COALESCE(last_interaction, ''), excluded.last_interaction)
+        """, (vendor, delivery if has_delivery else 0, 1 if has_delivery else 0,
+              delivery if has_delivery else None, interaction))
+
+        groups = set()
+        for row in item_rows:
+            material, unit_price, currency = row[3], row[6], row[8]
+            if not material or unit_price is None:
+                continue
+            groups.add((material, currency))
+            cursor.execute("""
+                INSERT INTO vendor_material_stats (vendor_name, material, currency, line_count, price_sum, avg_price, last_price, last_date)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT(vendor_name, material, currency) DO UPDATE SET
+                    line_count = line_count + 1,
+                    price_sum = price_sum + excluded.price_sum,
+                    avg_price = (price_sum + excluded.price_sum) / (line_count + 1),
+                    last_price = CASE WHEN COALESCE(excluded.last_date, '') >= COALESCE(last_date, '') THEN excluded.last_price ELSE last_price END,
+                    last_date = NULLIF(MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, '')), '')
+            """, (vendor, material, currency, unit_price, unit_price, unit_price, row[9]))
+
+        # A new price moves the material median, which re-rates every vendor of that material
+        for material, currency in groups:
+            self._refresh_material_competitiveness(cursor, material, currency)
+
+    @staticmethod
+    def _material_median(cursor, material: str, currency: str = '') -> Optional[float]:
+        """Median unit price of a material in one currency, read through the (material, currency, unit_price) index."""
+        cursor.execute("""
+            SELECT COUNT(*) FROM quote_items
+            WHERE material = ? COLLATE NOCASE AND currency = ? COLLATE NOCASE AND unit_price IS NOT NULL
+        """, (material, currency))
+        n = cursor.fetchone()[0]
+        if n == 0:
+            return None
+        cursor.execute("""
+            SELECT unit_price FROM quote_items
+            WHERE material = ? COLLATE NOCASE AND currency = ? COLLATE NOCASE AND unit_price IS NOT NULL
+            ORDER BY unit_price LIMIT ? OFFSET ?
+        """, (material, currency, 2 - n % 2, (n - 1) // 2))
+        middle = [r[0] for r in cursor.fetchall()]
+        return sum(middle) / len(middle)
+
+    def _refresh_material_competitiveness(self, cursor, material: str, currency: str = ''):
+        median = self._material_median(cursor, material, currency)
+        if not median:
+            return
+        cursor.execute("""
+            UPDATE vendor_material_stats
+            SET competitiveness = CASE WHEN avg_price > 0 THEN ? / avg_price END
+            WHERE material = ? AND currency = ?
+        """, (median, material, currency))
+        cursor.execute("""
+            UPDATE vendor_performance SET price_competitiveness = (
+                SELECT AVG(competitiveness) FROM vendor_material_stats s
+                WHERE s.vendor_name = vendor_performance.vendor_name
+            )
+            WHERE vendor_name IN (SELECT vendor_name FROM vendor_material_stats WHERE material = ? AND currency = ?)
+        """, (material, currency))
+
+    def rebuild_vendor_aggregates(self) -> int:
+        """Recompute all vendor aggregates from quotes/quote_items (backfills and repairs)."""
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM vendor_material_stats")
+            cursor.execute("""
+                UPDATE vendor_performance SET quote_count = 0, delivery_weeks_sum = 0, delivery_weeks_n = 0,
+                    avg_delivery_weeks = NULL, price_competitiveness = NULL
+            """)
+            cursor.execute("""
+                INSERT INTO vendor_performance (vendor_name, quote_count, delivery_weeks_sum, delivery_weeks_n, avg_delivery_weeks, last_interaction)
+                SELECT vendor_name, COUNT(*), COALESCE(SUM(delivery_weeks), 0), COUNT(delivery_weeks), AVG(delivery_weeks), MAX(date)
+                FROM quotes WHERE vendor_name IS NOT NULL GROUP BY vendor_name COLLATE NOCASE
+                ON CONFLICT(vendor_name) DO UPDATE SET
+                    quote_count = excluded.quote_count,
+                    delivery_weeks_sum = excluded.delivery_weeks_sum,
+                    delivery_weeks_n = excluded.delivery_weeks_n,
+                    avg_delivery_weeks = excluded.avg_delivery_weeks,
+                    last_interaction = COALESCE(excluded.last_interaction, last_interaction)
+            """)
+            cursor.execute("""
+                INSERT INTO vendor_material_stats (vendor_name, material, currency, line_count, price_sum, avg_price, last_price, last_date)
+                SELECT f.vendor_name, f.material, COALESCE(f.currency, ''), g.line_count, g.price_sum, g.avg_price, g.last_price, g.last_date
+                FROM (
+                    SELECT MIN(id) AS first_id, COUNT(*) AS line_count, SUM(unit_price) AS price_sum, AVG(unit_price) AS avg_price,
+                           (SELECT unit_price FROM quote_items j
+                            WHERE j.vendor_name = i.vendor_name COLLATE NOCASE AND j.material = i.material COLLATE NOCASE
+                              AND COALESCE(j.currency, '') = COALESCE(i.currency, '') COLLATE NOCASE AND j.unit_price IS NOT NULL
+                            ORDER BY j.date DESC, j.id DESC LIMIT 1) AS last_price,
+                           MAX(date) AS last_date
+                    FROM quote_items i
+                    WHERE vendor_name IS NOT NULL AND material IS NOT NULL AND unit_price IS NOT NULL
+                    GROUP BY vendor_name COLLATE NOCASE, material COLLATE NOCASE, COALESCE(currency, '') COLLATE NOCASE
+                ) g
+                -- Names are spelled as on the group's first line, as the incremental upsert keeps them
+                JOIN quote_items f ON f.id = g.first_id
+            """)
+            cursor.execute("SELECT DISTINCT material, currency FROM vendor_material_stats")
+            for material, currency in cursor.fetchall():
+                self._refresh_material_competitiveness(cursor, material, currency)
+            cursor.execute("SELECT COUNT(*) FROM vendor_performance")
+            return cursor.fetchone()[0]
+
+    def get_vendor_performance(self) -> List[Dict[str, Any]]:
+        cursor = self.sqlite_conn.cursor()
+        cursor.execute("""
+            SELECT vendor_name, quote_count, avg_delivery_weeks, price_competitiveness, last_interaction,
+                   avg_delay_days, quality_score
+            FROM vendor_performance ORDER BY quote_count DESC, vendor_name
+        """)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_quote(self, quote_id: int) -> Optional[Dict[str, Any]]:
+        """The stored extraction (raw_json) of a quote, with its id."""
+        row = self.sqlite_conn.execute("SELECT raw_json FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+        if not row or not row[0]:
+            return None
+        return {**json.loads(row[0]), "id": quote_id}
+
+    def get_quote_items(self, quote_id: int) -> List[Dict[str, Any]]:
+        cursor = self.sqlite_conn.cursor()
+        cursor.execute("SELECT * FROM quote_items WHERE quote_id = ? ORDER BY line_no", (quote_id,))
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_price_history(self, material: str, vendor: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Line-item price history for a material (optionally one vendor), newest first. Served by the material/vendor indexes."""
+        cursor = self.sqlite_conn.cursor()
+        sql = "SELECT * FROM quote_items WHERE material = ? COLLATE NOCASE"
+        params: list = [material]
+        if vendor:
+            sql += " AND vendor_name = ? COLLATE NOCASE"
+            params.append(vendor)
+        sql += " ORDER BY date DESC, id DESC LIMIT ?"
+        params.append(limit)
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def vendors_for_materials(self, materials: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Vendors that have quoted any of the given materials, with their latest quote per material.
+        Returns {vendor_name: {"materials": {material: {unit_price, currency, date}}}}.
+        """
+        cursor = self.sqlite_conn.cursor()
+        vendors: Dict[str, Dict[str, Any]] = {}
+        for material in materials:
+            cursor.execute("""
+                SELECT vendor_name, unit_price, currency, date FROM quote_items
+                WHERE material = ? COLLATE NOCASE AND vendor_name IS NOT NULL
+                ORDER BY date DESC, id DESC
+            """, (material,))
+            for vendor_name, unit_price, currency, date in cursor.fetchall():
+                quoted = vendors.setdefault(vendor_name, {"materials": {}})["materials"]
+                quoted.setdefault(material, {"unit_price": unit_price, "currency": currency, "date": date})
+        return vendors
+
+    def vendor_emails(self, vendor_names: List[str]) -> Dict[str, str]:
+        """Latest e-mail address extracted from each vendor's quotes, for vendors that have one."""
+        emails = {}
+        for name in vendor_names:
+            row = self.sqlite_conn.execute("""
+                SELECT json_extract(raw_json, '$.vendor_email') FROM quotes
+                WHERE vendor_name = ? COLLATE NOCASE AND COALESCE(json_extract(raw_json, '$.vendor_email'), '') != ''
+                ORDER BY id DESC LIMIT 1
+            """, (name,)).fetchone()
+            if row:
+                emails[name] = row[0]
+        return emails
 
     def search_history(self, query: str, limit: int = 5):
         # Semantic search in ChromaDB
         results = self.collection.query(query_texts=[query], n_results=limit)
         return results['documents']
 
-memory_manager = MemoryManager()
+memory_manager = LazySingleton("memory", MemoryManager)
+
+if __name__ == "__main__":
+    # Maintenance commands: python -m app.core.memory rebuild-vendors
+    import sys
+    if sys.argv[1:] == ["rebuild-vendors"]:
+        print(f"Rebuilt aggregates for {memory_manager.rebuild_vendor_aggregates()} vendors")
+    else:
+        print("Usage: python -m app.core.memory rebuild-vendors")
@@ -0,0 +1,234 @@
+import bisect
+import logging
+import math
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager, parse_number
+
+logger = logging.getLogger(__name__)
+
+
+class PriceIndex:
+    """
+    Per-material unit-price index, in the base currency.
+    - material_price_buckets: monthly count/sum/sum-of-squares/min/max, persisted in SQLite
+      and upserted on every insert. Z-scores come from the last PRICE_ZSCORE_MONTHS buckets.
+    - An in-memory sorted window of the most recent prices per material gives percentiles
+      by binary search.
+    Assessing a new price costs a bounded number of index reads, independent of history size.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        # material key -> (sorted prices, prices in insertion order); LRU-bounded
+        self._windows: "OrderedDict[str, tuple]" = OrderedDict()
+        # Highest quote_items id the windows reflect; other workers may insert behind our back
+        self._seen_item_id = 0
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS material_price_buckets (
+                    material TEXT COLLATE NOCASE,
+                    bucket TEXT,
+                    n INTEGER DEFAULT 0,
+                    total REAL DEFAULT 0,
+                    total_sq REAL DEFAULT 0,
+                    min_price REAL,
+                    max_price REAL,
+                    PRIMARY KEY (material, bucket)
+                )
+            """)
+            self.conn.commit()
+        empty = self.conn.execute("SELECT 1 FROM material_price_buckets LIMIT 1").fetchone() is None
+        has_items = self.conn.execute("SELECT 1 FROM quote_items WHERE unit_price IS NOT NULL LIMIT 1").fetchone() is not None
+        if empty and has_items:
+            self.rebuild()
+
+    # ─── Normalization ──────────────────────────────────────────────────
+
+    @staticmethod
+    def to_base(price: Optional[float], currency: Optional[str]) -> Optional[float]:
+        """Convert a unit price to BASE_CURRENCY using FX_RATES; None if the rate is unknown."""
+        price = parse_number(price)
+        if price is None:
+            return None
+        code = (currency or settings.BASE_CURRENCY).strip().upper()
+        code = _CURRENCY_ALIASES.get(code, code)
+        if code == settings.BASE_CURRENCY:
+            return float(price)
+        rate = settings.FX_RATES.get(code)
+        return float(price) * rate if rate else None
+
+    @staticmethod
+    def _key(material: str) -> str:
+        return " ".join(material.lower().split())
+
+    @staticmethod
+    def _bucket(day: Optional[str]) -> str:
+        return (day or date.today().isoformat())[:7]
+
+    # ─── Window (percentiles) ───────────────────────────────────────────
+
+    def _drop_stale_windows(self):
+        # Only the ingestion leader records prices in-process; any other worker reloads
+        # its windows when quote_items has grown since they were loaded.
+        from app.core.leader import is_leader
+        if is_leader():
+            return
+        latest = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM quote_items").fetchone()[0]
+        if latest != self._seen_item_id:
+            self._windows.clear()
+            self._seen_item_id = latest
+
+    def _window(self, material: str) -> tuple:
+        key = self._key(material)
+        window = self._windows.get(key)
+        if window is None:
+            rows = self.conn.execute("""
+                SELECT unit_price, currency FROM quote_items
+                WHERE material = ? COLLATE NOCASE AND unit_price IS NOT NULL
+                ORDER BY date DESC, id DESC LIMIT ?
+            """, (material, settings.PRICE_WINDOW)).fetchall()
+            recent = [p for p in (self.to_base(price, cur) for price, cur in reversed(rows)) if p is not None]
+            window = (sorted(recent), recent)
+            self._windows[key] = window
+            while len(self._windows) > settings.PRICE_INDEX_CACHE_MATERIALS:
+                self._windows.popitem(last=False)
+        self._windows.move_to_end(key)
+        return window
+
+    # ─── Assess / record ────────────────────────────────────────────────
+
+    def assess(self, material: str, unit_price: float, currency: Optional[str] = None) -> Dict[str, Any]:
+        """Percentile and z-score of a price against the material's history (excluding itself)."""
+        price = self.to_base(unit_price, currency)
+        if not material or price is None:
+            return {"material": material, "flag": "unknown", "reason": "missing price or unknown currency"}
+
+        months = [
+            f"{y:04d}-{m:02d}" for y, m in _recent_months(settings.PRICE_ZSCORE_MONTHS)
+        ]
+        placeholders = ",".join("?" * len(months))
+        n, total, total_sq = self.conn.execute(f"""
+            SELECT COALESCE(SUM(n), 0), COALESCE(SUM(total), 0), COALESCE(SUM(total_sq), 0)
+            FROM material_price_buckets WHERE material = ? AND bucket IN ({placeholders})
+        """, (material, *months)).fetchone()
+
+        with self._lock:
+            self._drop_stale_windows()
+            ordered, _ = self._window(material)
+            count = len(ordered)
+            percentile = None
+            if count:
+                below = bisect.bisect_left(ordered, price)
+                equal = bisect.bisect_right(ordered, price) - below
+                percentile = round(100.0 * (below + 0.5 * equal) / count, 1)
+            median = ordered[count // 2] if count else None
+
+        zscore = None
+        if n >= 2:
+            mean = total / n
+            variance = max(total_sq / n - mean * mean, 0.0)
+            std = math.sqrt(variance)
+            zscore = round((price - mean) / std, 2) if std > 0 else 0.0
+
+        if count < settings.PRICE_MIN_HISTORY:
+            flag = "insufficient_history"
+        elif (percentile is not None and percentile >= 90) or (zscore is not None and zscore >= 2):
+            flag = "high"
+        elif (percentile is not None and percentile <= 10) or (zscore is not None and zscore <= -2):
+            flag = "low"
+        else:
+            flag = "normal"
+
+        return {
+            "material": material,
+            "unit_price_base": round(price, 4),
+            "base_currency": settings.BASE_CURRENCY,
+            "percentile": percentile,
+            "zscore": zscore,
+            "median_base": median,
+            "history_count": count,
+            "flag": flag,
+        }
+
+    def record(self, material: str, unit_price: float, currency: Optional[str] = None, day: Optional[str] = None):
+        """Add a stored price to the bucket table and the in-memory window."""
+        price = self.to_base(unit_price, currency)
+        if not material or price is None:
+            return
+        with self._lock:
+            self.conn.execute("""
+                INSERT INTO material_price_buckets (material, bucket, n, total, total_sq, min_price, max_price)
+                VALUES (?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT(material, bucket) DO UPDATE SET
+                    n = n + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq,
+                    min_price = MIN(min_price, excluded.min_price), max_price = MAX(max_price, excluded.max_price)
+            """, (material, self._bucket(day), price, price * price, price, price))
+            self.conn.commit()
+
+        # Uncached windows are loaded from quote_items later, which already holds this price
+        with self._lock:
+            window = self._windows.get(self._key(material))
+            if window is None:
+                return
+            ordered, recent = window
+            bisect.insort(ordered, price)
+            recent.append(price)
+            if len(recent) > settings.PRICE_WINDOW:
+                oldest = recent.pop(0)
+                del ordered[bisect.bisect_left(ordered, oldest)]
+
+    def assess_items(self, items: List[Dict[str, Any]], currency: Optional[str]) -> List[Dict[str, Any]]:
+        return [self.assess(i.get("material"), i.get("unit_price"), currency) for i in items]
+
+    def record_items(self, items: List[Dict[str, Any]], currency: Optional[str], day: Optional[str]):
+        for i in items:
+            self.record(i.get("material"), i.get("unit_price"), currency, day)
+
+    def rebuild(self):
+        """Recompute all buckets from quote_items (after FX rate changes or backfills)."""
+        with self._lock:
+            self._windows.clear()
+            self.conn.execute("DELETE FROM material_price_buckets")
+            rows = self.conn.execute(
+                "SELECT material, unit_price, currency, date FROM quote_items WHERE material IS NOT NULL AND unit_price IS NOT NULL"
+            ).fetchall()
+            buckets: Dict[tuple, list] = {}
+            for material, unit_price, currency, day in rows:
+                price = self.to_base(unit_price, currency)
+                if price is None:
+                    continue
+                b = buckets.setdefault((self._key(material), self._bucket(day)), [material, 0, 0.0, 0.0, price, price])
+                b[1] += 1
+                b[2] += price
+                b[3] += price * price
+                b[4] = min(b[4], price)
+                b[5] = max(b[5], price)
+            self.conn.executemany("""
+                INSERT INTO material_price_buckets (material, bucket, n, total, total_sq, min_price, max_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(b[0], bucket, b[1], b[2], b[3], b[4], b[5]) for (_, bucket), b in buckets.items()])
+            self.conn.commit()
+        logger.info(f"Rebuilt price index: {len(buckets)} material-month buckets")
+
+
+_CURRENCY_ALIASES = {"RS": "INR", "RS.": "INR", "₹": "INR", "$": "USD", "US$": "USD", "€": "EUR", "£": "GBP"}
+
+
+def _recent_months(count: int) -> List[tuple]:
+    today = date.today()
+    y, m = today.year, today.month
+    months = []
+    for _ in range(count):
+        months.append((y, m))
+        m -= 1
+        if m == 0:
+            y, m = y - 1, 12
+    return months
+
+price_index = LazySingleton("price_index", PriceIndex)
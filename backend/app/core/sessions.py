@@ -0,0 +1,196 @@
+import json
+import logging
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton
+from app.core.llm import llm_engine, LLMError
+from app.core.llm_scheduler import BACKGROUND
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+# Fields of the per-session "current context", updated as tools run
+CONTEXT_FIELDS = ("last_path", "last_file", "last_search_terms", "last_search_results", "pending_organize_plan")
+
+
+class ChatSessions:
+    """
+    Server-side /chat conversations. Each session keeps its turns, a rolling summary of
+    the turns that have scrolled out of the prompt window, and a small "current context"
+    (last path, last file, last search results) written when tools run. A turn sends only
+    the new message; the prompt is the summary, the context and the recent turns.
+    Older turns are folded into the summary SESSION_SUMMARY_BATCH at a time, in the
+    background LLM lane, so each turn is summarized once, and then deleted. Sessions idle
+    for SESSION_RETAIN_DAYS are deleted whenever a new one is created.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        self._compacting = set()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    id TEXT PRIMARY KEY,
+                    summary TEXT DEFAULT '',
+                    summarized_upto INTEGER DEFAULT 0,
+                    context TEXT DEFAULT '{}',
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    role TEXT,
+                    content TEXT,
+                    created_at REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_session ON chat_turns (session_id, id)")
+            if "folded_turns" not in {row[1] for row in self.conn.execute("PRAGMA table_info(chat_sessions)")}:
+                self.conn.execute("ALTER TABLE chat_sessions ADD COLUMN folded_turns INTEGER DEFAULT 0")
+            self.conn.commit()
+
+    # ─── Sessions ───────────────────────────────────────────────────────
+
+    def create(self, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """New session; `history` (from clients that still send it) is imported once."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self.prune()
+        with self._lock:
+            self.conn.execute("INSERT INTO chat_sessions (id, created_at, updated_at) VALUES (?, ?, ?)", (session_id, now, now))
+            self.conn.executemany(
+                "INSERT INTO chat_turns (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                [(session_id, h["role"], h["content"], now) for h in (history or [])[-(settings.SESSION_RECENT_TURNS + settings.SESSION_SUMMARY_BATCH):]
+                 if h.get("role") in ("user", "assistant") and h.get("content")],
+            )
+            self.conn.commit()
+        return session_id
+
+    def prune(self, max_age_days: Optional[float] = None) -> int:
+        """Delete sessions (and their turns) not used for max_age_days."""
+        cutoff = time.time() - (settings.SESSION_RETAIN_DAYS if max_age_days is None else max_age_days) * 86400
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM chat_turns WHERE session_id IN (SELECT id FROM chat_sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            removed = self.conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            self.conn.commit()
+        if removed:
+            logger.info(f"Pruned {removed} idle chat session(s)")
+        return removed
+
+    def exists(self, session_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM chat_sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT summary, summarized_upto, context, created_at, updated_at, folded_turns FROM chat_sessions WHERE id = ?",
+            (session_id,),
+        ).fetchone()
+        if not row:
+            return None
+        summary, _, context, created, updated, folded = row
+        total = (folded or 0) + self.conn.execute("SELECT COUNT(*) FROM chat_turns WHERE session_id = ?", (session_id,)).fetchone()[0]
+        return {"id": session_id, "summary": summary, "context": json.loads(context or "{}"),
+                "recent_turns": self.prompt_state(session_id)[2], "total_turns": total,
+                "created_at": created, "updated_at": updated}
+
+    # ─── Per turn ───────────────────────────────────────────────────────
+
+    def prompt_state(self, session_id: str) -> Tuple[str, Dict[str, Any], List[Dict[str, str]]]:
+        """(rolling summary, current context, turns not yet summarized) — what a prompt needs."""
+        row = self.conn.execute(
+            "SELECT summary, summarized_upto, context FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if not row:
+            return "", {}, []
+        summary, upto, context = row
+        # Bounded even when compaction lags behind (e.g. the LLM is unavailable)
+        limit = settings.SESSION_RECENT_TURNS + settings.SESSION_SUMMARY_BATCH
+        turns = self.conn.execute(
+            "SELECT role, content FROM chat_turns WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+            (session_id, upto, limit),
+        ).fetchall()
+        return summary or "", json.loads(context or "{}"), [{"role": r, "content": c} for r, c in reversed(turns)]
+
+    def append(self, session_id: str, role: str, content: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO chat_turns (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, now),
+            )
+            self.conn.execute("UPDATE chat_sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+            self.conn.commit()
+
+    def update_context(self, session_id: str, **fields):
+        """Merge `fields` into the session context; a field given as None is cleared."""
+        fields = {k: v for k, v in fields.items() if k in CONTEXT_FIELDS}
+        if not fields:
+            return
+        with self._lock:
+            row = self.conn.execute("SELECT context FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+            if not row:
+                return
+            context = {k: v for k, v in {**json.loads(row[0] or "{}"), **fields}.items() if v is not None}
+            self.conn.execute("UPDATE chat_sessions SET context = ? WHERE id = ?", (json.dumps(context), session_id))
+            self.conn.commit()
+
+    # ─── Rolling summary ────────────────────────────────────────────────
+
+    def compact(self, session_id: str) -> bool:
+        """Fold the oldest unsummarized turns into the summary once a full batch has scrolled out."""
+        with self._lock:
+            if session_id in self._compacting:
+                return False
+            self._compacting.add(session_id)
+        try:
+            row = self.conn.execute(
+                "SELECT summary, summarized_upto FROM chat_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if not row:
+                return False
+            summary, upto = row
+            turns = self.conn.execute(
+                "SELECT id, role, content FROM chat_turns WHERE session_id = ? AND id > ? ORDER BY id",
+                (session_id, upto),
+            ).fetchall()
+            if len(turns) < settings.SESSION_RECENT_TURNS + settings.SESSION_SUMMARY_BATCH:
+                return False
+            fold = turns[:len(turns) - settings.SESSION_RECENT_TURNS]
+            transcript = "\n".join(f"{role.upper()}: {content[:2000]}" for _, role, content in fold)
+            prompt = (
+                "Update the running summary of a conversation between a user and their computer/procurement "
+                "assistant with the new turns below. Keep file paths, file names, vendors, figures, decisions "
+                "and open requests; drop pleasantries. At most 200 words.\n\n"
+                f"CURRENT SUMMARY:\n{summary or '(none yet)'}\n\nNEW TURNS:\n{transcript}"
+            )
+            try:
+                updated = llm_engine.complete([{"role": "user", "content": prompt}], priority=BACKGROUND)
+            except LLMError as e:
+                # Turns stay unsummarized and are retried after the next reply
+                logger.warning(f"Session summary deferred: {e}")
+                return False
+            with self._lock:
+                applied = self.conn.execute(
+                    "UPDATE chat_sessions SET summary = ?, summarized_upto = ?, folded_turns = COALESCE(folded_turns, 0) + ? "
+                    "WHERE id = ? AND summarized_upto = ?",
+                    (updated.strip(), fold[-1][0], len(fold), session_id, upto),
+                ).rowcount
+                if applied:
+                    # Now part of the summary; never read again
+                    self.conn.execute("DELETE FROM chat_turns WHERE session_id = ? AND id <= ?", (session_id, fold[-1][0]))
+                self.conn.commit()
+            return True
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+chat_sessions = LazySingleton("sessions", ChatSessions)
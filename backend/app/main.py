@@ -1,21 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 import os
 import json
 import logging
+import mimetypes
+import tempfile
 import asyncio
-import re
 import time
+from urllib.parse import quote as url_quote
 
 from app.core.config import settings
+from app.core.lazy import warm_all, readiness
+from app.core.leader import run_as_leader, is_leader, require_embedded_store
 from app.core.memory import memory_manager
-from app.core.llm import llm_engine
+from app.core.llm import llm_engine, LLMError
+from app.core.llm_scheduler import llm_scheduler, BACKGROUND
+from app.core.price_index import price_index
+from app.core.dedupe import dedupe_index
+from app.core.events import event_bus, KEEPALIVE
+from app.core.jobs import job_queue
+from app.core.knowledge import knowledge_index
+from app.core.columnar import columnar_store
+from app.core.manifest import processed_manifest
+from app.core.sessions import chat_sessions
 from app.agents.procurement_agent import procurement_agent
+from app.agents.intent_router import intent_router
 from app.tools.email_service import email_service
+from app.tools.rfq_generator import rfq_generator
 from app.tools.computer_search import computer_tools
-from app.watcher.folder_watcher import start_watcher
+from app.tools.archiver import archiver
+from app.tools.ocr import ocr_tool, check_engine as check_ocr_engine
+from app.watcher.folder_watcher import start_watcher, PARTIAL_SUFFIX
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,51 +56,156 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Event-Id"],
 )
 
 # ─── Startup ─────────────────────────────────────────────────────────
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Starting folder watcher...")
-    asyncio.create_task(start_watcher())
+    # Several workers need a Chroma server; refuse to start a second one on the embedded store
+    if not settings.CHROMA_HOST:
+        require_embedded_store()
+    check_ocr_engine()
+    # With several workers only the process holding the leader lock watches folders
+    # and drains the job queue
+    logger.info("Starting folder watcher and job workers (waiting for ingestion leadership)...")
+    _spawn(run_as_leader(_ingest), "ingestion")
+    # Heavy subsystems (Chroma, pandas, OCR, LLM client) warm up after the port is open
+    _spawn(_warm_up(), "warm-up")
+
+# The event loop keeps only weak references to tasks: hold them until done, and log failures
+_background_tasks = set()
+
+def _spawn(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+def _task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed", exc_info=task.exception())
+
+async def _ingest():
+    await asyncio.to_thread(email_service.resume)
+    await asyncio.gather(job_queue.run(), start_watcher(), columnar_store.run())
+
+async def _warm_up():
+    start = time.perf_counter()
+    await asyncio.to_thread(warm_all)
+    logger.info(f"Background warm-up finished in {time.perf_counter() - start:.2f}s")
 
 # ─── Health ──────────────────────────────────────────────────────────
 @app.get("/")
 async def root():
     return {"status": "online", "agent": "OmniMind", "version": "3.0"}
 
+@app.get("/ready")
+async def ready():
+    """Which lazily-initialized subsystems are warm."""
+    subsystems = readiness()
+    return {
+        "ready": all(s["ready"] for s in subsystems.values()),
+        "llm_configured": bool(settings.DEEPSEEK_API_KEY),
+        "ingestion_leader": is_leader(),
+        "pid": os.getpid(),
+        "llm_scheduler": llm_scheduler.status(),
+        "subsystems": subsystems,
+    }
+
 # ─── Upload ──────────────────────────────────────────────────────────
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """Upload and immediately analyze a document."""
+    """Save a document and queue it for analysis; poll /jobs/{job_id} for the result."""
     upload_dir = settings.INBOX_DIR
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    logger.info(f"File uploaded: {file_path}")
-    
-    try:
-        result = await procurement_agent.process_new_document(file_path)
-        return {"status": "success", "file": file.filename, "analysis": result}
-    except Exception as e:
-        logger.error(f"Analysis error: {e}")
-        return {"status": "uploaded", "file": file.filename, "analysis": {"summary": f"File saved. Analysis error: {str(e)}"}}
+
+    # Write under a temporary name so the watcher never picks up a half-written file
+    partial = file_path + PARTIAL_SUFFIX
+    with open(partial, "wb") as buffer:
+        while chunk := await file.read(1024 * 1024):
+            buffer.write(chunk)
+    os.replace(partial, file_path)
+
+    job_id = job_queue.enqueue(file_path, source="upload")
+    logger.info(f"File uploaded: {file_path} (job {job_id})")
+    return {"status": "queued", "file": file.filename, "job_id": job_id}
+
+# ─── Jobs ────────────────────────────────────────────────────────────
+@app.get("/jobs")
+async def list_jobs(state: Optional[str] = None, limit: int = 50):
+    """Recent processing jobs, optionally filtered by state (queued/running/done/failed)."""
+    return {"jobs": job_queue.list(state=state, limit=limit), "counts": job_queue.counts()}
+
+@app.post("/jobs/reconcile")
+async def reconcile_folders():
+    """Queue files in the watched folders that were never processed or changed since."""
+    return await asyncio.to_thread(processed_manifest.reconcile)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = job_queue.get(job_id)
+    if not job:
+        return {"error": f"Job {job_id} not found"}
+    return job
+
+# ─── Events ──────────────────────────────────────────────────────────
+@app.get("/events")
+async def stream_events(request: Request, since_id: Optional[int] = None):
+    """
+    Server-sent events: job progress (job, file_detected, ingest), new quotes (quote,
+    quotes_removed) and learned facts (fact). `since_id` is where the client's initial
+    fetch left off; reconnects resume from Last-Event-ID, which takes precedence.
+    """
+    last_id = since_id
+    if request.headers.get("last-event-id", "").isdigit():
+        last_id = int(request.headers["last-event-id"])
+
+    async def stream():
+        yield "retry: 3000\n\n"
+        async for event in event_bus.subscribe(last_id):
+            if event is KEEPALIVE:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _etag(*parts) -> str:
+    return 'W/"' + "-".join(str(p) for p in parts) + '"'
 
 # ─── Knowledge ───────────────────────────────────────────────────────
 @app.get("/knowledge")
-async def get_knowledge():
-    """Fetch learned patterns and facts."""
-    facts = memory_manager.get_learned_facts(limit=15)
-    return {"facts": facts}
+async def get_knowledge(request: Request, response: Response, since_id: Optional[int] = None):
+    """Fetch learned patterns and facts; with since_id, only facts added after that id."""
+    conn = memory_manager.sqlite_conn
+    # Read before the data: a client opening /events?since_id=<X-Event-Id> misses nothing in between
+    event_id = str(event_bus.latest_id())
+    version = conn.execute(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(usage_count), 0) FROM personal_knowledge"
+    ).fetchone()
+    etag = _etag("knowledge", since_id if since_id is not None else "all", *version)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "X-Event-Id": event_id})
+    response.headers["ETag"] = etag
+    response.headers["X-Event-Id"] = event_id
+    if since_id is not None:
+        rows = conn.execute("SELECT fact FROM personal_knowledge WHERE id > ? ORDER BY id DESC", (since_id,)).fetchall()
+        facts = [r[0] for r in rows]
+    else:
+        facts = memory_manager.get_learned_facts(limit=15)
+    return {"facts": facts, "latest_id": version[1]}
 
 # ─── CHAT — The Versatile Brain ──────────────────────────────────────
 
 class ChatRequest(BaseModel):
     query: str
+    # Server-side conversation; omit to start one (the reply carries its id)
+    session_id: Optional[str] = None
+    # Only read when a session is created, for clients that still send the transcript
     history: List[Dict[str, str]] = []
 
 SYSTEM_PROMPT = """You are **OmniMind**, a powerful, highly-versatile autonomous AI assistant with full, deep access to the user's computer.
@@ -130,76 +254,100 @@ async def chat_with_assistant(body: ChatRequest):
     start_time = time.time()
     
     user_query = body.query
-    history = body.history or []
     
     if not user_query:
-        return {"reply": "Please provide a query.", "duration": 0}
+        return {"reply": "Please provide a query.", "duration": 0, "session_id": body.session_id}
+
+    session_id = body.session_id
+    if not session_id or not await asyncio.to_thread(chat_sessions.exists, session_id):
+        session_id = await asyncio.to_thread(chat_sessions.create, body.history)
+    summary, session_context, recent_turns = await asyncio.to_thread(chat_sessions.prompt_state, session_id)
+    found_context = {}
     
-    # Fetch personal knowledge to make the agent "evolve"
-    learned_knowledge = memory_manager.get_learned_facts()
+    # Fetch the personal knowledge relevant to this query to make the agent "evolve"
+    try:
+        learned_knowledge = await asyncio.to_thread(knowledge_index.relevant, user_query)
+    except Exception as e:
+        logger.error(f"Knowledge retrieval error: {e}")
+        learned_knowledge = []
     knowledge_text = "\n".join([f"- {fact}" for fact in learned_knowledge]) if learned_knowledge else "No specialized patterns learned yet. I will evolve as we interact."
     
     dynamic_system_prompt = SYSTEM_PROMPT.format(learned_facts=knowledge_text)
     
-    lower_q = user_query.lower()
     context_parts = []
     
     # ─── TOOL EXECUTION LAYER ────────────────────────────────────────
+    # Only the tools of the intents the router picked run; slots come from the same pass
+    route = intent_router.route(user_query, session_context)
+    intents, slots = route["intents"], route["slots"]
     
     # 1. FILE SEARCH
-    if any(k in lower_q for k in ["find", "search", "look for", "locate", "where is", "check"]):
-        search_terms = _extract_search_terms(lower_q)
-        search_root = None # Default to all drives
-        
-        if "desktop" in lower_q: search_root = _get_common_path("desktop")
-        elif "downloads" in lower_q: search_root = _get_common_path("downloads")
-        elif "documents" in lower_q: search_root = _get_common_path("documents")
-        elif "d:" in lower_q or "d drive" in lower_q: search_root = "D:\\"
+    if "search" in intents:
+        search_terms = slots["terms"]
+        search_root = _resolve_path_ref(slots["root"]) if slots["root"] else None # Default to all drives
         
         if search_terms:
             results = computer_tools.search_files(f"*{search_terms}*", search_root)
             if results and (isinstance(results[0], dict) and "path" in results[0]):
+                found_context.update(last_search_terms=search_terms, last_search_results=[r["path"] for r in results[:10]])
                 context_parts.append(f"[TOOL: file_search] Found {len(results)} files matching '{search_terms}':\n{json.dumps(results[:10], indent=1)}")
             else:
                 context_parts.append(f"[TOOL: file_search] Status: No files found matching '{search_terms}' on the computer.")
     
     # 2. FOLDER LISTING
-    if any(k in lower_q for k in ["list", "show folder", "what's in", "contents of", "show me"]):
-        path = _extract_path(user_query, history)
+    if "list" in intents:
+        path = _route_path(route, session_context)
         if path:
+            found_context["last_path"] = path
             listing = computer_tools.list_directory(path)
             context_parts.append(f"[TOOL: list_directory] Contents of {path}:\n{json.dumps(listing, indent=2)}")
 
     # 3. FOLDER ORGANIZATION (Preview vs Execution)
-    if any(k in lower_q for k in ["organize", "sort", "arrange", "clean up", "tidy", "yes", "proceed", "do it"]):
-        path = _extract_path(user_query, history)
+    pending = session_context.get("pending_organize_plan")
+    if "confirm" in intents and pending:
+        # Execute exactly the plan previewed on the previous turn, never a fresh one
+        path = pending["path"]
+        found_context["last_path"] = path
+        result = computer_tools.execute_organize(pending["plan_id"])
+        if result.get("status") == "success":
+            context_parts.append(f"[TOOL: organize_execute] Successfully organized {path} (plan {result.get('plan_id')}, can be undone).\nMoved: {json.dumps(result.get('organized', {}), indent=2)}")
+        else:
+            context_parts.append(f"[TOOL: organize_execute] Failed to organize {path}: {result.get('message')}")
+    elif "organize" in intents:
+        path = _route_path(route, session_context)
         if path:
-            # Check if this is a confirmation to proceed
-            if any(k in lower_q for k in ["yes", "proceed", "do it", "confirm", "ok", "go ahead"]):
-                result = computer_tools.organize_folder(path)
-                if result.get("status") == "success":
-                    context_parts.append(f"[TOOL: organize_execute] Successfully organized {path}.\nMoved: {json.dumps(result.get('organized', {}), indent=2)}")
-                else:
-                    context_parts.append(f"[TOOL: organize_execute] Failed to organize {path}: {result.get('message')}")
-            else:
-                # Provide a preview first
-                listing = computer_tools.list_directory(path)
-                context_parts.append(f"[TOOL: organize_preview] Folder contents to organize in {path}:\n{json.dumps(listing, indent=2)}")
+            found_context["last_path"] = path
+            # Provide a preview first: the plan is persisted and executed as-is on confirmation
+            plan = computer_tools.plan_organize(path)
+            if plan.get("status") == "success":
+                found_context["pending_organize_plan"] = {"plan_id": plan["plan_id"], "path": path}
+                context_parts.append(f"[TOOL: organize_preview] Planned moves for {path} ({plan['total_planned']} files):\n{json.dumps(_plan_preview(plan['planned']), indent=2)}")
                 context_parts.append("[INSTRUCTION: Show the user what you WOULD organize and ask for confirmation ('Yes/No') before executing.]")
+            else:
+                context_parts.append(f"[TOOL: organize_preview] Could not plan organization of {path}: {plan.get('message')}")
+    # A preview only stands for the very next message
+    if pending and "pending_organize_plan" not in found_context:
+        found_context["pending_organize_plan"] = None
 
     # 4. FILE READING
-    if any(k in lower_q for k in ["read", "open", "analyze", "extract", "summarize"]):
-        search_terms = _extract_search_terms(lower_q)
-        if search_terms:
+    if "read" in intents:
+        search_terms = slots["terms"]
+        referring_back = slots["referential"] and not slots["path"] and session_context.get("last_file")
+        if search_terms and not referring_back:
             found = computer_tools.find_by_name(search_terms)
             if found:
+                found_context["last_file"] = found[0]
                 content = computer_tools.read_file_content(found[0])
                 context_parts.append(f"[TOOL: read_file] Read '{found[0]}':\n{content}")
             else:
                 context_parts.append(f"[TOOL: read_file] Status: File '{search_terms}' NOT FOUND on computer.")
+        elif session_context.get("last_file") and os.path.isfile(session_context["last_file"]):
+            # "Read that file": the one found or read earlier in this session
+            content = computer_tools.read_file_content(session_context["last_file"])
+            context_parts.append(f"[TOOL: read_file] Read '{session_context['last_file']}':\n{content}")
 
     # 5. MEMORY SEARCH
-    if any(k in lower_q for k in ["history", "previous", "last time", "remember", "past"]):
+    if "memory" in intents:
         try:
             memory_results = memory_manager.search_history(user_query)
             if memory_results and memory_results[0]:
@@ -210,22 +358,35 @@ async def chat_with_assistant(body: ChatRequest):
             context_parts.append("[TOOL: memory_search] Status: Error searching memory database.")
 
     # 6. MOVE / COPY FILES
-    if any(k in lower_q for k in ["move", "copy", "transfer"]):
+    if "move" in intents:
         context_parts.append("[INSTRUCTION: The user wants to move/copy files. Ask them to confirm source and destination paths before executing.]")
 
     # ─── BUILD FINAL PROMPT ──────────────────────────────────────────
     tool_context = "\n\n".join(context_parts) if context_parts else ""
     
-    # Keep the last 20 turns of history to prevent conversation "collapse"
+    # Rolling summary + current context + the turns not yet summarized, instead of a resent transcript
     messages = [{"role": "system", "content": dynamic_system_prompt}]
-    for h in history[-20:]:
-        messages.append({"role": h["role"], "content": h["content"]})
+    session_notes = []
+    if summary:
+        session_notes.append(f"## EARLIER IN THIS CONVERSATION\n{summary}")
+    if session_context:
+        session_notes.append(f"## CURRENT CONTEXT\n{json.dumps(session_context, indent=1)}")
+    if session_notes:
+        messages.append({"role": "system", "content": "\n\n".join(session_notes)})
+    messages.extend(recent_turns)
     
     messages.append({"role": "user", "content": f"{user_query}\n\n{tool_context}" if tool_context else user_query})
     
     try:
-        response = llm_engine.chat(messages)
+        # Off the event loop; /chat runs in the interactive lane, ahead of ingestion
+        response = await asyncio.to_thread(llm_engine.chat, messages)
         duration = round(time.time() - start_time, 2)
+
+        # Session state is updated once per turn; older turns are summarized in the background
+        if slots["path"] and "last_path" not in found_context:
+            found_context["last_path"] = slots["path"]
+        await asyncio.to_thread(_record_turn, session_id, user_query, response, found_context)
+        _spawn(asyncio.to_thread(chat_sessions.compact, session_id), f"compact-{session_id}")
         
         # ─── SELF-LEARNING ENGINE (Background-ish) ───────────────────
         # Try to extract learned facts from this interaction
@@ -236,14 +397,48 @@ async def chat_with_assistant(body: ChatRequest):
             
             Return ONLY a single sentence fact (e.g. "User prefers sorting by file type" or "User's main project folder is D:/Projects/X") or return "NONE".
             """
-            fact = llm_engine.chat([{"role": "user", "content": learning_prompt}])
+            try:
+                fact = await asyncio.to_thread(llm_engine.complete, [{"role": "user", "content": learning_prompt}], False,
+                                               "deepseek-chat", BACKGROUND)
+            except LLMError as e:
+                logger.warning(f"Fact learning skipped: {e}")
+                fact = None
             if fact and fact.strip().upper() != "NONE" and len(fact) < 150:
                 memory_manager.store_learned_fact("general", fact.strip())
         
-        return {"reply": response, "duration": duration}
+        return {"reply": response, "duration": duration, "session_id": session_id}
     except Exception as e:
         logger.error(f"Chat error: {e}")
-        return {"reply": f"I encountered an error: {str(e)}. Please try again.", "duration": 0}
+        return {"reply": f"I encountered an error: {str(e)}. Please try again.", "duration": 0, "session_id": session_id}
+
+def _record_turn(session_id: str, user_query: str, reply: str, found_context: dict):
+    chat_sessions.append(session_id, "user", user_query)
+    chat_sessions.append(session_id, "assistant", reply)
+    chat_sessions.update_context(session_id, **found_context)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """A chat session's rolling summary, current context and recent turns."""
+    session = chat_sessions.get(session_id)
+    if not session:
+        return {"error": f"Session {session_id} not found"}
+    return session
+
+@app.get("/routing/log")
+async def routing_log(limit: int = 100, source: Optional[str] = None):
+    """Recent /chat routing decisions (intents, scores, slots, rules vs model), newest first."""
+    return intent_router.recent(min(limit, 1000), source)
+
+@app.post("/routing/log/{log_id}/label")
+async def label_route(log_id: int, intent: str):
+    """Confirm or correct the intent of a logged /chat message; the fallback model learns from it."""
+    try:
+        found = intent_router.label(log_id, intent)
+    except ValueError as e:
+        return {"error": str(e)}
+    if not found:
+        return {"error": f"Routing log entry {log_id} not found"}
+    return {"status": "success", "id": log_id, "label": intent}
 
 # ─── TOOL: Organize Folder (Confirmed Action) ───────────────────────
 @app.post("/organize")
@@ -252,6 +447,26 @@ async def organize_folder(path: str):
     result = computer_tools.organize_folder(path)
     return result
 
+@app.get("/list")
+async def list_directory(path: str, max_items: int = 50, sort: str = "name", cursor: Optional[str] = None):
+    """Paged directory listing; pass back `next_cursor` to get the following page."""
+    return computer_tools.list_directory(path, max_items, sort, cursor)
+
+@app.post("/organize/plan")
+async def plan_organize(path: str):
+    """Scan a folder once and persist the move plan for review."""
+    return computer_tools.plan_organize(path)
+
+@app.post("/organize/execute")
+async def execute_organize(plan_id: str):
+    """Apply a previously reviewed organize plan."""
+    return computer_tools.execute_organize(plan_id)
+
+@app.post("/organize/undo")
+async def undo_organize(plan_id: str):
+    """Move every file of an executed plan back to where it was."""
+    return computer_tools.undo_organize(plan_id)
+
 # ─── TOOL: Move File (Confirmed Action) ─────────────────────────────
 @app.post("/move-file")
 async def move_file(src: str, dest: str):
@@ -261,10 +476,21 @@ async def move_file(src: str, dest: str):
 
 # ─── Data Endpoints ──────────────────────────────────────────────────
 @app.get("/quotes")
-async def get_quotes():
+async def get_quotes(request: Request, response: Response, since_id: Optional[int] = None):
+    """All quotes, newest first, or only those with id > since_id. The ETag changes when quotes are added or removed."""
     try:
+        event_id = str(event_bus.latest_id())  # before the data, see get_knowledge
         cursor = memory_manager.sqlite_conn.cursor()
-        cursor.execute("SELECT * FROM quotes ORDER BY id DESC")
+        version = cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM quotes").fetchone()
+        etag = _etag("quotes", since_id if since_id is not None else "all", *version)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag, "X-Event-Id": event_id})
+        response.headers["ETag"] = etag
+        response.headers["X-Event-Id"] = event_id
+        if since_id is not None:
+            cursor.execute("SELECT * FROM quotes WHERE id > ? ORDER BY id DESC", (since_id,))
+        else:
+            cursor.execute("SELECT * FROM quotes ORDER BY id DESC")
         desc = cursor.description
         if desc is None:
             return []
@@ -274,22 +500,159 @@ async def get_quotes():
         logger.error(f"Quotes error: {e}")
         return []
 
+@app.get("/quotes/{quote_id}/items")
+async def get_quote_items(quote_id: int):
+    try:
+        return memory_manager.get_quote_items(quote_id)
+    except Exception as e:
+        logger.error(f"Quote items error: {e}")
+        return []
+
+@app.get("/quotes/{quote_id}/original")
+async def get_quote_original(quote_id: int):
+    """The source document of a quote, from its folder or, once processed, from the archive."""
+    quote = memory_manager.get_quote(quote_id)
+    if not quote or not quote.get("file_path"):
+        return {"error": f"Quote {quote_id} has no source document"}
+    if os.path.isfile(quote["file_path"]):
+        return FileResponse(quote["file_path"], filename=os.path.basename(quote["file_path"]))
+    member = archiver.lookup(original_path=quote["file_path"])
+    if not member:
+        return {"error": "Source document is no longer available"}
+    return _archived_response(member)
+
+# ─── Export ──────────────────────────────────────────────────────────
+@app.get("/export/{table}")
+async def export_table(table: str, format: str = "parquet"):
+    """Download `quotes` or `quote_items` as Parquet or an Arrow IPC file, written in bounded batches."""
+    suffix = ".parquet" if format == "parquet" else ".arrow"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        await asyncio.to_thread(columnar_store.export, table, path, format)
+    except (ValueError, KeyError) as e:
+        os.remove(path)
+        return {"error": str(e)}
+    return FileResponse(path, filename=f"{table}{suffix}", background=BackgroundTask(os.remove, path))
+
+@app.post("/snapshot/refresh")
+async def refresh_snapshot(force: bool = False):
+    return await asyncio.to_thread(columnar_store.refresh, force)
+
+# ─── Archive ─────────────────────────────────────────────────────────
+@app.get("/archive")
+async def list_archive(limit: int = 100):
+    return {"members": archiver.list_members(limit)}
+
+@app.post("/archive/run")
+async def archive_processed(limit: int = 1000):
+    """Move already-processed documents still sitting in the watched folders into the archive."""
+    return await asyncio.to_thread(archiver.archive_processed, limit)
+
+@app.get("/archive/{sha256}")
+async def get_archived(sha256: str):
+    member = archiver.lookup(sha256=sha256)
+    if not member:
+        return {"error": "Unknown archive member"}
+    return _archived_response(member)
+
+def _archived_response(member: dict) -> Response:
+    content = archiver.read(member["sha256"])
+    media_type = mimetypes.guess_type(member["file_name"])[0] or "application/octet-stream"
+    # RFC 6266: ASCII fallback plus the UTF-8 name, so non-latin-1 file names do not break the header
+    fallback = member["file_name"].encode("ascii", "replace").decode().replace('"', "'")
+    disposition = f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{url_quote(member['file_name'])}"
+    return Response(content, media_type=media_type, headers={"Content-Disposition": disposition})
+
+# ─── OCR ─────────────────────────────────────────────────────────────
+@app.post("/ocr/batch")
+async def ocr_batch(files: List[UploadFile] = File(...)):
+    """OCR several images at once across the worker pool."""
+    images = [await f.read() for f in files]
+    batch = await asyncio.to_thread(ocr_tool.extract_batch, images)
+    for f, result in zip(files, batch["results"]):
+        result["file"] = f.filename
+    return batch
+
+@app.get("/ocr/status")
+async def ocr_status():
+    """Pool size, per-image latency percentiles and recent throughput."""
+    return ocr_tool.status()
+
+@app.get("/price-history")
+async def get_price_history(material: str, vendor: Optional[str] = None, limit: int = 100):
+    """Per-material line-item price history, optionally for a single vendor."""
+    try:
+        return memory_manager.get_price_history(material, vendor, limit)
+    except Exception as e:
+        logger.error(f"Price history error: {e}")
+        return []
+
+@app.get("/price-check")
+async def price_check(material: str, unit_price: float, currency: Optional[str] = None):
+    """Percentile / z-score of a unit price against the material's price index."""
+    return price_index.assess(material, unit_price, currency)
+
+@app.get("/duplicates")
+async def get_duplicates(limit: int = 100):
+    """Documents that were linked to an earlier original instead of being reprocessed."""
+    return dedupe_index.list_duplicates(limit)
+
+@app.post("/dedupe")
+async def dedupe_quotes(dry_run: bool = True):
+    """Bulk near-duplicate pass over stored quotes; pass dry_run=false to delete the copies."""
+    return await asyncio.to_thread(dedupe_index.dedupe_existing_quotes, dry_run)
+
 @app.get("/vendors")
 async def get_vendors():
+    """Precomputed per-vendor aggregates, maintained on every stored quote."""
     try:
-        cursor = memory_manager.sqlite_conn.cursor()
-        cursor.execute("SELECT * FROM vendor_performance")
-        desc = cursor.description
-        if desc is None:
-            return []
-        columns = [col[0] for col in desc]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
-    except:
+        return memory_manager.get_vendor_performance()
+    except Exception as e:
+        logger.error(f"Vendors error: {e}")
         return []
 
+@app.post("/vendors/rebuild")
+async def rebuild_vendors():
+    """Recompute vendor aggregates from the full quote history."""
+    count = await asyncio.to_thread(memory_manager.rebuild_vendor_aggregates)
+    return {"status": "success", "vendors": count}
+
 @app.post("/send-email")
 async def send_email(to: str, subject: str, body: str):
-    return email_service.send_email(to, subject, body)
+    # SMTP I/O runs off the event loop on the shared connection
+    return await asyncio.to_thread(email_service.send_email, to, subject, body)
+
+class EmailMessage(BaseModel):
+    to: str
+    subject: str
+    body: str
+
+@app.post("/send-email/batch")
+async def send_email_batch(messages: List[EmailMessage]):
+    """Queue many messages for background delivery over one pooled SMTP connection."""
+    ids = email_service.enqueue_batch([m.model_dump() for m in messages])
+    return {"status": "queued", "ids": ids}
+
+class RFQRequest(BaseModel):
+    materials: List[Dict]
+    vendors: Optional[List[Dict]] = None
+    due_date: Optional[str] = None
+    reference: Optional[str] = None
+    note: Optional[str] = None
+    use_llm: bool = True
+
+@app.post("/rfq/drafts")
+async def create_rfq_drafts(body: RFQRequest):
+    """Draft one RFQ per vendor (given, or past vendors of these materials) for approval."""
+    return await asyncio.to_thread(
+        rfq_generator.create_drafts,
+        body.materials, body.vendors, body.due_date, body.reference, body.note, body.use_llm,
+    )
+
+@app.get("/outbox/{message_id}")
+async def outbox_status(message_id: str):
+    return email_service.outbox_status(message_id) or {"error": "Unknown message id"}
 
 @app.get("/search")
 async def search_memory(q: str):
@@ -335,56 +698,26 @@ def _get_common_path(name: str) -> str:
         
     return user_home # Ultimate fallback
 
-def _extract_search_terms(query: str) -> str:
-    """Extract the most likely search term from a natural language query."""
-    # Remove common action words
-    stop_words = ["find", "search", "look", "for", "check", "the", "my", "a", "an", "in",
-                  "on", "desktop", "downloads", "documents", "folder", "file", "files",
-                  "please", "can", "you", "show", "me", "read", "open", "analyze", "extract",
-                  "summarize", "where", "is", "are", "locate", "get", "with", "from", "about",
-                  "quotes", "quotations", "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec",
-                  "2023", "2024", "2025", "2026", "it", "this", "that"]
-    words = query.split()
-    meaningful = [w for w in words if w.lower() not in stop_words and len(w) > 2]
-    return " ".join(meaningful[:3]) if meaningful else ""
-
-def _extract_path(query: str, history: List[Dict[str, str]] = None) -> str:
-    """Try to extract a file path from a natural language query or history context."""
-    lower = query.lower()
-    
-    # 0. Check for "it", "this", "that", "the folder"
-    is_referential = any(k in lower for k in ["it", "this", "that", "the folder", "the directory"])
-    
-    # 1. Check for well-known folders in CURRENT query
-    for folder in ["desktop", "downloads", "documents"]:
-        if folder in lower:
-            return _get_common_path(folder)
-    
-    # 2. Direct check in current query
-    if "rfq" in lower: return settings.RFQ_DIR
-    if "inbox" in lower: return settings.INBOX_DIR
-    if "orders" in lower: return settings.ORDERS_DIR
-    if "workspace" in lower: return settings.WORKSPACE_ROOT
-    if "d:" in lower or "d drive" in lower: return "D:\\"
-    if "c:" in lower or "c drive" in lower: return "C:\\"
-    
-    # 3. If referential or confirmation, look deep into history
-    if is_referential or (history and any(k in lower for k in ["yes", "proceed", "do it", "confirm", "ok", "go ahead"])):
-        # Search backwards through history for the last mentioned path
-        for msg in reversed(history):
-            h_content = msg["content"].lower()
-            # Look for explicit paths in history content
-            import re
-            # Match Windows-style paths D:\... or /host_...
-            paths = re.findall(r'[a-zA-Z]:\\[^ \n\r\t]+', h_content)
-            if paths: return paths[0]
-            
-            # Look for folder names
-            for folder in ["desktop", "downloads", "documents"]:
-                if folder in h_content:
-                    return _get_common_path(folder)
-            
-            if "d drive" in h_content or "d:" in h_content: return "D:\\"
-            if "workspace" in h_content: return settings.WORKSPACE_ROOT
-            
-    return os.path.expanduser("~") # Default to User Home
+def _plan_preview(planned: Dict[str, List[str]], max_names: int = 50) -> Dict[str, Dict]:
+    """Per-folder file counts with a few example names, at most max_names in all, for the chat prompt."""
+    per_folder = max(1, max_names // max(len(planned), 1))
+    return {folder: {"count": len(names), "examples": names[:per_folder]} for folder, names in planned.items()}
+
+def _resolve_path_ref(ref: str) -> str:
+    """A router path slot (explicit path, well-known folder, workspace folder or drive) as a real path."""
+    if ref in ("desktop", "downloads", "documents"):
+        return _get_common_path(ref)
+    workspace = {"rfq": settings.RFQ_DIR, "inbox": settings.INBOX_DIR, "orders": settings.ORDERS_DIR,
+                 "workspace": settings.WORKSPACE_ROOT}
+    return workspace.get(ref, ref)
+
+def _route_path(route: dict, session_context: Optional[Dict] = None) -> Optional[str]:
+    """The folder a routed message is about: named in it, or the session's last path for "it"."""
+    slots = route["slots"]
+    if slots["path"]:
+        return _resolve_path_ref(slots["path"])
+    last_path = (session_context or {}).get("last_path")
+    if last_path and slots["referential"]:
+        return _resolve_path_ref(last_path)
+    # No default to the home folder: a listing nobody asked for is a wasted directory walk
+    return None
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from app.core.config import settings
+from app.core.jobs import job_queue
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+# Formats that are already compressed gain nothing from zlib
+_PRECOMPRESSED = {".jpg", ".jpeg", ".png", ".gif", ".zip", ".gz", ".7z", ".rar", ".xlsx", ".docx", ".pptx"}
+
+
+class Archiver:
+    """
+    Moves processed documents out of the watched folders into append-only daily bundles:
+    ARCHIVE_DIR/YYYY/MM/YYYY-MM-DD.bundle. Each member is stored raw or zlib-compressed,
+    and archive_members maps content hash and original path to (bundle, offset, length),
+    so any archived original is read back with one index lookup and one seek.
+    """
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS archive_members (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sha256 TEXT NOT NULL,
+                    original_path TEXT,
+                    file_name TEXT,
+                    bundle TEXT,
+                    offset INTEGER,
+                    length INTEGER,
+                    size INTEGER,
+                    compressed INTEGER,
+                    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_sha ON archive_members (sha256)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_path ON archive_members (original_path)")
+            self.conn.commit()
+
+    @staticmethod
+    def _bundle_for(day: datetime) -> str:
+        return os.path.join(f"{day:%Y}", f"{day:%m}", f"{day:%Y-%m-%d}.bundle")
+
+    def _location(self, sha256: str) -> Optional[tuple]:
+        return self.conn.execute(
+            "SELECT bundle, offset, length, size, compressed FROM archive_members WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+
+    # ─── Write ──────────────────────────────────────────────────────────
+
+    def archive(self, file_path: str) -> Dict[str, Any]:
+        """Append a file to today's bundle, index it, and remove it from its folder."""
+        file_path = os.path.abspath(file_path)
+        if not os.path.isfile(file_path):
+            return {"status": "error", "message": f"Not a file: {file_path}"}
+        with open(file_path, "rb") as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        name = os.path.basename(file_path)
+
+        with self._lock:
+            location = self._location(sha256)
+            if location is None:
+                payload, compressed = data, 0
+                if settings.ARCHIVE_COMPRESS and os.path.splitext(name)[1].lower() not in _PRECOMPRESSED:
+                    packed = zlib.compress(data, 6)
+                    if len(packed) < 0.9 * len(data):
+                        payload, compressed = packed, 1
+                bundle = self._bundle_for(datetime.now())
+                bundle_path = os.path.join(settings.ARCHIVE_DIR, bundle)
+                os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+                with open(bundle_path, "ab") as out:
+                    offset = out.seek(0, os.SEEK_END)
+                    out.write(payload)
+                    out.flush()
+                    os.fsync(out.fileno())
+                location = (bundle, offset, len(payload), len(data), compressed)
+            # Identical content archived before is indexed under the new path without a second copy
+            self.conn.execute("""
+                INSERT INTO archive_members (sha256, original_path, file_name, bundle, offset, length, size, compressed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (sha256, file_path, name, *location))
+            self.conn.commit()
+
+        # Only drop the original once the bundle write and index row are durable
+        os.remove(file_path)
+        from app.tools.computer_search import computer_tools
+        computer_tools.invalidate_listing(os.path.dirname(file_path))
+        return {"status": "success", "sha256": sha256, "bundle": location[0], "offset": location[1], "size": location[3]}
+
+    def archive_processed(self, limit: int = 1000) -> Dict[str, Any]:
+        """Archive files in the watched folders whose processing job has finished successfully."""
+        watched = tuple(os.path.abspath(d) + os.sep for d in (settings.INBOX_DIR, settings.RFQ_DIR))
+        archived, errors = [], []
+        for path in job_queue.done_files(limit):
+            if not path or not path.startswith(watched) or not os.path.isfile(path):
+                continue
+            try:
+                result = self.archive(path)
+                if result["status"] == "success":
+                    archived.append({"file_path": path, "sha256": result["sha256"]})
+            except OSError as e:
+                errors.append({"file_path": path, "error": str(e)})
+        return {"status": "success", "archived": archived, "total_archived": len(archived), "errors": errors}
+
+    # ─── Read ───────────────────────────────────────────────────────────
+
+    def lookup(self, sha256: Optional[str] = None, original_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if sha256:
+            row = self.conn.execute(
+                "SELECT sha256, original_path, file_name, bundle, size, archived_at FROM archive_members WHERE sha256 = ? LIMIT 1", (sha256,)
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT sha256, original_path, file_name, bundle, size, archived_at FROM archive_members WHERE original_path = ? ORDER BY id DESC LIMIT 1",
+                (os.path.abspath(original_path),),
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("sha256", "original_path", "file_name", "bundle", "size", "archived_at"), row))
+
+    def read(self, sha256: str) -> Optional[bytes]:
+        """Original bytes of an archived document: one index lookup, one seek."""
+        location = self._location(sha256)
+        if location is None:
+            return None
+        bundle, offset, length, size, compressed = location
+        with open(os.path.join(settings.ARCHIVE_DIR, bundle), "rb") as f:
+            f.seek(offset)
+            payload = f.read(length)
+        return zlib.decompress(payload) if compressed else payload
+
+    def list_members(self, limit: int = 100) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("""
+            SELECT sha256, original_path, file_name, bundle, size, length, archived_at
+            FROM archive_members ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
+        keys = ("sha256", "original_path", "file_name", "bundle", "size", "stored_bytes", "archived_at")
+        return [dict(zip(keys, r)) for r in rows]
+
+archiver = LazySingleton("archiver", Archiver)
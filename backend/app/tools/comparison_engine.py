@@ -1,6 +1,11 @@
+import logging
 from typing import List, Dict, Any
-from app.core.llm import llm_engine
-import pandas as pd
+from app.core.llm import llm_engine, LLMError
+from app.core.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
 
 class ComparisonEngine:
     @staticmethod
@@ -13,6 +18,14 @@ class ComparisonEngine:
         
         # Convert to DataFrame for tabular representation
         df = pd.DataFrame(quotes)
+        if 'material' in df.columns:
+            try:
+                history = ComparisonEngine.material_history(df['material'].dropna().unique().tolist())
+                if not history.empty:
+                    medians = history.groupby(history['material'].str.lower())['unit_price'].median()
+                    df['history_median_unit_price'] = df['material'].str.lower().map(medians)
+            except Exception as e:
+                logger.warning(f"History snapshot unavailable: {e}")
         
         # Use LLM for qualitative analysis and recommendation
         prompt = f"""
@@ -38,14 +51,70 @@ class ComparisonEngine:
         }
 
     @staticmethod
-    def detect_revisions(old_quote: Dict[str, Any], new_quote: Dict[str, Any]) -> str:
+    def material_history(materials: List[str], vendors: List[str] = None):
+        """All stored line items for these materials, from the memory-mapped columnar snapshot."""
+        from app.core.columnar import columnar_store
+        filters = {"material": materials}
+        if vendors:
+            filters["vendor_name"] = vendors
+        return columnar_store.frame("quote_items", filters)
+
+    REVISION_FIELDS = ["unit_price", "total", "currency", "qty", "delivery_weeks", "payment_terms", "validity", "deviations"]
+
+    @staticmethod
+    def diff_quotes(old_quote: Dict[str, Any], new_quote: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Field-level changes between two quote revisions, including per-line-item price/qty changes."""
+        changes = []
+        for field in ComparisonEngine.REVISION_FIELDS:
+            old, new = old_quote.get(field), new_quote.get(field)
+            if old != new and not (old in (None, "") and new in (None, "")):
+                change = {"field": field, "old": old, "new": new}
+                if isinstance(old, (int, float)) and isinstance(new, (int, float)) and old:
+                    change["change_pct"] = round((new - old) / old * 100, 1)
+                changes.append(change)
+
+        def _items(q):
+            return {str(i.get("material", "")).strip().lower(): i for i in (q.get("items") or []) if isinstance(i, dict) and i.get("material")}
+
+        old_items, new_items = _items(old_quote), _items(new_quote)
+        for key in old_items.keys() | new_items.keys():
+            old, new = old_items.get(key), new_items.get(key)
+            if old is None or new is None:
+                changes.append({"field": "item", "material": (old or new)["material"], "change": "added" if old is None else "removed"})
+                continue
+            for field in ("unit_price", "qty"):
+                if old.get(field) != new.get(field):
+                    change = {"field": f"item.{field}", "material": new["material"], "old": old.get(field), "new": new.get(field)}
+                    if isinstance(old.get(field), (int, float)) and isinstance(new.get(field), (int, float)) and old.get(field):
+                        change["change_pct"] = round((new[field] - old[field]) / old[field] * 100, 1)
+                    changes.append(change)
+        return changes
+
+    @staticmethod
+    def detect_revisions(old_quote: Dict[str, Any], new_quote: Dict[str, Any], use_llm: bool = True) -> str:
+        """Describe what changed between two revisions. The diff is computed locally; the LLM only phrases it."""
+        changes = ComparisonEngine.diff_quotes(old_quote, new_quote)
+        if not changes:
+            return "No changes in price, delivery or terms compared to the previous revision."
+        if not use_llm:
+            return "\n".join(_format_change(c) for c in changes)
         prompt = f"""
-        Compare these two versions of a quotation from {old_quote.get('vendor_name')}.
-        Identify ONLY what has changed (price, delivery, terms).
+        A vendor ({new_quote.get('vendor_name') or old_quote.get('vendor_name')}) revised their quotation.
+        Write 2-4 short bullet points describing these changes for a buyer. Use only the data given.
         
-        Old: {old_quote}
-        New: {new_quote}
+        Changes: {changes}
         """
-        return llm_engine.chat([{"role": "user", "content": prompt}])
+        try:
+            return llm_engine.complete([{"role": "user", "content": prompt}])
+        except LLMError as e:
+            logger.warning(f"Revision phrasing unavailable: {e}")
+            return "\n".join(_format_change(c) for c in changes)
+
+def _format_change(change: Dict[str, Any]) -> str:
+    label = f"{change['material']} {change['field'].split('.')[-1]}" if "material" in change else change["field"]
+    if "change" in change:
+        return f"- {change['material']}: item {change['change']}"
+    pct = f" ({change['change_pct']:+}%)" if "change_pct" in change else ""
+    return f"- {label}: {change.get('old')} → {change.get('new')}{pct}"
 
 comparison_engine = ComparisonEngine()
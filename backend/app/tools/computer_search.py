@@ -1,8 +1,14 @@
 import os
 import glob
+import errno
+import heapq
 import shutil
 import json
 import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -53,33 +59,96 @@ class ComputerTools:
 
     # ─── SEARCH & DISCOVER ─────────────────────────────────────────────
 
+    # Directory listing cache: path -> (dir mtime_ns, [(name, is_dir, mtime or None)], has_mtimes)
+    _listing_cache: "OrderedDict[str, tuple]" = OrderedDict()
+    _listing_lock = threading.Lock()
+    LISTING_CACHE_SIZE = 64
+
+    @staticmethod
+    def invalidate_listing(path: str):
+        """Drop a cached listing (called from watcher events and file operations)."""
+        with ComputerTools._listing_lock:
+            ComputerTools._listing_cache.pop(os.path.abspath(os.path.expanduser(path)), None)
+
+    @staticmethod
+    def _scan_directory(path: str, need_mtime: bool) -> List[tuple]:
+        """
+        One scandir pass, cached until the directory's own mtime changes.
+        Entry types come from DirEntry's cached d_type; entries are only stat'ed when sorting by mtime.
+        """
+        dir_mtime = os.stat(path).st_mtime_ns
+        with ComputerTools._listing_lock:
+            cached = ComputerTools._listing_cache.get(path)
+            if cached and cached[0] == dir_mtime and (not need_mtime or cached[2]):
+                ComputerTools._listing_cache.move_to_end(path)
+                return cached[1]
+
+        records = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    mtime = entry.stat().st_mtime if need_mtime else None
+                except OSError:
+                    is_dir, mtime = False, None
+                records.append((entry.name, is_dir, mtime))
+
+        with ComputerTools._listing_lock:
+            ComputerTools._listing_cache[path] = (dir_mtime, records, need_mtime)
+            ComputerTools._listing_cache.move_to_end(path)
+            while len(ComputerTools._listing_cache) > ComputerTools.LISTING_CACHE_SIZE:
+                ComputerTools._listing_cache.popitem(last=False)
+        return records
+
     @staticmethod
-    def list_directory(path: str, max_items: int = 50) -> Dict[str, Any]:
-        """List contents of a directory with file metadata."""
+    def list_directory(path: str, max_items: int = 50, sort: str = "name", cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        List contents of a directory with file metadata.
+        Returns the top `max_items` entries (folders first by name, or newest first with sort="mtime")
+        selected with a heap, plus a `next_cursor` for the following page. Only returned entries are stat'ed.
+        """
         try:
             # Handle user path expansion (e.g. ~)
-            path = os.path.expanduser(path)
+            path = os.path.abspath(os.path.expanduser(path))
             if not os.path.isdir(path):
                 return {"error": f"Not a directory: {path}"}
-            
+
+            by_mtime = sort == "mtime"
+            records = ComputerTools._scan_directory(path, need_mtime=by_mtime)
+
+            # Sort keys: (is_file, name) ascending, or (-mtime, name) ascending for newest first
+            if by_mtime:
+                key = lambda r: (-(r[2] or 0.0), r[0])
+            else:
+                key = lambda r: (not r[1], r[0])
+
+            candidates = records
+            if cursor:
+                after = json.loads(cursor)
+                after = (after[0], after[1])
+                candidates = (r for r in records if key(r) > after)
+            page = heapq.nsmallest(max_items + 1, candidates, key=key)
+            has_more = len(page) > max_items
+            page = page[:max_items]
+
             items = []
-            for entry in os.scandir(path):
+            for name, is_dir, _ in page:
                 try:
-                    stat = entry.stat()
+                    stat = os.stat(os.path.join(path, name))
                     items.append({
-                        "name": entry.name,
-                        "type": "dir" if entry.is_dir() else "file",
-                        "size_kb": round(stat.st_size / 1024, 1) if entry.is_file() else None,
+                        "name": name,
+                        "type": "dir" if is_dir else "file",
+                        "size_kb": None if is_dir else round(stat.st_size / 1024, 1),
                         "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
                     })
                 except:
-                    items.append({"name": entry.name, "type": "unknown"})
-            
-            items.sort(key=lambda x: (x["type"] == "file", x["name"]))
+                    items.append({"name": name, "type": "unknown"})
+
             return {
                 "path": path,
-                "total_items": len(items),
-                "items": items[:max_items]
+                "total_items": len(records),
+                "items": items,
+                "next_cursor": json.dumps(list(key(page[-1]))) if has_more else None,
             }
         except Exception as e:
             return {"error": str(e)}
@@ -166,12 +235,15 @@ class ComputerTools:
 
     @staticmethod
     def read_file_content(file_path: str, max_chars: int = 5000) -> str:
-        """Read file content using the file processor."""
+        """Read the head of a file using the file processor; parsing stops at max_chars."""
         from app.tools.file_processor import file_processor
         try:
-            content = file_processor.read_file(file_path)
-            if len(content) > max_chars:
-                return content[:max_chars] + f"\n\n... [Truncated. Full file is {len(content)} chars]"
+            preview = file_processor.read_preview(file_path, max_chars=max_chars)
+            content = preview["content"]
+            if preview["truncated"]:
+                totals = ", ".join(f"{k.replace('total_', '')}: {preview[k]}" for k in ("total_pages", "total_rows", "total_words") if preview.get(k))
+                size = f"{preview['size_bytes'] / 1024:.0f} KB" + (f", {totals}" if totals else "")
+                return content + f"\n\n... [Truncated. Showing the first {len(content)} chars; full file is {size}]"
             return content
         except Exception as e:
             return f"Error reading file: {str(e)}"
@@ -244,39 +316,246 @@ class ComputerTools:
         return "\n".join(lines)
 
     # ─── ORGANIZE FILES ─────────────────────────────────────────────────
+    # Organizing is split into a plan step (scan once, persist the exact moves)
+    # and an execute step that applies that plan and journals every move so it
+    # can be undone in bulk.
+
+    DEFAULT_ORGANIZE_RULES = {
+        "Quotations": [".pdf", ".docx"],
+        "Spreadsheets": [".xlsx", ".xls", ".csv"],
+        "Images": [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp", ".svg"],
+        "Documents": [".doc", ".txt", ".rtf", ".pptx"],
+        "Archives": [".zip", ".rar", ".7z", ".tar", ".gz"],
+        "Shortcuts": [".lnk", ".url"],
+        "Scripts": [".py", ".bat", ".sh", ".js"],
+    }
+    # Plans and journals older than this are deleted when a new plan is made; undo needs them until then
+    ORGANIZE_RETENTION_DAYS = 30
 
     @staticmethod
-    def organize_folder(path: str, rules: Dict[str, List[str]] = None) -> Dict[str, Any]:
+    def _organize_dir() -> str:
+        from app.core.config import settings
+        d = os.path.join(settings.MEMORY_DIR, "organize")
+        os.makedirs(d, exist_ok=True)
+        return d
+
+    @staticmethod
+    def _plan_path(plan_id: str) -> str:
+        return os.path.join(ComputerTools._organize_dir(), f"{plan_id}.plan.json")
+
+    @staticmethod
+    def _journal_path(plan_id: str) -> str:
+        return os.path.join(ComputerTools._organize_dir(), f"{plan_id}.journal.jsonl")
+
+    @staticmethod
+    def plan_organize(path: str, rules: Dict[str, List[str]] = None) -> Dict[str, Any]:
         """
-        Organize files in a folder by type into subfolders.
-        Default rules sort by common procurement file types.
+        Scan a folder once and persist the move plan (source, destination, size, mtime).
+        Each extension maps to exactly one folder (first rule wins), so the plan is deterministic.
         """
-        if rules is None:
-            rules = {
-                "Quotations": [".pdf", ".docx"],
-                "Spreadsheets": [".xlsx", ".xls", ".csv"],
-                "Images": [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp", ".svg"],
-                "Documents": [".doc", ".txt", ".rtf", ".pdf", ".docx", ".xlsx", ".pptx"], # Catch-all docs
-                "Archives": [".zip", ".rar", ".7z", ".tar", ".gz"],
-                "Shortcuts": [".lnk", ".url"],
-                "Scripts": [".py", ".bat", ".sh", ".js"],
-            }
-        
-        moved = {}
+        rules = rules or ComputerTools.DEFAULT_ORGANIZE_RULES
+        ext_to_folder = {}
+        for folder_name, extensions in rules.items():
+            for ext in extensions:
+                ext_to_folder.setdefault(ext.lower(), folder_name)
+
         try:
-            for entry in os.scandir(path):
-                if entry.is_file():
-                    ext = os.path.splitext(entry.name)[1].lower()
-                    for folder_name, extensions in rules.items():
-                        if ext in extensions:
-                            dest_dir = os.path.join(path, folder_name)
-                            os.makedirs(dest_dir, exist_ok=True)
-                            dest = os.path.join(dest_dir, entry.name)
-                            shutil.move(entry.path, dest)
-                            moved.setdefault(folder_name, []).append(entry.name)
-                            break
-            return {"status": "success", "organized": moved, "total_moved": sum(len(v) for v in moved.values())}
+            path = os.path.abspath(os.path.expanduser(path))
+            moves = []
+            with os.scandir(path) as it:
+                for entry in it:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    folder_name = ext_to_folder.get(os.path.splitext(entry.name)[1].lower())
+                    if not folder_name:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    moves.append({
+                        "src": entry.path,
+                        "dest": os.path.join(path, folder_name, entry.name),
+                        "folder": folder_name,
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                    })
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+        moves.sort(key=lambda m: (m["folder"], m["src"]))
+        plan_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        plan = {
+            "plan_id": plan_id,
+            "path": path,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "state": "planned",
+            "moves": moves,
+        }
+        with open(ComputerTools._plan_path(plan_id), "w", encoding="utf-8") as f:
+            json.dump(plan, f)
+        ComputerTools.prune_organize_plans()
+
+        summary = {}
+        for m in moves:
+            summary.setdefault(m["folder"], []).append(os.path.basename(m["src"]))
+        return {"status": "success", "plan_id": plan_id, "path": path, "planned": summary, "total_planned": len(moves)}
+
+    @staticmethod
+    def load_organize_plan(plan_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(ComputerTools._plan_path(plan_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def prune_organize_plans(max_age_days: int = None) -> int:
+        """Delete plan and journal files not modified for max_age_days (by mtime, without parsing them)."""
+        cutoff = datetime.now().timestamp() - (max_age_days or ComputerTools.ORGANIZE_RETENTION_DAYS) * 86400
+        removed = 0
+        with os.scandir(ComputerTools._organize_dir()) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    @staticmethod
+    def _save_plan_state(plan: Dict[str, Any], state: str):
+        plan["state"] = state
+        tmp = ComputerTools._plan_path(plan["plan_id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(plan, f)
+        os.replace(tmp, ComputerTools._plan_path(plan["plan_id"]))
+
+    @staticmethod
+    def _move(src: str, dest: str):
+        """
+        Move without ever overwriting: dest is claimed by creating it exclusively (O_EXCL), so a
+        file that appears there concurrently raises FileExistsError instead of being replaced.
+        The source then replaces the claimed name (atomic on one volume) or is copied into it.
+        """
+        os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        try:
+            try:
+                os.replace(src, dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copyfile(src, dest)
+                shutil.copystat(src, dest)
+                os.unlink(src)
+        except BaseException:
+            # Release the claim; dest still holds only the empty placeholder or a partial copy
+            if os.path.exists(src):
+                os.unlink(dest)
+            raise
+
+    @staticmethod
+    def _apply_moves(plan_id: str, pairs: List[tuple], action: str, max_workers: int) -> Dict[str, Any]:
+        """Run (src, dest, expected_stat) moves on a thread pool and append each outcome to the journal."""
+        journal_lock = threading.Lock()
+        done, skipped, conflicts, failed = [], [], [], []
+        buckets = {"moved": done, "skipped": skipped, "conflict": conflicts, "failed": failed}
+
+        def _one(pair):
+            src, dest, expected = pair
+            reason = None
+            try:
+                st = os.stat(src)
+                if expected is not None and (st.st_size, st.st_mtime) != tuple(expected):
+                    status, reason = "skipped", "changed since plan"
+                else:
+                    ComputerTools._move(src, dest)
+                    status = "moved"
+            except FileExistsError:
+                status, reason = "conflict", "destination exists"
+            except FileNotFoundError:
+                status, reason = "skipped", "missing"
+            except Exception as e:
+                status, reason = "failed", str(e)
+            # Journal each move as soon as it happens so an interrupted run can still be undone
+            with journal_lock:
+                journal.write(json.dumps({"action": action, "src": src, "dest": dest, "status": status, "reason": reason}) + "\n")
+                journal.flush()
+                buckets[status].append({"src": src, "dest": dest, "reason": reason} if reason else {"src": src, "dest": dest})
+
+        with open(ComputerTools._journal_path(plan_id), "a", encoding="utf-8") as journal, \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(_one, pairs))
+        return {"moved": done, "skipped": skipped, "conflicts": conflicts, "failed": failed}
+
+    @staticmethod
+    def execute_organize(plan_id: str, max_workers: int = 8) -> Dict[str, Any]:
+        """Apply exactly the moves recorded in a plan. Files changed or removed since planning are skipped."""
+        plan = ComputerTools.load_organize_plan(plan_id)
+        if not plan:
+            return {"status": "error", "message": f"Unknown organize plan: {plan_id}"}
+        if plan["state"] != "planned":
+            return {"status": "error", "message": f"Plan {plan_id} is already {plan['state']}"}
+
+        for folder in {os.path.dirname(m["dest"]) for m in plan["moves"]}:
+            os.makedirs(folder, exist_ok=True)
+
+        ComputerTools._save_plan_state(plan, "executing")
+        pairs = [(m["src"], m["dest"], (m["size"], m["mtime"])) for m in plan["moves"]]
+        outcome = ComputerTools._apply_moves(plan_id, pairs, "organize", max_workers)
+        ComputerTools._save_plan_state(plan, "executed")
+        ComputerTools.invalidate_listing(plan["path"])
+
+        organized = {}
+        for m in outcome["moved"]:
+            organized.setdefault(os.path.basename(os.path.dirname(m["dest"])), []).append(os.path.basename(m["src"]))
+        logger.info(f"Organize plan {plan_id}: moved {len(outcome['moved'])}, skipped {len(outcome['skipped'])}, "
+                    f"conflicts {len(outcome['conflicts'])}, failed {len(outcome['failed'])}")
+        return {
+            "status": "success",
+            "plan_id": plan_id,
+            "organized": organized,
+            "total_moved": len(outcome["moved"]),
+            "skipped": outcome["skipped"],
+            "conflicts": outcome["conflicts"],
+            "failed": outcome["failed"],
+        }
+
+    @staticmethod
+    def undo_organize(plan_id: str, max_workers: int = 8) -> Dict[str, Any]:
+        """Reverse every successful move recorded in a plan's journal, including a run that was interrupted."""
+        plan = ComputerTools.load_organize_plan(plan_id)
+        if not plan:
+            return {"status": "error", "message": f"Unknown organize plan: {plan_id}"}
+        if plan["state"] not in ("executed", "executing"):
+            return {"status": "error", "message": f"Plan {plan_id} is {plan['state']}, nothing to undo"}
+
+        moved = []
+        journal_path = ComputerTools._journal_path(plan_id)
+        if not os.path.exists(journal_path):
+            journal_path = os.devnull  # interrupted before the first move
+        with open(journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # last line of a run killed mid-write
+                if rec["action"] == "organize" and rec["status"] == "moved":
+                    moved.append((rec["dest"], rec["src"], None))
+
+        outcome = ComputerTools._apply_moves(plan_id, moved, "undo", max_workers)
+        ComputerTools._save_plan_state(plan, "undone")
+        ComputerTools.invalidate_listing(plan["path"])
+        return {"status": "success", "plan_id": plan_id, "total_restored": len(outcome["moved"]),
+                "conflicts": outcome["conflicts"], "failed": outcome["failed"]}
+
+    @staticmethod
+    def organize_folder(path: str, rules: Dict[str, List[str]] = None) -> Dict[str, Any]:
+        """
+        Organize files in a folder by type into subfolders.
+        Default rules sort by common procurement file types.
+        """
+        plan = ComputerTools.plan_organize(path, rules)
+        if plan.get("status") != "success":
+            return plan
+        return ComputerTools.execute_organize(plan["plan_id"])
+
 computer_tools = ComputerTools()
@@ -1,10 +1,62 @@
 import smtplib
+import logging
+import socket
+import threading
+import time
+import uuid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.core.config import settings
-from typing import Optional
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Failures worth retrying on a fresh connection. 4xx replies are retried too; 5xx replies and
+# every other SMTPException / OSError (e.g. SMTPNotSupportedError) are permanent. Every
+# SMTPException is an OSError, so OSError itself must not be listed here.
+_TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError, socket.timeout)
+
 
 class EmailService:
+    """
+    Outbound mail through one persistent, reused SMTP connection.
+    `send_email` / `send_batch` send synchronously; `enqueue` writes messages to the
+    email_outbox table and a background worker sends them, so request handlers return
+    immediately. The outbox is shared by all worker processes and survives restarts;
+    bodies are dropped once sent and finished rows after EMAIL_OUTBOX_RETAIN_DAYS.
+    """
+
+    # A "sending" row not finished after this long belongs to a process that died; it is retried
+    STALE_SENDING_SECONDS = 600
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._db_lock = memory_manager.write_lock  # outbox writes; _lock guards the SMTP connection
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.conn = memory_manager.sqlite_conn
+        with self._db_lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id TEXT PRIMARY KEY,
+                    to_addr TEXT,
+                    subject TEXT,
+                    body TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER,
+                    queued_at REAL,
+                    claimed_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_status ON email_outbox (status, queued_at)")
+            self.conn.commit()
+
     @staticmethod
     def draft_email(to: str, subject: str, body: str, tone: str = "polite"):
         """
@@ -18,23 +70,189 @@ class EmailService:
             "status": "pending_approval"
         }
 
+    # ─── Connection ─────────────────────────────────────────────────────
+
+    @staticmethod
+    def _credentials_missing() -> bool:
+        return settings.SMTP_AUTH and not (settings.GMAIL_USER and settings.GMAIL_APP_PASSWORD)
+
+    def _connect(self) -> smtplib.SMTP:
+        if settings.SMTP_SSL:
+            server = smtplib.SMTP_SSL(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+            if settings.SMTP_STARTTLS:
+                server.starttls()
+        if settings.SMTP_AUTH:
+            server.login(settings.GMAIL_USER, settings.GMAIL_APP_PASSWORD)
+        logger.info(f"SMTP connected to {settings.SMTP_HOST}:{settings.SMTP_PORT}")
+        return server
+
+    def _connection(self) -> smtplib.SMTP:
+        """Reuse the open connection; probe it with NOOP if it has been idle, reconnect if dead."""
+        if self._smtp is not None and time.monotonic() - self._last_used > settings.SMTP_IDLE_CHECK_SECONDS:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._close()
+            except OSError:  # includes SMTPException
+                self._close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    # ─── Sending ────────────────────────────────────────────────────────
+
     @staticmethod
-    def send_email(to: str, subject: str, body: str):
-        if not settings.GMAIL_USER or not settings.GMAIL_APP_PASSWORD:
+    def _build_message(to: str, subject: str, body: str) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = settings.EMAIL_FROM or settings.GMAIL_USER
+        msg['To'] = to
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
+    def _send_with_retry(self, msg: MIMEMultipart) -> Dict[str, Any]:
+        """Send one message on the shared connection with exponential backoff on transient errors."""
+        attempts = settings.EMAIL_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            try:
+                with self._lock:
+                    self._connection().send_message(msg)
+                    self._last_used = time.monotonic()
+                return {"status": "sent", "attempts": attempt + 1}
+            except smtplib.SMTPResponseException as e:
+                with self._lock:
+                    self._close()
+                if e.smtp_code < 400 or e.smtp_code >= 500 or attempt == attempts - 1:
+                    return {"error": f"{e.smtp_code} {e.smtp_error!r}", "attempts": attempt + 1}
+            except smtplib.SMTPRecipientsRefused as e:
+                return {"error": f"Recipient refused: {list(e.recipients)}", "attempts": attempt + 1}
+            except _TRANSIENT_ERRORS as e:
+                with self._lock:
+                    self._close()
+                if attempt == attempts - 1:
+                    return {"error": str(e), "attempts": attempt + 1}
+            except (smtplib.SMTPException, OSError) as e:
+                with self._lock:
+                    self._close()
+                return {"error": f"{type(e).__name__}: {e}", "attempts": attempt + 1}
+            delay = settings.EMAIL_RETRY_BASE_SECONDS * (2 ** attempt)
+            logger.warning(f"SMTP send to {msg['To']} failed (attempt {attempt + 1}), retrying in {delay}s")
+            time.sleep(delay)
+
+    def send_email(self, to: str, subject: str, body: str):
+        if self._credentials_missing():
             return {"error": "Email credentials not configured."}
-        
         try:
-            msg = MIMEMultipart()
-            msg['From'] = settings.GMAIL_USER
-            msg['To'] = to
-            msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'plain'))
-            
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-                server.login(settings.GMAIL_USER, settings.GMAIL_APP_PASSWORD)
-                server.send_message(msg)
-            return {"status": "sent"}
+            return self._send_with_retry(self._build_message(to, subject, body))
         except Exception as e:
             return {"error": str(e)}
 
-email_service = EmailService()
+    def send_batch(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Send many messages over the same connection (one TLS handshake and login for the batch)."""
+        if self._credentials_missing():
+            return [{"to": m.get("to"), "error": "Email credentials not configured."} for m in messages]
+        results = []
+        for m in messages:
+            result = self.send_email(m["to"], m["subject"], m["body"])
+            results.append({"to": m["to"], **result})
+        return results
+
+    # ─── Queue ──────────────────────────────────────────────────────────
+
+    def enqueue(self, to: str, subject: str, body: str) -> str:
+        """Queue a message for background delivery and return its outbox id."""
+        message_id = uuid.uuid4().hex
+        with self._db_lock:
+            self.conn.execute(
+                "INSERT INTO email_outbox (id, to_addr, subject, body, status, queued_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (message_id, to, subject, body, time.time()),
+            )
+            self.conn.commit()
+        self._ensure_worker()
+        self._wakeup.set()
+        return message_id
+
+    def enqueue_batch(self, messages: List[Dict[str, str]]) -> List[str]:
+        return [self.enqueue(m["to"], m["subject"], m["body"]) for m in messages]
+
+    def outbox_status(self, message_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT id, to_addr, subject, status, error, attempts, queued_at, finished_at FROM email_outbox WHERE id = ?",
+            (message_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(("id", "to", "subject", "status", "error", "attempts", "queued_at", "finished_at"), row))
+        return {k: v for k, v in record.items() if v is not None}
+
+    def resume(self):
+        """Start sending messages left queued by an earlier run (called by the ingestion leader)."""
+        if self.conn.execute("SELECT 1 FROM email_outbox WHERE status IN ('queued', 'sending') LIMIT 1").fetchone():
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._drain, name="email-outbox", daemon=True)
+            self._worker.start()
+
+    def _claim_next(self) -> Optional[tuple]:
+        now = time.time()
+        row = self.conn.execute("""
+            SELECT id, to_addr, subject, body FROM email_outbox
+            WHERE status = 'queued' OR (status = 'sending' AND claimed_at < ?)
+            ORDER BY queued_at LIMIT 1
+        """, (now - self.STALE_SENDING_SECONDS,)).fetchone()
+        if row is None:
+            return None
+        with self._db_lock:
+            # Conditional update: another process may have claimed the same row first
+            claimed = self.conn.execute(
+                "UPDATE email_outbox SET status = 'sending', claimed_at = ? WHERE id = ? AND (status = 'queued' OR claimed_at < ?)",
+                (now, row[0], now - self.STALE_SENDING_SECONDS),
+            ).rowcount
+            self.conn.commit()
+        return row if claimed else self._claim_next()
+
+    def _prune(self):
+        with self._db_lock:
+            self.conn.execute(
+                "DELETE FROM email_outbox WHERE status IN ('sent', 'failed') AND finished_at < ?",
+                (time.time() - settings.EMAIL_OUTBOX_RETAIN_DAYS * 86400,),
+            )
+            self.conn.commit()
+
+    def _drain(self):
+        self._prune()
+        while True:
+            claimed = self._claim_next()
+            if claimed is None:
+                # Idle: release the connection until something is queued
+                self.close()
+                self._wakeup.wait(timeout=30)
+                self._wakeup.clear()
+                continue
+            message_id, to, subject, body = claimed
+            result = self.send_email(to, subject, body)
+            sent = result.get("status") == "sent"
+            with self._db_lock:
+                # The body is only kept while it may still need sending
+                self.conn.execute(
+                    "UPDATE email_outbox SET status = ?, error = ?, attempts = ?, finished_at = ?, body = NULL WHERE id = ?",
+                    ("sent" if sent else "failed", result.get("error"), result.get("attempts"), time.time(), message_id),
+                )
+                self.conn.commit()
+
+email_service = LazySingleton("email", EmailService)
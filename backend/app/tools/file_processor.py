@@ -1,18 +1,38 @@
 import os
-import pandas as pd
-from PyPDF2 import PdfReader
-from docx import Document
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from app.core.lazy import lazy_import
 from app.tools.ocr import ocr_tool
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, List
+
+pd = lazy_import("pandas")
+PyPDF2 = lazy_import("PyPDF2")
+openpyxl = lazy_import("openpyxl")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_EP = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
+
+# Every reader takes optional budgets (max_chars, and max_pages / max_rows where the format
+# has them) and stops parsing once they are spent. Totals that are cheap to know without
+# reading everything (page count, sheet dimensions, byte size) go into the optional `meta` dict.
 
 class FileProcessor:
     @staticmethod
-    def read_pdf(file_path: str) -> str:
+    def read_pdf(file_path: str, max_chars: Optional[int] = None, max_pages: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
         text = ""
         try:
-            reader = PdfReader(file_path)
+            reader = PyPDF2.PdfReader(file_path)
+            total_pages = len(reader.pages)  # from the page tree; no page content is parsed
+            read = 0
             for page in reader.pages:
-                text += page.extract_text() + "\n"
+                if (max_pages is not None and read >= max_pages) or (max_chars is not None and len(text) >= max_chars):
+                    break
+                # Form feed marks page boundaries for chunked extraction
+                text += (page.extract_text() or "") + "\n\f"
+                read += 1
+            if meta is not None:
+                meta.update(total_pages=total_pages, pages_read=read, truncated=read < total_pages)
             
             if len(text.strip()) < 50: # Likely scanned
                 # In production, we'd use pdf2image here
@@ -22,46 +42,236 @@ class FileProcessor:
             return f"Error reading PDF: {str(e)}"
 
     @staticmethod
-    def read_docx(file_path: str) -> str:
+    def read_docx(file_path: str, max_chars: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+        """Body paragraphs and tables (as pipe-separated rows) in document order."""
         try:
-            doc = Document(file_path)
-            return "\n".join([para.text for para in doc.paragraphs])
+            with zipfile.ZipFile(file_path) as z:
+                if meta is not None:
+                    meta.update(FileProcessor._docx_properties(z))
+                blocks, _, truncated = FileProcessor._parse_docx(z, max_chars)
+            if meta is not None:
+                meta.update(blocks_read=len(blocks), truncated=truncated)
+            return "\n".join(blocks)
         except Exception as e:
             return f"Error reading DOCX: {str(e)}"
 
     @staticmethod
-    def read_excel(file_path: str) -> str:
+    def _parse_docx(z: "zipfile.ZipFile", max_chars: Optional[int] = None) -> Tuple[list, list, bool]:
+        """
+        Stream word/document.xml: returns (text blocks, top-level tables as rows of cell
+        strings, truncated). Stops once max_chars of text has been produced.
+        """
+        blocks, tables, size = [], [], 0
+        depth, parts, cell, row, table = 0, [], [], [], []
+        with z.open("word/document.xml") as xml:
+            for event, elem in ET.iterparse(xml, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == f"{_W}tbl":
+                        depth += 1
+                    continue
+                if tag == f"{_W}t":
+                    parts.append(elem.text or "")
+                elif tag == f"{_W}tab":
+                    parts.append("\t")
+                elif tag in (f"{_W}br", f"{_W}cr"):
+                    parts.append("\n")
+                elif tag == f"{_W}p":
+                    text = "".join(parts)
+                    parts = []
+                    if depth == 0:
+                        blocks.append(text)
+                        size += len(text) + 1
+                    else:
+                        cell.append(text)  # nested tables flatten into the enclosing cell
+                    elem.clear()
+                elif tag == f"{_W}tc" and depth == 1:
+                    row.append("\n".join(cell).strip())
+                    cell = []
+                elif tag == f"{_W}tr" and depth == 1:
+                    table.append(row)
+                    row = []
+                elif tag == f"{_W}tbl":
+                    depth -= 1
+                    if depth == 0:
+                        tables.append(table)
+                        rendered = "\n".join(" | ".join(c.replace("\n", " ") for c in r) for r in table)
+                        blocks.append(rendered)
+                        size += len(rendered) + 1
+                        table = []
+                        elem.clear()
+                if depth == 0 and max_chars is not None and size >= max_chars:
+                    return blocks, tables, True
+        return blocks, tables, False
+
+    @staticmethod
+    def read_tables(file_path: str, max_rows: Optional[int] = None) -> List[List[List[str]]]:
+        """Tables of a DOCX (top-level tables) or XLSX (one per sheet) as rows of cell strings."""
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == ".docx":
+            with zipfile.ZipFile(file_path) as z:
+                return [t[:max_rows] if max_rows else t for t in FileProcessor._parse_docx(z)[1]]
+        if ext == ".xlsx":
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                tables = []
+                for ws in wb.worksheets:
+                    rows = []
+                    for values in ws.iter_rows(values_only=True):
+                        cells = ["" if v is None else str(v).strip() for v in values]
+                        while cells and not cells[-1]:
+                            cells.pop()
+                        if cells:
+                            rows.append(cells)
+                        if max_rows and len(rows) >= max_rows:
+                            break
+                    tables.append(rows)
+                return tables
+            finally:
+                wb.close()
+        return []
+
+    @staticmethod
+    def _docx_properties(z: "zipfile.ZipFile") -> Dict[str, Any]:
+        # Word stores page/word/character counts in docProps/app.xml when it saves
+        try:
+            root = ET.fromstring(z.read("docProps/app.xml"))
+        except (KeyError, ET.ParseError):
+            return {}
+        props = {}
+        for tag, key in (("Pages", "total_pages"), ("Words", "total_words"), ("Characters", "total_chars")):
+            node = root.find(f"{_EP}{tag}")
+            if node is not None and (node.text or "").isdigit() and int(node.text) > 0:
+                props[key] = int(node.text)
+        return props
+
+    @staticmethod
+    def read_excel(file_path: str, max_chars: Optional[int] = None, max_rows: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
         try:
-            df = pd.read_excel(file_path)
+            if max_rows is None and max_chars is not None:
+                max_rows = max_chars // 20 + 1  # a markdown row is rarely shorter than this
+            if meta is not None and file_path.lower().endswith(".xlsx"):
+                # Read-only mode takes the sheet size from its <dimension> tag without loading cells
+                wb = openpyxl.load_workbook(file_path, read_only=True)
+                ws = wb.worksheets[0]
+                meta.update(total_rows=max((ws.max_row or 1) - 1, 0), total_columns=ws.max_column, sheets=wb.sheetnames)
+                wb.close()
+            df = pd.read_excel(file_path, nrows=max_rows)
+            if meta is not None:
+                meta.update(rows_read=len(df), truncated=max_rows is not None and len(df) >= max_rows)
             # Convert to markdown for LLM to understand structure easily
             return df.to_markdown()
         except Exception as e:
             return f"Error reading Excel: {str(e)}"
 
     @staticmethod
-    def read_file(file_path: str) -> str:
+    def read_text(file_path: str, max_chars: Optional[int] = None, max_rows: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            if max_rows is not None:
+                lines = []
+                for line in f:
+                    if len(lines) >= max_rows:
+                        break
+                    lines.append(line)
+                text = "".join(lines)
+            else:
+                text = f.read(-1 if max_chars is None else max_chars)
+            more = f.read(1) != ""
+        if meta is not None:
+            meta.update(truncated=more)
+        return text
+
+    @staticmethod
+    def read_file(file_path: str, max_chars: Optional[int] = None, max_pages: Optional[int] = None,
+                  max_rows: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
         ext = os.path.splitext(file_path)[1].lower()
-        if ext == '.pdf': return FileProcessor.read_pdf(file_path)
-        if ext in ['.xlsx', '.xls']: return FileProcessor.read_excel(file_path)
-        if ext == '.docx': return FileProcessor.read_docx(file_path)
-        if ext in ['.jpg', '.jpeg', '.png']: return ocr_tool.extract_text(file_path)
-        if ext in ['.txt', '.csv']:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+        if meta is not None:
+            meta["size_bytes"] = os.path.getsize(file_path)
+        if ext == '.pdf': return FileProcessor.read_pdf(file_path, max_chars, max_pages, meta)
+        if ext in ['.xlsx', '.xls']: return FileProcessor.read_excel(file_path, max_chars, max_rows, meta)
+        if ext == '.docx': return FileProcessor.read_docx(file_path, max_chars, meta)
+        if ext in ['.jpg', '.jpeg', '.png']: return ocr_tool.extract_text(file_path, max_chars, meta)
+        if ext in ['.txt', '.csv']: return FileProcessor.read_text(file_path, max_chars, max_rows, meta)
         return "Unsupported file format."
 
+    @staticmethod
+    def read_preview(file_path: str, max_chars: int = 5000, max_pages: Optional[int] = None, max_rows: Optional[int] = None) -> Dict[str, Any]:
+        """Bounded read for chat previews: at most ~max_chars of content plus size metadata."""
+        meta: Dict[str, Any] = {}
+        content = FileProcessor.read_file(file_path, max_chars, max_pages, max_rows, meta)
+        if len(content) > max_chars:
+            content = content[:max_chars]
+            meta["truncated"] = True
+        return {"content": content, "truncated": bool(meta.pop("truncated", False)), **meta}
+
+    # Only the head of a document decides its type; titles and reference blocks live there.
+    CLASSIFY_PREFIX_CHARS = 4000
+    TITLE_REGION_CHARS = 600
+
+    @staticmethod
+    def classify_document(content: str) -> Tuple[str, float]:
+        """
+        Score weighted keyword features over a bounded prefix of the text.
+        Returns (document_type, confidence in [0, 1]); ("Unknown", 0.0) when nothing matches.
+        """
+        head = content[:FileProcessor.CLASSIFY_PREFIX_CHARS]
+        scores = {}
+        for doc_type, features in _DOC_TYPE_FEATURES:
+            score = 0.0
+            for pattern, weight in features:
+                hits = 0
+                for match in pattern.finditer(head):
+                    # Matches in the title region count double; repeated hits saturate at 3
+                    hits += 2 if match.start() < FileProcessor.TITLE_REGION_CHARS else 1
+                    if hits >= 3:
+                        break
+                score += weight * min(hits, 3)
+            scores[doc_type] = score
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        (best, top), (_, second) = ranked[0], ranked[1]
+        if top == 0:
+            return "Unknown", 0.0
+        # Margin over the runner-up, discounted when the evidence itself is thin
+        confidence = (top - second) / top * min(1.0, top / 8)
+        return best, round(confidence, 2)
+
     @staticmethod
     def detect_document_type(content: str) -> str:
-        # Keywords based detection
-        content_lower = content.lower()
-        if "quotation" in content_lower or "quote" in content_lower or "proforma" in content_lower:
-            return "Quotation"
-        if "purchase order" in content_lower or "po #" in content_lower:
-            return "Purchase Order"
-        if "request for quotation" in content_lower or "rfq" in content_lower:
-            return "RFQ"
-        if "invoice" in content_lower:
-            return "Invoice"
-        return "Unknown"
+        return FileProcessor.classify_document(content)[0]
+
+
+# (document type, [(compiled pattern, weight)]). "request for quotation" is an RFQ feature
+# strong enough to outweigh the "quotation" it contains.
+_DOC_TYPE_FEATURES = [
+    ("Quotation", [
+        (re.compile(r"\bquotation\b", re.I), 3.0),
+        (re.compile(r"\bquote\b", re.I), 2.0),
+        (re.compile(r"\bpro[- ]?forma\b", re.I), 3.0),
+        (re.compile(r"\b(?:quote|offer) (?:no|ref|number)\b", re.I), 2.0),
+        (re.compile(r"\bvalid(?:ity)?\b[^\n]{0,20}\b(?:days|until|till)\b", re.I), 1.5),
+        (re.compile(r"\bwe are pleased to (?:quote|offer)\b|\bour (?:best )?offer\b", re.I), 2.0),
+    ]),
+    ("RFQ", [
+        (re.compile(r"\brequest for (?:quotation|quote|proposal)s?\b", re.I), 7.0),
+        (re.compile(r"\bRFQ\b", re.I), 4.0),
+        (re.compile(r"\b(?:please|kindly) (?:quote|submit|send)\b", re.I), 2.0),
+        (re.compile(r"\b(?:last|closing|due) date for (?:submission|quotations?)\b", re.I), 2.0),
+        (re.compile(r"\binvite you to (?:quote|submit)\b", re.I), 2.0),
+    ]),
+    ("Purchase Order", [
+        (re.compile(r"\bpurchase order\b", re.I), 5.0),
+        (re.compile(r"\bP\.?O\.?\s*(?:#|no\b|number\b)", re.I), 3.0),
+        (re.compile(r"\b(?:ship|deliver) to\b", re.I), 1.0),
+        (re.compile(r"\border (?:date|no|number)\b", re.I), 1.0),
+    ]),
+    ("Invoice", [
+        (re.compile(r"\b(?:tax |commercial )?invoice\b", re.I), 4.0),
+        (re.compile(r"\binvoice (?:no|number|date|#)", re.I), 2.0),
+        (re.compile(r"\b(?:amount|balance|total) due\b", re.I), 2.0),
+        (re.compile(r"\bdue date\b", re.I), 1.0),
+        (re.compile(r"\bbill to\b", re.I), 1.0),
+    ]),
+]
 
 file_processor = FileProcessor()
@@ -1,23 +1,253 @@
-import pytesseract
-from PIL import Image
+import importlib.util
+import io
+import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Union
+
+from app.core.config import settings
+from app.core.lazy import LazySingleton, lazy_import
+
+pytesseract = lazy_import("pytesseract")
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+DESKEW_MAX_DEGREES = 5.0
+DESKEW_STEP_DEGREES = 0.5
+DESKEW_SAMPLE_SIDE = 800  # skew is estimated on a thumbnail; the correction is applied at full size
+
+# ─── Worker process ──────────────────────────────────────────────────
+# One engine per worker process, created once in the pool initializer. With tesserocr
+# installed it is a resident Tesseract API (no process spawn per image); otherwise
+# pytesseract, which still runs the tesseract binary per call but off the server process.
+_engine = None
+_engine_name = None
+_dpi = None
+
+
+def _init_worker(lang: str, dpi: int):
+    global _engine, _engine_name, _dpi
+    _dpi = dpi
+    try:
+        import tesserocr
+        _engine = tesserocr.PyTessBaseAPI(lang=lang)
+        _engine.SetVariable("user_defined_dpi", str(dpi))
+        _engine_name = "tesserocr"
+    except Exception:
+        _engine = lang
+        _engine_name = "pytesseract"
+
+
+def _otsu_threshold(gray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    weights = np.cumsum(hist)
+    means = np.cumsum(hist * np.arange(256))
+    between = (means[-1] * weights - means * total) ** 2 / np.maximum(weights * (total - weights), 1)
+    return int(between.argmax())
+
+
+def _skew_angle(image) -> float:
+    """Rotation (degrees) that makes text lines horizontal: the one with the sharpest row-ink profile."""
+    thumb = image.copy()
+    thumb.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE))
+    ink = np.asarray(thumb) < _otsu_threshold(np.asarray(thumb))
+    if ink.mean() < 0.005:
+        return 0.0
+    ink_image = Image.fromarray((ink * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-DESKEW_MAX_DEGREES, DESKEW_MAX_DEGREES + 1e-9, DESKEW_STEP_DEGREES):
+        profile = np.asarray(ink_image.rotate(float(angle), resample=Image.NEAREST)).sum(axis=1, dtype=np.float64)
+        score = float(np.square(np.diff(profile)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess(image, max_side: int, target_dpi: int, deskew: bool = True):
+    """Upright grayscale image, scaled to target_dpi (and at most max_side px), deskewed and binarized."""
+    image = ImageOps.exif_transpose(image).convert("L")
+    dpi = (image.info.get("dpi") or (0, 0))[0]
+    scale = target_dpi / dpi if dpi else 1.0
+    scale = min(scale, max_side / max(image.size))
+    if abs(scale - 1.0) > 0.05:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC)
+    if deskew:
+        angle = _skew_angle(image)
+        if angle:
+            image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    gray = np.asarray(image)
+    return Image.fromarray(np.where(gray > _otsu_threshold(gray), 255, 0).astype(np.uint8))
+
+
+def _preview_band(image, max_chars: int):
+    """
+    Top of a binarized page that holds roughly max_chars of text (about 10 characters per
+    inch across, 6 lines per inch down), cut on a blank row so no line is split.
+    Returns (band, truncated).
+    """
+    chars_per_line = max(1, image.width * 10 // _dpi)
+    height = (max_chars // chars_per_line + 1) * _dpi // 6
+    if height >= image.height:
+        return image, False
+    blank = np.flatnonzero((np.asarray(image)[height:] == 0).mean(axis=1) < 0.002)
+    if not len(blank):
+        return image, False
+    cut = height + int(blank[0])
+    return image.crop((0, 0, image.width, cut)), True
+
+
+def _ocr_job(source: Union[str, bytes], max_side: int, deskew: bool, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    # Errors go back as plain data: some library exceptions do not unpickle and would break the pool
+    start = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        image = preprocess(image, max_side, _dpi, deskew)
+        truncated = False
+        if max_chars is not None:
+            # Previews recognize only the head of the page
+            image, truncated = _preview_band(image, max_chars)
+        prepared = time.perf_counter()
+        if _engine_name == "tesserocr":
+            _engine.SetImage(image)
+            text = _engine.GetUTF8Text()
+        else:
+            text = pytesseract.image_to_string(image, lang=_engine, config=f"--dpi {_dpi}")
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "engine": _engine_name}
+    done = time.perf_counter()
+    return {"text": text, "engine": _engine_name, "size": list(image.size), "truncated": truncated,
+            "preprocess_ms": round((prepared - start) * 1000, 1), "recognize_ms": round((done - prepared) * 1000, 1)}
+
+
+# ─── Server side ─────────────────────────────────────────────────────
+
+def check_engine() -> str:
+    """The engine pool workers will use; warns when only the per-image pytesseract path is available."""
+    if importlib.util.find_spec("tesserocr") is not None:
+        return "tesserocr"
+    logger.warning(
+        "tesserocr is not installed: OCR falls back to pytesseract, which starts a tesseract "
+        "process for every image. Install tesserocr for a resident engine in each OCR worker."
+    )
+    return "pytesseract"
+
 
 class OCRTool:
+    """
+    OCR through a pool of long-lived worker processes (OCR_WORKERS, default one per core).
+    Each image is preprocessed in the worker (grayscale, DPI normalization / downscaling,
+    deskew, Otsu binarization) before recognition. Per-image latency and throughput over
+    the last images are kept for /ocr/status, to size the pool.
+    """
+
+    METRICS_WINDOW = 500
+
     def __init__(self):
-        # Tesseract is assumed to be installed in the Docker image
-        pass
+        self.workers = settings.OCR_WORKERS or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=self.METRICS_WINDOW)  # (finished_at, latency_ms, preprocess_ms, recognize_ms)
+        self._processed = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._engine = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    initargs=(settings.OCR_LANG, settings.OCR_TARGET_DPI),
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _run(self, sources: List[Union[str, bytes]], max_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+        for attempt in range(2):
+            pool = self._get_pool()
+            with self._lock:
+                self._in_flight += len(sources)
+            submitted = time.perf_counter()
+            futures = [pool.submit(_ocr_job, s, settings.OCR_MAX_SIDE, settings.OCR_DESKEW, max_chars) for s in sources]
+            results = []
+            try:
+                for future in futures:
+                    result = future.result()
+                    if "error" in result:
+                        with self._lock:
+                            self._errors += 1
+                    else:
+                        result["latency_ms"] = round((time.perf_counter() - submitted) * 1000, 1)
+                        self._record(result)
+                    results.append(result)
+                return results
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory on a huge scan): rebuild the pool once
+                logger.warning("OCR worker pool broke; restarting it")
+                self._reset_pool()
+                if attempt:
+                    raise
+            finally:
+                with self._lock:
+                    self._in_flight -= len(sources)
+
+    def _record(self, result: Dict[str, Any]):
+        with self._lock:
+            self._processed += 1
+            self._engine = result["engine"]
+            self._recent.append((time.time(), result["latency_ms"], result["preprocess_ms"], result["recognize_ms"]))
+
+    def extract_text(self, image_path: str, max_chars: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+        """Text of an image; with max_chars only the top of the page that holds about that much is recognized."""
+        result = self._run([image_path], max_chars)[0]
+        if "error" in result:
+            return f"OCR Error: {result['error']}"
+        if meta is not None:
+            meta.update(truncated=result["truncated"])
+        return result["text"]
+
+    def extract_batch(self, images: List[Union[str, bytes]]) -> Dict[str, Any]:
+        """OCR several images (paths or raw bytes) in parallel across the pool."""
+        start = time.perf_counter()
+        results = self._run(list(images))
+        elapsed = time.perf_counter() - start
+        return {"results": results, "images": len(results), "duration_ms": round(elapsed * 1000, 1),
+                "images_per_second": round(len(results) / elapsed, 2) if elapsed else None}
 
-    def extract_text(self, image_path: str) -> str:
-        try:
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image)
-            return text
-        except Exception as e:
-            return f"OCR Error: {str(e)}"
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            stats = {"workers": self.workers, "engine": self._engine, "processed": self._processed,
+                     "errors": self._errors, "in_flight": self._in_flight}
+        if recent:
+            latencies = sorted(r[1] for r in recent)
+            span = recent[-1][0] - recent[0][0]
+            stats.update(
+                latency_ms_p50=latencies[len(latencies) // 2],
+                latency_ms_p95=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                preprocess_ms_avg=round(sum(r[2] for r in recent) / len(recent), 1),
+                recognize_ms_avg=round(sum(r[3] for r in recent) / len(recent), 1),
+                images_per_second=round((len(recent) - 1) / span, 2) if span > 0 else None,
+            )
+        return stats
 
     def extract_from_pdf_scanned(self, pdf_path: str) -> str:
         # Placeholder for complex multi-page PDF OCR
         # Usually requires pdf2image to convert pages to images first
         return "Scanned PDF OCR not yet fully implemented. Requires pdf2image."
 
-ocr_tool = OCRTool()
+ocr_tool = LazySingleton("ocr", OCRTool)
@@ -0,0 +1,274 @@
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.fingerprints import normalize_name
+from app.core.lazy import LazySingleton
+from app.core.memory import memory_manager, parse_number
+from app.tools.file_processor import file_processor
+
+logger = logging.getLogger(__name__)
+
+# Header cell synonyms per QUOTE_SCHEMA item field, most specific first
+HEADER_SYNONYMS = {
+    "material": ["item description", "description of goods", "description", "particulars", "material", "product", "item name", "item", "specification"],
+    "qty": ["quantity", "qty", "nos", "no of units"],
+    "unit": ["uom", "unit of measure", "unit"],
+    "unit_price": ["unit price", "unit rate", "rate per unit", "price per unit", "price/unit", "rate", "price"],
+    "total": ["line total", "total amount", "total price", "amount", "total", "value"],
+}
+_SKIP_HEADERS = ("s no", "sl no", "sr no", "s.no", "sno", "#", "no")
+
+_TOTAL_ROW = re.compile(r"\b(?:grand\s+)?total\b|\bsub\s*-?total\b|\bnet amount\b", re.I)
+_CURRENCIES = [("INR", re.compile(r"₹|\bINR\b|\bRs\.?(?=\s|\d)", re.I)), ("USD", re.compile(r"\bUSD\b|US\$|\$")),
+               ("EUR", re.compile(r"€|\bEUR\b")), ("GBP", re.compile(r"£|\bGBP\b"))]
+_FIELDS = {
+    "quote_reference": re.compile(r"\b(?:quotation|quote|offer|ref(?:erence)?)\s*(?:no\.?|number|#|ref\.?)\s*[:\-]?\s*([A-Z0-9][A-Z0-9/\-_.]{2,})", re.I),
+    "payment_terms": re.compile(r"\bpayment(?:\s+terms)?\s*[:\-]\s*([^\n|]{3,80})", re.I),
+    "validity": re.compile(r"\bvalidity\s*[:\-]?\s*([^\n|]{2,40})|\bvalid\s+(?:for|till|until)\s+([^\n|]{2,40})", re.I),
+    "delivery_weeks": re.compile(r"\bdelivery[^\n|:]{0,20}[:\-]?\s*(?:within\s+)?(\d+(?:\.\d+)?)\s*(weeks?|wks?|days?)", re.I),
+    "vendor_name": re.compile(r"\b(?:vendor|supplier|from|company)\s*(?:name)?\s*[:\-]\s*([^\n|]{3,80})", re.I),
+    "date": re.compile(r"\bdate[d]?\s*[:\-]?\s*([0-9]{1,4}[./\-][0-9]{1,2}[./\-][0-9]{2,4}|\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4})", re.I),
+}
+
+
+def _date(text: str) -> Optional[str]:
+    for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%d %b %Y", "%d %B %Y"):
+        try:
+            return datetime.strptime(text.strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _header_key(cell: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9/#]+", cell.lower()))
+
+
+def _signature(header: List[str]) -> str:
+    return "|".join(_header_key(c) for c in header)
+
+
+class QuoteTableExtractor:
+    """
+    Fills ProcurementAgent.QUOTE_SCHEMA from DOCX/XLSX tables without the LLM.
+    Columns are mapped by a learned per-vendor layout template ((vendor, header signature)
+    -> column mapping, saved after an LLM extraction of the same layout) or by header
+    synonyms. A template only applies when the document itself names that vendor: common
+    headers are shared by many vendors. The result carries a confidence; the caller uses
+    the LLM below RULE_EXTRACT_MIN_CONFIDENCE.
+    """
+
+    HEADER_SCAN_ROWS = 6
+
+    def __init__(self):
+        self.conn = memory_manager.sqlite_conn
+        self._lock = memory_manager.write_lock  # shared by every writer on the connection
+        with self._lock:
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(extraction_templates)")}
+            if columns and "vendor_key" not in columns:
+                # Templates keyed by signature alone could name the wrong vendor; they are relearned
+                self.conn.execute("DROP TABLE extraction_templates")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS extraction_templates (
+                    vendor_key TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    vendor_name TEXT,
+                    mapping TEXT,
+                    uses INTEGER DEFAULT 0,
+                    created TEXT DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (vendor_key, signature)
+                )
+            """)
+            self.conn.commit()
+
+    # ─── Column mapping ─────────────────────────────────────────────────
+
+    @staticmethod
+    def _map_by_synonyms(header: List[str]) -> Dict[str, int]:
+        mapping, used = {}, set()
+        for field, synonyms in HEADER_SYNONYMS.items():
+            for synonym in synonyms:
+                for i, cell in enumerate(header):
+                    key = _header_key(cell)
+                    if i in used or not key or key in _SKIP_HEADERS:
+                        continue
+                    if key == synonym or re.search(rf"\b{re.escape(synonym)}\b", key):
+                        mapping[field] = i
+                        used.add(i)
+                        break
+                if field in mapping:
+                    break
+        return mapping
+
+    def _template(self, vendor_name: Optional[str], signature: str) -> Optional[Dict[str, Any]]:
+        vendor_key = normalize_name(vendor_name)
+        if not vendor_key:
+            return None
+        row = self.conn.execute(
+            "SELECT vendor_name, mapping FROM extraction_templates WHERE vendor_key = ? AND signature = ?", (vendor_key, signature)
+        ).fetchone()
+        return {"vendor_name": row[0], "mapping": json.loads(row[1])} if row else None
+
+    def _find_item_table(self, tables: List[List[List[str]]], vendor_name: Optional[str]) -> Optional[Tuple[int, int, Dict[str, int], Optional[Dict[str, Any]]]]:
+        """(table index, header row index, column mapping, template or None) of the best line-item table."""
+        best = None
+        for t, rows in enumerate(tables):
+            for h, header in enumerate(rows[:self.HEADER_SCAN_ROWS]):
+                template = self._template(vendor_name, _signature(header))
+                mapping = {k: int(v) for k, v in template["mapping"].items()} if template else self._map_by_synonyms(header)
+                if "material" not in mapping or not ({"unit_price", "total"} & mapping.keys()):
+                    continue
+                score = len(mapping) + (10 if template else 0)
+                if best is None or score > best[0]:
+                    best = (score, t, h, mapping, template)
+        return best[1:] if best else None
+
+    # ─── Extraction ─────────────────────────────────────────────────────
+
+    def extract(self, file_path: str, text: str) -> Optional[Dict[str, Any]]:
+        """Structured quote with `_confidence` in [0, 1], or None when no item table is recognised."""
+        try:
+            tables = file_processor.read_tables(file_path)
+        except Exception as e:
+            logger.warning(f"Table parsing failed for {file_path}: {e}")
+            return None
+        head = text[:3000]
+        data: Dict[str, Any] = {field: None for field in ("vendor_name", "quote_reference", "material", "qty", "unit_price",
+                                                           "total", "currency", "delivery_weeks", "payment_terms", "date",
+                                                           "deviations", "validity")}
+        for field, pattern in _FIELDS.items():
+            match = pattern.search(head if field != "delivery_weeks" else text)
+            if not match:
+                continue
+            value = next(g for g in match.groups() if g)
+            if field == "delivery_weeks":
+                weeks = float(value)
+                data[field] = round(weeks / 7, 1) if match.group(2).lower().startswith("d") else weeks
+            elif field == "date":
+                data[field] = _date(value)
+            else:
+                data[field] = value.strip().rstrip(".,;")
+        for code, pattern in _CURRENCIES:
+            if pattern.search(text):
+                data["currency"] = code
+                break
+        if not data["vendor_name"]:
+            data["vendor_name"] = self._known_vendor_in(head)
+
+        # The vendor named in the document picks the template, never the other way round
+        found = self._find_item_table(tables, data["vendor_name"])
+        if not found:
+            return None
+        t, h, mapping, template = found
+        rows = tables[t]
+
+        items, parsed, document_total = [], 0, None
+        for row in rows[h + 1:]:
+            cell = lambda field: row[mapping[field]] if field in mapping and mapping[field] < len(row) else ""
+            material = cell("material").strip()
+            joined = " ".join(row)
+            if _TOTAL_ROW.search(material or joined) and not (material and parse_number(cell("unit_price"))):
+                document_total = parse_number(cell("total")) or parse_number(row[-1] if row else "") or document_total
+                continue
+            if not material:
+                continue
+            item = {
+                "material": material,
+                "qty": parse_number(cell("qty")),
+                "unit": cell("unit").strip() or None,
+                "unit_price": parse_number(cell("unit_price")),
+                "total": parse_number(cell("total")),
+            }
+            if item["unit_price"] is None and item["total"] is not None and item["qty"]:
+                item["unit_price"] = round(item["total"] / item["qty"], 4)
+            if item["unit_price"] is not None or item["total"] is not None:
+                parsed += 1
+            items.append(item)
+        if not items:
+            return None
+
+        data["items"] = items
+        line_sum = sum(i["total"] or (i["unit_price"] or 0) * (i["qty"] or 0) for i in items)
+        data["total"] = document_total if document_total is not None else (round(line_sum, 2) if line_sum else None)
+
+        # Confidence: the layout is recognised, rows parse, line totals add up, and the vendor is known
+        confidence = 1.0 if template else min(1.0, len(mapping) / 4)
+        confidence *= parsed / len(items)
+        checked = [i for i in items if i["qty"] and i["unit_price"] is not None and i["total"] is not None]
+        if checked:
+            consistent = sum(abs(i["qty"] * i["unit_price"] - i["total"]) <= max(1.0, 0.01 * i["total"]) for i in checked)
+            confidence *= 0.5 + 0.5 * consistent / len(checked)
+        if not data["vendor_name"]:
+            confidence *= 0.5
+        data["_confidence"] = round(confidence, 2)
+        data["_signature"] = _signature(rows[h])
+        return data
+
+    def _known_vendor_in(self, head: str) -> Optional[str]:
+        """A vendor we have quotes from whose name appears in the document head (letterhead)."""
+        key = f" {normalize_name(head)} "
+        best = None
+        for (name,) in self.conn.execute("SELECT vendor_name FROM vendor_performance WHERE vendor_name IS NOT NULL"):
+            normalized = normalize_name(name)
+            if normalized and f" {normalized} " in key and (best is None or len(normalized) > len(normalize_name(best))):
+                best = name
+        return best
+
+    # ─── Learning ───────────────────────────────────────────────────────
+
+    def learn(self, file_path: str, structured: Dict[str, Any]) -> bool:
+        """
+        After an LLM extraction, remember this layout: which column holds which item field
+        (matched against the LLM's items), for this vendor. Next time a document from the
+        same vendor has the same header, extraction is local.
+        """
+        items = [i for i in structured.get("items") or [] if isinstance(i, dict)]
+        if not items or not normalize_name(structured.get("vendor_name")):
+            return False
+        try:
+            tables = file_processor.read_tables(file_path)
+        except Exception:
+            return False
+
+        def same(cell: str, value) -> bool:
+            if value is None or not cell:
+                return False
+            if isinstance(value, (int, float)):
+                number = parse_number(cell)
+                return number is not None and abs(number - value) <= 0.005 * max(abs(value), 1)
+            return normalize_name(cell) == normalize_name(str(value))
+
+        for rows in tables:
+            for h, header in enumerate(rows[:self.HEADER_SCAN_ROWS]):
+                body = rows[h + 1:h + 1 + len(items) * 2]
+                mapping = {}
+                for field in ("material", "qty", "unit", "unit_price", "total"):
+                    values = [i.get(field) for i in items]
+                    for col in range(len(header)):
+                        if col in mapping.values():
+                            continue
+                        hits = sum(any(same(r[col] if col < len(r) else "", v) for r in body) for v in values if v is not None)
+                        if values and hits >= max(1, 0.6 * sum(v is not None for v in values)):
+                            mapping[field] = col
+                            break
+                if "material" in mapping and ({"unit_price", "total"} & mapping.keys()):
+                    with self._lock:
+                        self.conn.execute("""
+                            INSERT INTO extraction_templates (vendor_key, signature, vendor_name, mapping) VALUES (?, ?, ?, ?)
+                            ON CONFLICT(vendor_key, signature) DO UPDATE SET vendor_name = excluded.vendor_name, mapping = excluded.mapping
+                        """, (normalize_name(structured["vendor_name"]), _signature(header), structured["vendor_name"], json.dumps(mapping)))
+                        self.conn.commit()
+                    logger.info(f"Learned extraction template for {structured['vendor_name']}: {mapping}")
+                    return True
+        return False
+
+    def mark_used(self, vendor_name: Optional[str], signature: str):
+        with self._lock:
+            self.conn.execute("UPDATE extraction_templates SET uses = uses + 1 WHERE vendor_key = ? AND signature = ?",
+                              (normalize_name(vendor_name), signature))
+            self.conn.commit()
+
+quote_extractor = LazySingleton("quote_extractor", QuoteTableExtractor)
@@ -0,0 +1,123 @@
+import logging
+import time
+from typing import List, Dict, Any, Optional
+from app.core.lazy import lazy_import
+from app.core.llm import llm_engine, LLMError
+from app.core.memory import memory_manager
+from app.tools.email_service import email_service
+
+jinja2 = lazy_import("jinja2")
+
+logger = logging.getLogger(__name__)
+
+# Per-vendor personalization is rendered locally; the LLM (optionally) writes only the shared intro.
+RFQ_SUBJECT_TEMPLATE = "Request for Quotation: {{ materials | map(attribute='name') | join(', ') | truncate(80) }}{% if reference %} (Ref {{ reference }}){% endif %}"
+
+RFQ_BODY_TEMPLATE = """Dear {{ vendor.contact or vendor.name + ' team' }},
+
+{{ intro }}
+
+{% for m in materials -%}
+{{ loop.index }}. {{ m.name }}{% if m.qty %} — Qty: {{ m.qty }}{% if m.unit %} {{ m.unit }}{% endif %}{% endif %}{% if m.spec %} — Spec: {{ m.spec }}{% endif %}
+{% endfor %}
+{%- if history %}
+For reference, your most recent quotation{{ 's' if history | length > 1 }} with us:
+{% for h in history -%}
+- {{ h.material }}: {{ h.currency or '' }} {{ h.unit_price }} per unit ({{ h.date or 'date n/a' }})
+{% endfor %}
+{%- endif %}
+Please include unit price, currency, delivery lead time, payment terms and quote validity{% if due_date %}, and reply by {{ due_date }}{% endif %}.
+
+Best regards,
+{{ sender }}
+"""
+
+DEFAULT_INTRO = "We are sourcing the following items and would like to invite you to submit your best quotation:"
+
+
+class RFQGenerator:
+    """Fan out one RFQ to many vendors: one base draft, per-vendor rendering from templates."""
+
+    def __init__(self):
+        self._templates = None
+
+    def _compiled(self):
+        if self._templates is None:
+            env = jinja2.Environment(autoescape=False, trim_blocks=False, keep_trailing_newline=True)
+            self._templates = (env.from_string(RFQ_SUBJECT_TEMPLATE), env.from_string(RFQ_BODY_TEMPLATE))
+        return self._templates
+
+    @staticmethod
+    def _base_intro(materials: List[Dict[str, Any]], note: Optional[str]) -> str:
+        """The one LLM call of a fan-out: a short, vendor-neutral opening paragraph."""
+        items = ", ".join(m["name"] for m in materials)
+        prompt = f"""Write a 2-3 sentence professional opening paragraph for a request for quotation email.
+It goes to several vendors, so do not name any vendor and do not list the items (they follow in a list).
+Items: {items}
+{f"Context from the buyer: {note}" if note else ""}
+Return ONLY the paragraph."""
+        try:
+            intro = llm_engine.complete([{"role": "user", "content": prompt}])
+        except LLMError as e:
+            logger.warning(f"RFQ intro unavailable, using the default: {e}")
+            return DEFAULT_INTRO
+        return (intro or "").strip() or DEFAULT_INTRO
+
+    def create_drafts(
+        self,
+        materials: List[Dict[str, Any]],
+        vendors: Optional[List[Dict[str, Any]]] = None,
+        due_date: Optional[str] = None,
+        reference: Optional[str] = None,
+        note: Optional[str] = None,
+        use_llm: bool = True,
+        sender: str = "Procurement Team",
+    ) -> Dict[str, Any]:
+        """
+        Create one RFQ draft per vendor in a single call.
+        `vendors` items are {"name", "email", "contact"}; when omitted, vendors that previously
+        quoted any of the materials are taken from quote history. A vendor without an e-mail
+        address is looked up in its past quotes; if none is known, its draft is marked
+        "missing_recipient" so it cannot be approved as is.
+        """
+        start = time.perf_counter()
+        if not materials:
+            return {"error": "No materials provided for the RFQ"}
+
+        history = memory_manager.vendors_for_materials([m["name"] for m in materials])
+        if vendors is None:
+            vendors = [{"name": name} for name in sorted(history)]
+        if not vendors:
+            return {"error": "No vendors given and none found in quote history for these materials"}
+
+        emails = memory_manager.vendor_emails([v["name"] for v in vendors if not v.get("email")])
+        intro = self._base_intro(materials, note) if use_llm else DEFAULT_INTRO
+        subject_tpl, body_tpl = self._compiled()
+        subject = subject_tpl.render(materials=materials, reference=reference)
+
+        drafts = []
+        for vendor in vendors:
+            vendor = {"contact": None, "email": None, **vendor}
+            past = history.get(vendor["name"], {}).get("materials", {})
+            body = body_tpl.render(
+                vendor=vendor,
+                intro=intro,
+                materials=materials,
+                history=[{"material": k, **v} for k, v in past.items()],
+                due_date=due_date,
+                sender=sender,
+            )
+            to = vendor["email"] or emails.get(vendor["name"])
+            draft = email_service.draft_email(to, subject, body)
+            draft["vendor_name"] = vendor["name"]
+            if not to:
+                draft["status"] = "missing_recipient"
+            drafts.append(draft)
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Rendered {len(drafts)} RFQ drafts in {elapsed_ms}ms (llm={'yes' if use_llm else 'no'})")
+        missing = sum(d["status"] == "missing_recipient" for d in drafts)
+        return {"status": "success", "drafts": drafts, "count": len(drafts), "missing_recipient": missing,
+                "duration_ms": elapsed_ms}
+
+rfq_generator = RFQGenerator()
@@ -1,23 +1,32 @@
-import time
-import logging
 import asyncio
+import logging
+import os
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from app.core.config import settings
-from app.agents.procurement_agent import procurement_agent
+from app.core.events import event_bus
+from app.core.jobs import job_queue
+from app.core.manifest import processed_manifest, PARTIAL_SUFFIX
+from app.tools.computer_search import computer_tools
+
+logger = logging.getLogger(__name__)
 
 class ProcurementFolderHandler(FileSystemEventHandler):
     def __init__(self, loop):
         self.loop = loop
 
+    def on_any_event(self, event):
+        # Keep cached directory listings of the watched folders fresh
+        computer_tools.invalidate_listing(os.path.dirname(event.src_path))
+
     def on_created(self, event):
         if not event.is_directory:
-            print(f"New file detected: {event.src_path}")
-            # Run the async agent process in the main loop
-            asyncio.run_coroutine_threadsafe(
-                procurement_agent.process_new_document(event.src_path), 
-                self.loop
-            )
+            if event.src_path.endswith(PARTIAL_SUFFIX):
+                return  # upload still being written; it enqueues itself when complete
+            event_bus.publish("file_detected", file=os.path.basename(event.src_path),
+                              folder=os.path.basename(os.path.dirname(event.src_path)))
+            job_id = job_queue.enqueue(event.src_path, source="watcher")
+            logger.info(f"New file detected: {event.src_path} (job {job_id})")
 
 async def start_watcher():
     loop = asyncio.get_running_loop()
@@ -25,7 +34,6 @@ async def start_watcher():
     observer = Observer()
     
     # Watch RFQ and Inbox specifically
-    import os
     os.makedirs(settings.RFQ_DIR, exist_ok=True)
     os.makedirs(settings.INBOX_DIR, exist_ok=True)
     
@@ -33,7 +41,13 @@ async def start_watcher():
     observer.schedule(event_handler, settings.INBOX_DIR, recursive=False)
     
     observer.start()
-    print(f"Watcher started on {settings.RFQ_DIR} and {settings.INBOX_DIR}")
+    logger.info(f"Watcher started on {settings.RFQ_DIR} and {settings.INBOX_DIR}")
+
+    # Files that arrived while we were stopped; anything created from now on is seen by the observer
+    try:
+        await asyncio.to_thread(processed_manifest.reconcile)
+    except Exception as e:
+        logger.error(f"Startup reconciliation failed: {e}")
     try:
         while True:
             await asyncio.sleep(1)
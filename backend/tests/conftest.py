@@ -0,0 +1,11 @@
+"""
+Every test runs against a throwaway workspace: settings read WORKSPACE_ROOT at import, so it
+is set here, before any test module imports the app.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ["WORKSPACE_ROOT"] = tempfile.mkdtemp(prefix="purchase-agent-tests-")
+sys.path.insert(0, BACKEND)
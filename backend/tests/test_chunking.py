@@ -0,0 +1,47 @@
+"""Map-reduce extraction helpers: chunk overlap and merging partial results."""
+from app.core.llm import merge_extractions, split_into_chunks, with_overlap
+
+BOLT = {"material": "Hex bolt M12", "qty": 100, "unit_price": 4.5}
+NUT = {"material": "Hex nut M12", "qty": 100, "unit_price": 1.2}
+WASHER = {"material": "Washer M12", "qty": 200, "unit_price": 0.4}
+
+
+def test_row_in_overlap_is_kept_once():
+    # Chunk 2 repeats chunk 1's last line, so both read the nut row
+    merged = merge_extractions([{"items": [BOLT, NUT]}, {"items": [NUT, WASHER]}], overlaps=[0, 1])
+    assert merged["items"] == [BOLT, NUT, WASHER]
+
+
+def test_identical_lines_across_a_page_break_are_kept():
+    # Same item for two delivery sites, one on each side of the split; only one row was repeated
+    merged = merge_extractions([{"items": [BOLT, NUT]}, {"items": [NUT, NUT, WASHER]}], overlaps=[0, 1])
+    assert merged["items"] == [BOLT, NUT, NUT, WASHER]
+
+
+def test_nothing_dropped_without_overlap():
+    merged = merge_extractions([{"items": [BOLT]}, {"items": [BOLT]}])
+    assert merged["items"] == [BOLT, BOLT]
+
+
+def test_failed_chunk_breaks_the_seam():
+    merged = merge_extractions([{"items": [BOLT]}, {"error": "parse"}, {"items": [BOLT]}], overlaps=[0, 1, 1])
+    assert merged["items"] == [BOLT, BOLT]
+
+
+def test_scalars_first_value_and_last_total():
+    merged = merge_extractions([{"vendor_name": "Acme", "total": None}, {"vendor_name": "Other", "total": 980}],
+                               overlaps=[0, 1])
+    assert merged == {"vendor_name": "Acme", "total": 980}
+
+
+def test_long_table_splits_at_line_ends_and_overlaps():
+    rows = [f"{n:03d} Hex bolt M12 x {n}mm   qty 100   4.50   450.00" for n in range(200)]
+    chunks = split_into_chunks("\n".join(rows), 1500)
+    assert len(chunks) > 1
+    lines = {line for chunk in chunks for line in chunk.splitlines() if line.strip()}
+    assert lines == set(rows)  # no row was cut in two
+    parts = with_overlap(chunks, 2)
+    assert parts[0] == (chunks[0], 0)
+    for (previous, _), (chunk, repeated) in zip(parts, parts[1:]):
+        assert repeated == 2
+        assert chunk.splitlines()[:2] == [l for l in previous.splitlines() if l.strip()][-2:]
@@ -0,0 +1,49 @@
+"""
+Near-duplicate detection: the same quote arriving as a PDF, an e-mail print-out and an OCR
+scan is one document; a revision with changed prices is not.
+"""
+from app.core.dedupe import dedupe_index, numbers_of
+
+QUOTE = """Quotation QT-{ref}
+Steel plate 10mm  qty 25  unit 6,960.00  total 174,000.00
+Flange DN50  qty 40  unit 1,150.00  total 46,000.00
+Sub total 220,000.00  GST 18% 39,600.00  Grand total 259,600.00
+Delivery 4 weeks ex-works, payment 30 days, validity 15 days."""
+
+
+def _register(text: str, path: str) -> dict:
+    return dedupe_index.check_and_register(text, path)
+
+
+def test_email_print_is_a_duplicate():
+    pdf = QUOTE.format(ref="4512")
+    printed = (
+        "From: sales@acme.example\nSent: Tue 12 Mar 2024 10:45\nTo: purchase@plant.example\n"
+        f"Subject: RE: RFQ 4512\n\n{pdf}\n\nPage 1 of 1"
+    )
+    original = _register(pdf, "/inbox/qt4512.pdf")
+    copy = _register(printed, "/inbox/qt4512-mail.pdf")
+    assert original["duplicate"] is None
+    assert copy["duplicate"]["doc_id"] == original["doc_id"]
+
+
+def test_ocr_copy_is_a_duplicate():
+    pdf = QUOTE.format(ref="4513")
+    scan = pdf.replace("174,000.00", "174O00.00").replace("Flange", "F1ange")
+    assert numbers_of(scan) == numbers_of(pdf)
+    original = _register(pdf, "/inbox/qt4513.pdf")
+    copy = _register(scan, "/inbox/qt4513-scan.pdf")
+    assert copy["duplicate"]["doc_id"] == original["doc_id"]
+
+
+def test_revised_prices_are_not_a_duplicate():
+    pdf = QUOTE.format(ref="4514")
+    revised = pdf.replace("6,960.00", "6,800.00").replace("174,000.00", "170,000.00")
+    _register(pdf, "/inbox/qt4514.pdf")
+    assert _register(revised, "/inbox/qt4514-r1.pdf")["duplicate"] is None
+
+
+def test_retry_of_same_path_is_not_its_own_duplicate():
+    pdf = QUOTE.format(ref="4515")
+    _register(pdf, "/inbox/qt4515.pdf")
+    assert _register(pdf, "/inbox/qt4515.pdf")["duplicate"] is None
@@ -0,0 +1,63 @@
+"""
+/chat intent routing: word-bounded rules, slots, and a fallback model that learns only from
+seeds, rule routes and user labels, never from its own guesses.
+"""
+import json
+import time
+
+import pytest
+
+from app.agents.intent_router import IntentRouter
+from app.core.memory import memory_manager
+
+
+@pytest.fixture
+def router():
+    return IntentRouter()
+
+
+def _log(query: str, intents, source: str):
+    with memory_manager.write_lock:
+        memory_manager.sqlite_conn.execute(
+            "INSERT INTO routing_log (query, intents, scores, slots, source, duration_us, created_at) VALUES (?, ?, '{}', '{}', ?, 0, ?)",
+            (query, json.dumps(intents), source, time.time()),
+        )
+        memory_manager.sqlite_conn.commit()
+
+
+def test_rule_route_with_slots(router):
+    route = router.route("find the acme quotation on my desktop")
+    assert route["intents"] == ["search"]
+    assert route["source"] == "rules"
+    assert route["slots"]["root"] == "desktop"
+    assert route["slots"]["terms"] == "acme quotation"
+
+
+def test_words_inside_words_do_not_trigger(router):
+    assert router.route("book a table for the team lunch")["intents"] == []
+
+
+def test_confirm_needs_a_pending_plan(router):
+    assert router.route("yes")["intents"] == []
+    assert router.route("yes", {"pending_organize_plan": "p1"})["intents"] == ["confirm"]
+
+
+def test_model_guesses_are_not_training_data():
+    _log("zorblat quibbit frumious", ["move"], "model")
+    _log("snarkle vorpal tumtum", [], "none")
+    vocab = IntentRouter().model.vocab
+    assert "zorblat" not in vocab
+    assert "snarkle" not in vocab
+
+
+def test_labels_are_learned(router):
+    log_id = router.route("bandersnatch jubjub outgrabe slithy")["log_id"]
+    assert router.label(log_id, "read")
+    assert IntentRouter().model.counts["read"]["bandersnatch"] == 1
+
+
+def test_unknown_label_is_rejected(router):
+    log_id = router.route("mimsy borogove")["log_id"]
+    with pytest.raises(ValueError):
+        router.label(log_id, "confirm")
+    assert not router.label(10 ** 9, "read")
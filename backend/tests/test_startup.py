@@ -0,0 +1,49 @@
+"""
+Startup budget: importing the app (what uvicorn does before the port opens) must stay
+cheap. Heavy subsystems are LazySingletons / lazy_import stand-ins, built on first use or
+by the background warm-up, never at import.
+
+Each check runs in a fresh interpreter so modules cached by other tests do not hide
+a slow import. STARTUP_BUDGET_SECONDS overrides the budget on slow machines.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", "3.0"))
+HEAVY_MODULES = ("chromadb", "pandas", "pyarrow", "numpy", "openai", "docx", "openpyxl", "PyPDF2", "pytesseract")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+from app.core.lazy import readiness
+print(json.dumps({
+    "seconds": elapsed,
+    "heavy": [m for m in %r if m in sys.modules],
+    "built": [name for name, status in readiness().items() if status["ready"]],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe() -> dict:
+    env = {**os.environ, "WORKSPACE_ROOT": tempfile.mkdtemp(), "PYTHONPATH": BACKEND}
+    out = subprocess.run([sys.executable, "-c", _PROBE], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, timeout=120, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_within_budget():
+    # Best of three, so one cold disk cache does not fail the suite
+    seconds = min(_probe()["seconds"] for _ in range(3))
+    assert seconds < BUDGET_SECONDS, f"importing app.main took {seconds:.2f}s (budget {BUDGET_SECONDS}s)"
+
+
+def test_import_defers_heavy_subsystems():
+    probe = _probe()
+    assert probe["heavy"] == [], f"imported at startup: {probe['heavy']}"
+    assert probe["built"] == [], f"singletons built at import: {probe['built']}"
@@ -0,0 +1,86 @@
+"""
+Vendor aggregates: what store_quote maintains incrementally must equal what
+rebuild_vendor_aggregates recomputes from quotes and quote_items.
+"""
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.core.memory import memory_manager, parse_number
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    manager = memory_manager._lazy_get()
+    # The vector index is not under test; embedding would need the model download
+    monkeypatch.setattr(manager, "collection", MagicMock())
+    return manager
+
+
+def _snapshot(memory, vendor: str):
+    conn = memory.sqlite_conn
+    stats = conn.execute(
+        "SELECT * FROM vendor_material_stats WHERE vendor_name = ? COLLATE NOCASE ORDER BY material, currency", (vendor,)
+    ).fetchall()
+    performance = conn.execute("SELECT * FROM vendor_performance WHERE vendor_name = ? COLLATE NOCASE", (vendor,)).fetchall()
+    return stats, performance
+
+
+def _stats(memory, vendor: str):
+    return {(material.lower(), currency): (line_count, avg_price) for material, currency, line_count, avg_price in memory.sqlite_conn.execute(
+        "SELECT material, currency, line_count, avg_price FROM vendor_material_stats WHERE vendor_name = ? COLLATE NOCASE", (vendor,)
+    )}
+
+
+def test_incremental_matches_rebuild(memory):
+    memory.store_quote({"vendor_name": "Kestrel Forge", "currency": "INR", "date": "2024-03-01", "delivery_weeks": 4,
+                        "items": [{"material": "Gate valve", "unit_price": 1450}, {"material": "Gasket", "unit_price": 30}]})
+    memory.store_quote({"vendor_name": "KESTREL FORGE", "currency": "INR", "date": "2024-04-01", "delivery_weeks": 6,
+                        "items": [{"material": "gate valve", "unit_price": 1350}]})
+    memory.store_quote({"vendor_name": "Osprey Steel", "currency": "INR", "date": "2024-02-01",
+                        "items": [{"material": "Gate Valve", "unit_price": 1600}]})
+    incremental = _snapshot(memory, "kestrel forge"), _snapshot(memory, "osprey steel")
+    memory.rebuild_vendor_aggregates()
+    assert (_snapshot(memory, "kestrel forge"), _snapshot(memory, "osprey steel")) == incremental
+
+
+def test_case_variants_share_a_row(memory):
+    memory.store_quote({"vendor_name": "Heron Pumps", "currency": "USD", "date": "2024-01-10",
+                        "items": [{"material": "Impeller", "unit_price": 200}]})
+    memory.store_quote({"vendor_name": "heron pumps", "currency": "usd", "date": "2024-01-20",
+                        "items": [{"material": "IMPELLER", "unit_price": 100}]})
+    performance = memory.sqlite_conn.execute(
+        "SELECT quote_count FROM vendor_performance WHERE vendor_name = 'HERON PUMPS'"
+    ).fetchall()
+    assert performance == [(2,)]
+    assert _stats(memory, "heron pumps") == {("impeller", "USD"): (2, 150.0)}
+
+
+def test_prices_are_averaged_per_currency(memory):
+    memory.store_quote({"vendor_name": "Plover Tools", "currency": "INR", "date": "2024-05-01",
+                        "items": [{"material": "Drill bit", "unit_price": 800}]})
+    memory.store_quote({"vendor_name": "Plover Tools", "currency": "USD", "date": "2024-05-02",
+                        "items": [{"material": "Drill bit", "unit_price": 10}]})
+    memory.store_quote({"vendor_name": "Plover Tools", "date": "2024-05-03",
+                        "items": [{"material": "Drill bit", "unit_price": 9}]})
+    assert _stats(memory, "plover tools") == {
+        ("drill bit", "INR"): (1, 800.0), ("drill bit", "USD"): (1, 10.0), ("drill bit", ""): (1, 9.0),
+    }
+
+
+def test_numeric_strings_are_aggregated(memory):
+    memory.store_quote({"vendor_name": "Wren Castings", "currency": "INR", "date": "2024-06-01", "delivery_weeks": "4 weeks",
+                        "items": [{"material": "Manhole cover", "qty": "12", "unit_price": "1,450.00"}]})
+    assert _stats(memory, "wren castings") == {("manhole cover", "INR"): (1, 1450.0)}
+    weeks = memory.sqlite_conn.execute(
+        "SELECT avg_delivery_weeks FROM vendor_performance WHERE vendor_name = 'Wren Castings'"
+    ).fetchone()
+    assert weeks == (4.0,)
+
+
+def test_parse_number():
+    assert parse_number("1,450.00") == 1450.0
+    assert parse_number("Rs. 4") == 4.0
+    assert parse_number(7) == 7.0
+    assert parse_number("n/a") is None
+    assert parse_number(True) is None
@@ -9,6 +9,9 @@ import {
 } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
+// Give up waiting on an upload's job after this long; it keeps running server-side
+const JOB_WAIT_TIMEOUT_MS = 10 * 60 * 1000;
+
 const mdComponents = {
     p: ({ children }) => <p className="mb-3 last:mb-0 leading-relaxed">{children}</p>,
     strong: ({ children }) => <strong className="font-bold text-slate-900">{children}</strong>,
@@ -79,29 +82,73 @@ I'm your **universal operations assistant** with full, autonomous access to your
     const [loading, setLoading] = useState(false);
     const [duration, setDuration] = useState(0);
     const [isUploading, setIsUploading] = useState(false);
+    const [ingesting, setIngesting] = useState({});
     const timerRef = useRef(null);
     const fileInputRef = useRef(null);
     const chatEndRef = useRef(null);
     const textareaRef = useRef(null);
     const abortControllerRef = useRef(null);
+    const jobFilesRef = useRef({});
+    const jobWaitersRef = useRef({});
+    const sessionIdRef = useRef(null);
 
     useEffect(() => { chatEndRef.current?.scrollIntoView({ behavior: "smooth" }); }, [messages]);
+    // Initial state, then live deltas from the backend: ingestion progress, new quotes and
+    // learned facts. The stream starts at the event id the fetches were read at, so nothing
+    // stored in between is missed; EventSource then resumes from the last id it saw.
     useEffect(() => {
-        fetchQuotes();
-        fetchLearnedFacts();
+        let source = null;
+        let closed = false;
+        Promise.all([fetchQuotes(), fetchLearnedFacts()]).then(eventIds => {
+            if (closed) return;
+            const known = eventIds.filter(id => id !== null);
+            source = new EventSource(`${apiUrl}/events${known.length ? `?since_id=${Math.min(...known)}` : ''}`);
+            subscribe(source);
+        });
+        return () => { closed = true; if (source) source.close(); };
     }, [apiUrl]);
 
+    const subscribe = (source) => {
+        const on = (type, handler) => source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+
+        on('quote', (quote) => setQuotes(prev => prev.some(q => q.id === quote.id) ? prev : [quote, ...prev]));
+        on('quotes_removed', ({ ids }) => setQuotes(prev => prev.filter(q => !ids.includes(q.id))));
+        on('fact', ({ fact }) => setLearnedFacts(prev => prev.includes(fact) ? prev : [fact, ...prev].slice(0, 15)));
+        on('ingest', ({ file, stage, doc_type }) => setIngesting(prev => ({ ...prev, [file]: doc_type ? `${stage}: ${doc_type}` : stage })));
+        on('job', (job) => {
+            if (job.file) jobFilesRef.current[job.id] = job.file;
+            const file = jobFilesRef.current[job.id];
+            if (job.state === 'running' && file) setIngesting(prev => ({ ...prev, [file]: 'started' }));
+            if (job.state !== 'done' && job.state !== 'failed') return;
+            if (file) setIngesting(prev => { const next = { ...prev }; delete next[file]; return next; });
+            const waiter = jobWaitersRef.current[job.id];
+            if (waiter) {
+                waiter();
+            } else if (job.state === 'done' && file) {
+                // Picked up by the folder watcher rather than uploaded here
+                setMessages(prev => [...prev, {
+                    role: 'assistant',
+                    content: `📥 Processed **${file}** from a watched folder in the background${job.doc_type ? ` (${job.doc_type})` : ''}.`
+                }]);
+            }
+        });
+    };
+
+    // Both return the event id the data was read at (null on error)
+    const eventIdOf = (res) => (res.headers['x-event-id'] !== undefined ? Number(res.headers['x-event-id']) : null);
+
     const fetchQuotes = async () => {
-        try { const res = await axios.get(`${apiUrl}/quotes`); setQuotes(res.data); }
-        catch (err) { console.error("Fetch error:", err); }
+        try { const res = await axios.get(`${apiUrl}/quotes`); setQuotes(res.data); return eventIdOf(res); }
+        catch (err) { console.error("Fetch error:", err); return null; }
     };
 
     const fetchLearnedFacts = async () => {
         try {
             const res = await axios.get(`${apiUrl}/knowledge`);
             setLearnedFacts(res.data.facts || []);
+            return eventIdOf(res);
         }
-        catch (err) { console.error("Fetch knowledge error:", err); }
+        catch (err) { console.error("Fetch knowledge error:", err); return null; }
     };
 
     const lastMessageRef = useRef('');
@@ -142,19 +189,19 @@ I'm your **universal operations assistant** with full, autonomous access to your
         abortControllerRef.current = new AbortController();
 
         try {
+            // The conversation lives on the server; only the new message is sent
             const res = await axios.post(`${apiUrl}/chat`, {
                 query: currentInput,
-                history: messages.map(m => ({ role: m.role, content: m.content }))
+                session_id: sessionIdRef.current
             }, {
                 signal: abortControllerRef.current.signal
             });
+            sessionIdRef.current = res.data.session_id || sessionIdRef.current;
             setMessages(prev => [...prev, {
                 role: 'assistant',
                 content: res.data.reply,
                 duration: res.data.duration
             }]);
-            fetchQuotes();
-            fetchLearnedFacts();
         } catch (err) {
             if (axios.isCancel(err)) {
                 console.log("Request canceled");
@@ -171,6 +218,25 @@ I'm your **universal operations assistant** with full, autonomous access to your
         }
     };
 
+    // Uploads are processed in the background; the job event wakes us, with a slow poll as fallback
+    const waitForJob = async (jobId) => {
+        const deadline = Date.now() + JOB_WAIT_TIMEOUT_MS;
+        try {
+            while (true) {
+                const res = await axios.get(`${apiUrl}/jobs/${jobId}`);
+                if (res.data.error) throw new Error(res.data.error);
+                if (res.data.state === 'done' || res.data.state === 'failed') return res.data;
+                if (Date.now() > deadline) throw new Error(`Still processing after ${JOB_WAIT_TIMEOUT_MS / 60000} minutes (job ${jobId}); it will appear on the dashboard when done`);
+                await new Promise(resolve => {
+                    jobWaitersRef.current[jobId] = resolve;
+                    setTimeout(resolve, 5000);
+                });
+            }
+        } finally {
+            delete jobWaitersRef.current[jobId];
+        }
+    };
+
     const handleFileUpload = async (event) => {
         const file = event.target.files[0];
         if (!file) return;
@@ -182,7 +248,9 @@ I'm your **universal operations assistant** with full, autonomous access to your
 
         try {
             const res = await axios.post(`${apiUrl}/upload`, formData);
-            const analysis = res.data.analysis || {};
+            const job = await waitForJob(res.data.job_id);
+            if (job.state === 'failed') throw new Error(job.error || 'Processing failed');
+            const analysis = job.result || {};
             setMessages(prev => [...prev, {
                 role: 'assistant',
                 content: `## ✅ File Processed: ${file.name}
@@ -191,7 +259,6 @@ I'm your **universal operations assistant** with full, autonomous access to your
 
 ${analysis.summary || 'Document has been analyzed and indexed in your local memory.'}`
             }]);
-            fetchQuotes();
         } catch (err) {
             setMessages(prev => [...prev, {
                 role: 'assistant',
@@ -396,6 +463,11 @@ ${analysis.summary || 'Document has been analyzed and indexed in your local memo
                                     <span className="w-1.5 h-1.5 bg-emerald-500 rounded-full animate-pulse"></span>
                                     <p className="text-[10px] text-slate-400 uppercase tracking-widest font-semibold">Memory Active • {quotes.length} Records</p>
                                 </div>
+                                {Object.entries(ingesting).map(([file, stage]) => (
+                                    <p key={file} className="text-[10px] text-indigo-500 mt-1 flex items-center gap-1">
+                                        <Loader2 size={10} className="animate-spin" /> {file} — {stage}
+                                    </p>
+                                ))}
                             </div>
                             <button onClick={() => setIsDashboardOpen(false)} className="p-2 hover:bg-white rounded-xl text-slate-400 transition-all">
                                 <X size={18} />
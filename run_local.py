@@ -8,6 +8,19 @@ def run_command(command):
     print(f"Executing: {command}")
     return subprocess.run(command, shell=True)
 
+def chroma_host():
+    """CHROMA_HOST from the environment or the backend's .env file."""
+    if os.environ.get("CHROMA_HOST"):
+        return os.environ["CHROMA_HOST"]
+    for env_file in ("backend/.env", ".env"):
+        if os.path.exists(env_file):
+            with open(env_file) as f:
+                for line in f:
+                    key, _, value = line.strip().partition("=")
+                    if key.strip() == "CHROMA_HOST" and value.strip():
+                        return value.strip().strip('"\'')
+    return ""
+
 def main():
     print("🚀 Starting OmniMind Universal Engine...")
     
@@ -29,8 +42,16 @@ def main():
     print("Starting Backend on http://localhost:8000 ...")
     
     # We use a subprocess for the backend so we can continue in this script
+    # WORKERS > 1 runs several API processes; one of them is elected to watch folders.
+    # Jobs, events, sessions, the email outbox and the LLM rate limit are shared through
+    # SQLite; LLM_MAX_IN_FLIGHT and the OCR pool are per process. The vector store is only
+    # shared through a Chroma server (CHROMA_HOST): the embedded one is single-process.
+    workers = os.environ.get("WORKERS", "1")
+    if int(workers) > 1 and not chroma_host():
+        print("⚠️ WORKERS > 1 needs CHROMA_HOST (a Chroma server); starting a single worker.")
+        workers = "1"
     backend_proc = subprocess.Popen(
-        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"],
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000", "--workers", workers],
         cwd="backend"
     )
     